@@ -0,0 +1,181 @@
+"""
+Recall@1 and latency of the ANN identification indexes against exact search.
+
+Synthetic galleries mimic enrolled faces: identities are random points on
+the 512-d unit sphere and each template is its identity plus noise, so
+nearest neighbours are as crowded as in a real gallery. Queries are fresh
+noisy samples of enrolled identities. For every gallery size, each index
+configuration is built, saved, reopened (memory-mapped for IVF) and
+queried one probe at a time. Recall@1 is the fraction of queries whose top
+result is the exact nearest template. The exact baseline is a full
+GalleryIndex-style matrix scan.
+
+A 1M gallery needs about 2 GB per float32 copy; use --dtype float16 to
+halve the index's share.
+
+Usage:
+    python benchmarks/ann_benchmark.py --sizes 10000 100000 1000000 --output ann.json
+    python benchmarks/ann_benchmark.py --sizes 100000 --kinds ivf --nprobe 8 16 32 64
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+
+from reasoning.ann_index import create_ann_index, load_ann_index
+from reasoning.gallery_index import GalleryIndex
+
+
+def synthetic_gallery(size, dim, templates_per_identity, noise, rng, chunk_size=100000):
+    identities = GalleryIndex.normalize(rng.standard_normal((max(1, size // templates_per_identity), dim)))
+    owners = np.arange(size) % len(identities)
+    vectors = np.empty((size, dim), dtype=np.float32)
+    for start in range(0, size, chunk_size):
+        chunk = owners[start:start + chunk_size]
+        vectors[start:start + len(chunk)] = GalleryIndex.normalize(
+            identities[chunk] + noise * rng.standard_normal((len(chunk), dim)).astype(np.float32))
+    return vectors, owners, identities
+
+
+def exact_top1(vectors, queries, chunk_size=100000):
+    best_rows = np.zeros(len(queries), dtype=np.int64)
+    best_scores = np.full(len(queries), -np.inf, dtype=np.float32)
+    for start in range(0, len(vectors), chunk_size):
+        scores = queries @ vectors[start:start + chunk_size].T
+        rows = np.argmax(scores, axis=1)
+        chunk_best = scores[np.arange(len(queries)), rows]
+        better = chunk_best > best_scores
+        best_rows[better] = rows[better] + start
+        best_scores[better] = chunk_best[better]
+    return best_rows
+
+
+def latency_summary(seconds):
+    seconds = np.asarray(seconds) * 1000
+    return {"mean_ms": float(seconds.mean()), "p50_ms": float(np.percentile(seconds, 50)),
+            "p99_ms": float(np.percentile(seconds, 99)), "max_ms": float(seconds.max())}
+
+
+def time_queries(search, queries):
+    timings, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        timings.append(time.perf_counter() - start)
+    return timings, results
+
+
+def configurations(args):
+    for kind in args.kinds:
+        if kind == "ivf":
+            yield "ivf", {"nlist": args.nlist, "dtype": args.dtype}, "nprobe", args.nprobe
+        elif kind == "hnsw":
+            try:
+                import hnswlib  # noqa: F401
+            except ImportError:
+                print("Skipping hnsw: hnswlib is not installed", file=sys.stderr)
+                continue
+            yield "hnsw", {"M": args.M, "ef_construction": args.ef_construction}, "ef_search", args.ef
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ANN identification indexes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--exact-queries", type=int, default=200, help="Queries timed with exact search")
+    parser.add_argument("--templates-per-identity", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.05, help="Per-dimension noise around each identity")
+    parser.add_argument("--kinds", nargs="+", choices=["ivf", "hnsw"], default=["ivf", "hnsw"])
+    parser.add_argument("--nlist", type=int, help="IVF lists (default about 4 * sqrt(n))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32, 64])
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--M", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef", type=int, nargs="+", default=[16, 32, 64, 128, 256])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "dim": args.dim,
+        "queries": args.queries,
+        "sizes": {},
+    }
+
+    for size in args.sizes:
+        print(f"Generating {size} synthetic templates...", file=sys.stderr)
+        vectors, owners, identities = synthetic_gallery(size, args.dim, args.templates_per_identity,
+                                                        args.noise, rng)
+        probe_owners = owners[rng.choice(size, args.queries)]
+        queries = GalleryIndex.normalize(
+            identities[probe_owners] + args.noise * rng.standard_normal((args.queries, args.dim)).astype(np.float32))
+        truth = exact_top1(vectors, queries)
+
+        timings, _ = time_queries(lambda query: int(np.argmax(vectors @ query)), queries[:args.exact_queries])
+        entry = {"exact": latency_summary(timings), "indexes": []}
+        embedding_ids = [str(row) for row in range(size)]
+
+        for kind, options, knob, values in configurations(args):
+            # Train IVF once on the whole gallery instead of growing it step by step
+            sizing = {"min_train_size": size + 1} if kind == "ivf" else {"initial_capacity": size}
+            index = create_ann_index(kind, dim=args.dim, **options, **sizing)
+            start = time.perf_counter()
+            for chunk_start in range(0, size, 50000):
+                chunk = slice(chunk_start, chunk_start + 50000)
+                index.add(owners[chunk], embedding_ids[chunk], vectors[chunk])
+            index.build()
+            build_seconds = time.perf_counter() - start
+
+            directory = tempfile.mkdtemp(prefix=f"ann_{kind}_")
+            try:
+                start = time.perf_counter()
+                index.save(directory)
+                save_seconds = time.perf_counter() - start
+                del index
+                start = time.perf_counter()
+                index = load_ann_index(directory)
+                load_seconds = time.perf_counter() - start
+
+                for value in values:
+                    setattr(index, knob, value)
+                    timings, found = time_queries(lambda query: index.identify(query, 1), queries)
+                    hits = sum(1 for result, expected in zip(found, truth)
+                               if result and result[0][1] == embedding_ids[expected])
+                    entry["indexes"].append(dict(
+                        {"kind": kind, knob: value, "recall_at_1": hits / len(queries),
+                         "build_seconds": build_seconds, "save_seconds": save_seconds,
+                         "load_seconds": load_seconds},
+                        **latency_summary(timings)))
+                    print(f"{size} {kind} {knob}={value}: recall@1 {hits / len(queries):.3f}, "
+                          f"p99 {entry['indexes'][-1]['p99_ms']:.2f} ms", file=sys.stderr)
+                del index
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+
+        results["sizes"][str(size)] = entry
+        del vectors
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
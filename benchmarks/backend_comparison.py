@@ -0,0 +1,188 @@
+"""
+Accuracy versus latency of the FaceNet inference backends on a fixed image set.
+
+Every image is face-cropped once, then embedded by each backend
+configuration. Accuracy is reported against the first configuration run
+(float32 torch by default): cosine similarity of each embedding to the
+reference one, and whether each image still finds the same nearest
+neighbour (1:N agreement) and the same match decisions at the verification
+threshold for every image pair.
+
+Images are taken from one folder per person (data/<name>/*.jpg) or from a
+flat folder of files.
+
+Usage:
+    python benchmarks/backend_comparison.py data --threads 2 --output backends.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+CONFIGURATIONS = [
+    ("torch-fp32", "torch", {}),
+    ("torch-fp32-channels-last", "torch", {"channels_last": True}),
+    ("torch-int8", "torch", {"quantize": True}),
+    ("onnx-fp32", "onnx", {}),
+    ("onnx-int8", "onnx", {"quantize": True}),
+]
+
+
+def list_images(root, limit=None):
+    paths = []
+    for directory, _, files in sorted(os.walk(root)):
+        paths.extend(
+            os.path.join(directory, name) for name in sorted(files)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+    return paths[:limit] if limit else paths
+
+
+def load_faces(paths):
+    from reasoning.face_recognition_model import load_face_image
+
+    faces, kept = [], []
+    for path in paths:
+        try:
+            faces.append(load_face_image(path))
+            kept.append(path)
+        except Exception as e:
+            print(f"Skipping {path}: {e}", file=sys.stderr)
+    return (np.stack(faces) if faces else np.empty((0, 160, 160, 3), dtype=np.uint8)), kept
+
+
+def normalize(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def time_backend(backend, faces, batch_size, rounds):
+    """Per-image latency (batch of 1) and batched throughput, after one warm-up pass."""
+    backend(faces[:1])
+    single = []
+    for _ in range(rounds):
+        for face in faces:
+            start = time.perf_counter()
+            backend(face[np.newaxis])
+            single.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for offset in range(0, len(faces), batch_size):
+            backend(faces[offset:offset + batch_size])
+    batched_seconds = time.perf_counter() - start
+
+    single_ms = np.array(single) * 1000
+    return {
+        "single_mean_ms": float(single_ms.mean()),
+        "single_p50_ms": float(np.percentile(single_ms, 50)),
+        "single_p95_ms": float(np.percentile(single_ms, 95)),
+        "batched_images_per_second": rounds * len(faces) / batched_seconds,
+    }
+
+
+def embed_all(backend, faces, batch_size):
+    return normalize(np.concatenate([
+        backend(faces[offset:offset + batch_size]) for offset in range(0, len(faces), batch_size)
+    ]))
+
+
+def compare(reference, candidate, threshold):
+    """Agreement of a backend's embeddings with the reference embeddings."""
+    cosine = np.sum(reference * candidate, axis=1)
+
+    def nearest(embeddings):
+        scores = embeddings @ embeddings.T
+        np.fill_diagonal(scores, -np.inf)
+        return scores.argmax(axis=1), scores
+
+    reference_nn, reference_scores = nearest(reference)
+    candidate_nn, candidate_scores = nearest(candidate)
+    pairs = np.triu_indices(len(reference), k=1)
+    return {
+        "cosine_to_reference_mean": float(cosine.mean()),
+        "cosine_to_reference_min": float(cosine.min()),
+        "nearest_neighbour_agreement": float((reference_nn == candidate_nn).mean()),
+        "pair_decision_agreement": float((
+            (reference_scores[pairs] >= threshold) == (candidate_scores[pairs] >= threshold)
+        ).mean()) if len(pairs[0]) else None,
+        "pair_score_max_abs_diff": float(
+            np.abs(reference_scores[pairs] - candidate_scores[pairs]).max()
+        ) if len(pairs[0]) else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FaceNet inference backends")
+    parser.add_argument("images", help="Folder of face images (searched recursively)")
+    parser.add_argument("--limit", type=int, help="Use at most this many images")
+    parser.add_argument("--threads", type=int, help="Intra-op threads for every backend")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=3, help="Timing passes over the image set")
+    parser.add_argument("--threshold", type=float, default=0.6, help="Verification threshold")
+    parser.add_argument("--onnx-path", default="facenet.onnx", help="ONNX graph (exported if missing)")
+    parser.add_argument("--only", nargs="+", help="Run only these configurations")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    from reasoning.inference_backend import create_backend
+
+    faces, paths = load_faces(list_images(args.images, args.limit))
+    if len(faces) < 2:
+        parser.error("Need at least two images with a detectable face")
+
+    configurations = [c for c in CONFIGURATIONS if not args.only or c[0] in args.only]
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "images": len(paths),
+        "threads": args.threads,
+        "batch_size": args.batch_size,
+        "threshold": args.threshold,
+        "backends": [],
+    }
+
+    reference = None
+    for label, name, options in configurations:
+        print(f"Running {label}...", file=sys.stderr)
+        options = dict(options, num_threads=args.threads)
+        if name == "onnx":
+            options["onnx_path"] = args.onnx_path
+        try:
+            start = time.perf_counter()
+            backend = create_backend(name, **options)
+            load_seconds = time.perf_counter() - start
+        except Exception as e:
+            results["backends"].append({"name": label, "error": str(e)})
+            continue
+
+        embeddings = embed_all(backend, faces, args.batch_size)
+        if reference is None:
+            reference = embeddings
+
+        entry = {"name": label, "load_seconds": load_seconds}
+        entry.update(backend.describe())
+        entry.update(time_backend(backend, faces, args.batch_size, args.rounds))
+        entry.update(compare(reference, embeddings, args.threshold))
+        results["backends"].append(entry)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
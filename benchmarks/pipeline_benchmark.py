@@ -0,0 +1,245 @@
+"""
+Offline benchmark of the full verification pipeline on simulated hardware.
+
+Recorded RFID lines and face images are replayed through a stand-in camera and
+serial reader (in memory or over a pseudo-terminal) into the real
+AccessControlSystem -> AccessControl -> embedding -> gallery path, once per
+gallery size. Galleries are built from the enrolled users in the replay file
+and padded with synthetic templates.
+
+The replay file is JSON:
+
+    {"users": [{"name": "anas", "card_uid": "F1 11 8A 3F", "images": ["data/anas/1.jpg"]}],
+     "swipes": [{"line": "Card UID: F1 11 8A 3F | Card recognized",
+                 "image": "data/anas_cam/face_20241226-184453.jpg"}]}
+
+Usage:
+    python benchmarks/pipeline_benchmark.py replay.json --gallery-sizes 10 1000 100000 \\
+        --output pipeline_results.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from threading import Event
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_GALLERY_SIZES = [10, 100, 1000, 10000, 100000]
+
+
+def current_rss_mb():
+    """Resident set size of this process in MiB (Linux)."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def build_gallery(db_path, chroma_dir, users, gallery_size, batch_size=5000, seed=0):
+    """Enroll the replay users, then pad the gallery with random unit vectors."""
+    import numpy as np
+    from reasoning.database import EnhancedDatabaseManager
+
+    manager = EnhancedDatabaseManager(sqlite_db_path=db_path, chroma_dir=chroma_dir)
+    try:
+        for user in users:
+            manager.add_user(user["name"], user["card_uid"], user["images"])
+
+        manager.cursor.execute("SELECT COUNT(*) FROM face_embeddings")
+        enrolled = manager.cursor.fetchone()[0]
+        rng = np.random.default_rng(seed)
+
+        for start in range(enrolled, gallery_size, batch_size):
+            count = min(batch_size, gallery_size - start)
+            vectors = rng.standard_normal((count, 512)).astype(np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            ids = [f"synthetic-{start + i}" for i in range(count)]
+
+            rows = []
+            for i, embedding_id in enumerate(ids):
+                manager.cursor.execute(
+                    "INSERT INTO users (name, card_uid, face_embedding_id) VALUES (?, ?, ?)",
+                    (f"synthetic-{start + i}", f"SYN {start + i:08X}", embedding_id)
+                )
+                rows.append((manager.cursor.lastrowid, embedding_id, "synthetic"))
+            manager.cursor.executemany(
+                "INSERT INTO face_embeddings (user_id, face_embedding_id, image_path) VALUES (?, ?, ?)",
+                rows
+            )
+            manager.store_face_vectors(
+                ids, vectors, ["synthetic"] * count,
+                [{"name": f"synthetic-{start + i}"} for i in range(count)]
+            )
+            manager.conn.commit()
+        return max(enrolled, gallery_size)
+    finally:
+        manager.close()
+
+
+def run_gallery_size(args, replay, frames, gallery_size, workdir):
+    from reasoning.thread_safe_access_control import AccessControlSystem
+    from reasoning.tracing import get_registry
+    from simulated_hardware import ReplayCamera, MemoryRFIDLogger, PtyRFIDLogger
+
+    db_path = os.path.join(workdir, f"bench_{gallery_size}.db")
+    chroma_dir = os.path.join(workdir, f"chroma_{gallery_size}")
+
+    build_start = time.perf_counter()
+    templates = build_gallery(db_path, chroma_dir, replay["users"], gallery_size)
+    build_seconds = time.perf_counter() - build_start
+
+    expected = len(replay["swipes"]) * args.repeat
+    decided = Event()
+    responses = []
+    timings = {}
+
+    class BenchmarkSystem(AccessControlSystem):
+        def create_access_control(self):
+            start = time.perf_counter()
+            access_control = super().create_access_control()
+            timings["gallery_load_seconds"] = time.perf_counter() - start
+            return access_control
+
+        def process_access_request(self, access_control, rfid_data, frame, trace=None, frames=None):
+            response = super().process_access_request(access_control, rfid_data, frame, trace, frames)
+            responses.append((time.perf_counter(), response["status"]))
+            if len(responses) >= expected:
+                decided.set()
+            return response
+
+    camera = ReplayCamera(fps=args.fps)
+    rfid_logger = PtyRFIDLogger() if args.serial == "pty" else MemoryRFIDLogger()
+    system = BenchmarkSystem(
+        db_path=db_path,
+        chroma_dir=chroma_dir,
+        frame_window=0.5 / args.fps,
+        archive_captures=False,
+        camera=camera,
+        rfid_logger=rfid_logger,
+    )
+
+    get_registry().reset()
+    camera.show(frames[0])
+    system.start()
+    if not system.ready.wait(timeout=args.ready_timeout):
+        # The worker died or hung while loading the gallery; don't replay into it
+        system.stop()
+        system.frame_grabber.stop()
+        system.audit_writer.close()
+        if args.serial == "pty":
+            rfid_logger.close()
+        raise SystemExit(
+            f"Access control worker not ready after {args.ready_timeout:.0f}s "
+            f"(gallery of {gallery_size}); see the log for its startup error"
+        )
+
+    replay_start = time.perf_counter()
+    for _ in range(args.repeat):
+        for swipe, frame in zip(replay["swipes"], frames):
+            camera.show(frame)
+            # Let the grabber buffer the new frame before the card line arrives
+            time.sleep(2.0 / args.fps)
+            rfid_logger.inject_line(swipe["line"])
+            if args.interval:
+                time.sleep(args.interval)
+
+    completed = decided.wait(timeout=args.timeout)
+    elapsed = (responses[-1][0] if responses else time.perf_counter()) - replay_start
+
+    system.stop()
+    system.frame_grabber.stop()
+    system.audit_writer.close()
+    if args.serial == "pty":
+        rfid_logger.close()
+
+    return {
+        "gallery_size": gallery_size,
+        "templates": templates,
+        "gallery_build_seconds": build_seconds,
+        "gallery_load_seconds": timings.get("gallery_load_seconds"),
+        "swipes": expected,
+        "decided": len(responses),
+        "completed": completed,
+        "granted": sum(1 for _, status in responses if status == "granted"),
+        "denied": sum(1 for _, status in responses if status != "granted"),
+        "elapsed_seconds": elapsed,
+        "throughput_per_second": len(responses) / elapsed if elapsed > 0 else None,
+        "stages": get_registry().summary(),
+        "rss_mb": current_rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark with simulated hardware")
+    parser.add_argument("replay", help="JSON file with users to enroll and swipes to replay")
+    parser.add_argument("--gallery-sizes", type=int, nargs="+", default=DEFAULT_GALLERY_SIZES)
+    parser.add_argument("--serial", choices=["memory", "pty"], default="memory",
+                        help="Feed RFID lines in memory or through a pseudo-terminal")
+    parser.add_argument("--fps", type=float, default=30.0, help="Simulated camera frame rate")
+    parser.add_argument("--interval", type=float, default=0.0, help="Extra delay between swipes (s)")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the swipe list this many times")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Max wait for all decisions (s)")
+    parser.add_argument("--ready-timeout", type=float, default=300.0,
+                        help="Max wait for the worker to load the gallery (s)")
+    parser.add_argument("--workdir", help="Directory for the temporary databases")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    with open(args.replay) as replay_file:
+        replay = json.load(replay_file)
+
+    rss_before_model = current_rss_mb()
+    import_start = time.perf_counter()
+    from reasoning.face_recognition_model import warm_up, model_load_stats
+    import_seconds = time.perf_counter() - import_start
+    warm_up()
+
+    import cv2
+    frames = [cv2.imread(swipe["image"]) for swipe in replay["swipes"]]
+    missing = [swipe["image"] for swipe, frame in zip(replay["swipes"], frames) if frame is None]
+    if missing:
+        parser.error(f"Could not read swipe images: {missing}")
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "serial": args.serial,
+        "model_import_seconds": import_seconds,
+        "model_load_seconds": model_load_stats.get("load_seconds"),
+        "model_source": model_load_stats.get("source"),
+        "model_warm_up_seconds": model_load_stats.get("warm_up_seconds"),
+        "model_rss_mb": (current_rss_mb() or 0) - (rss_before_model or 0),
+        "runs": [],
+    }
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        for gallery_size in args.gallery_sizes:
+            print(f"Benchmarking gallery of {gallery_size} templates...", file=sys.stderr)
+            results["runs"].append(run_gallery_size(args, replay, frames, gallery_size, workdir))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
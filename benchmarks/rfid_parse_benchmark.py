@@ -0,0 +1,240 @@
+"""
+Throughput of RFID line parsing and card lookup on a replayed line stream.
+
+A line stream is replayed through:
+
+    legacy_parse    the former RFIDLogger.parse_rfid_data: decode every line,
+                    substring checks and split("|"), UID kept as typed
+    parse_card_line reasoning.card_identity's parser: decodes the line, finds
+                    the UID marker and parses each distinct UID field once
+    logger_feed     RFIDLogger.feed end to end (line framing, tracing and a
+                    counting subscriber), fed in serial-sized chunks
+
+and the card UIDs it contains are then looked up in a users table with:
+
+    sql_lookup      SELECT ... WHERE card_uid = ? per swipe
+    directory       CardDirectory.lookup on its integer-keyed map, including
+                    its periodic users_version check
+
+"end_to_end" times both together per line: the legacy parser followed by
+the SQL lookup, against parse_card_line followed by the directory.
+
+The stream is either the "data"/"raw_data" field of a recorded log such as
+reasoning/rfid_log.txt (repeated to --lines), or synthetic: card lines for
+--cards distinct cards mixed with reader chatter at --noise-ratio.
+
+Usage:
+    python benchmarks/rfid_parse_benchmark.py --lines 200000 --output rfid_parse.json
+    python benchmarks/rfid_parse_benchmark.py --replay reasoning/rfid_log.txt
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import time
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+
+from reasoning.card_identity import (
+    CardDirectory, ensure_card_identity_schema, format_uid, parse_card_line, uid_key
+)
+
+NOISE_LINES = [b"Scan PICC to see UID...", b"Firmware Version: 0x92", b"RFID Reader is working!"]
+
+
+def legacy_parse(line):
+    data = line.decode("utf-8", errors="replace").strip()
+    if data and "Card UID:" in data:
+        parts = data.split("|")
+        uid = parts[0].replace("Card UID:", "").strip()
+        return {"uid": uid, "is_recognized": "Card recognized" in data, "raw_data": data.strip()}
+    return None
+
+
+def synthetic_uids(count, rng):
+    return [format_uid(uid_key(rng.getrandbits(32).to_bytes(4, "big"))) for _ in range(count)]
+
+
+def synthetic_stream(lines, uids, noise_ratio, rng):
+    stream = []
+    for _ in range(lines):
+        if rng.random() < noise_ratio:
+            stream.append(rng.choice(NOISE_LINES))
+        else:
+            status = "Card recognized" if rng.random() < 0.9 else "Card not recognized"
+            stream.append(f"Card UID: {rng.choice(uids)} | {status}".encode())
+    return stream
+
+
+def replayed_stream(path, lines):
+    recorded = []
+    with open(path, "rb") as replay_file:
+        for raw in replay_file:
+            raw = raw.rstrip(b"\r\n")
+            try:
+                entry = json.loads(raw)
+                raw = (entry.get("raw_data") or entry.get("data") or "").encode()
+            except (ValueError, AttributeError):
+                pass
+            if raw:
+                recorded.append(raw)
+    if not recorded:
+        raise SystemExit(f"No lines in {path}")
+    return [recorded[i % len(recorded)] for i in range(max(lines, len(recorded)))]
+
+
+def rate(count, seconds):
+    return {"items": count, "seconds": seconds, "per_second": count / seconds if seconds else None}
+
+
+def time_parser(parser, stream, repeat):
+    best, found = None, 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        found = sum(1 for line in stream if parser(line) is not None)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return dict(rate(len(stream), best), card_lines=found)
+
+
+def time_logger_feed(stream, chunk_size):
+    from reasoning.RFID_script import RFIDLogger
+
+    rfid_logger = RFIDLogger(port="replay", log_file=os.devnull)
+    swipes = []
+    rfid_logger.subscribe(lambda parsed, event_time: swipes.append(parsed))
+    payload = b"".join(line + b"\r\n" for line in stream)
+    start = time.perf_counter()
+    for offset in range(0, len(payload), chunk_size):
+        rfid_logger.feed(payload[offset:offset + chunk_size])
+    return dict(rate(len(stream), time.perf_counter() - start), card_lines=len(swipes), chunk_size=chunk_size)
+
+
+def users_table(uids):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            card_uid TEXT UNIQUE NOT NULL,
+            face_embedding_id TEXT
+        )
+    """)
+    conn.executemany("INSERT OR IGNORE INTO users (name, card_uid) VALUES (?, ?)",
+                     [(f"user-{i}", uid) for i, uid in enumerate(uids)])
+    ensure_card_identity_schema(conn.cursor())
+    conn.commit()
+    return conn
+
+
+def time_lookups(conn, swipes):
+    cursor = conn.cursor()
+
+    def select(card_uid):
+        cursor.execute("SELECT id, name, face_embedding_id FROM users WHERE card_uid = ?", (card_uid,))
+        return cursor.fetchone()
+
+    start = time.perf_counter()
+    sql_found = sum(1 for parsed in swipes if select(parsed["uid"]) is not None)
+    sql = dict(rate(len(swipes), time.perf_counter() - start), found=sql_found)
+
+    directory = CardDirectory()
+    start = time.perf_counter()
+    directory.load(conn)
+    load_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    found = sum(1 for parsed in swipes if directory.lookup(conn, parsed["card_key"], select) is not None)
+    return {"sql_lookup": sql,
+            "directory": dict(rate(len(swipes), time.perf_counter() - start), found=found,
+                              load_seconds=load_seconds, cards=len(directory))}
+
+
+def time_end_to_end(conn, stream):
+    cursor = conn.cursor()
+
+    def select(card_uid):
+        cursor.execute("SELECT id, name, face_embedding_id FROM users WHERE card_uid = ?", (card_uid,))
+        return cursor.fetchone()
+
+    def legacy(line):
+        parsed = legacy_parse(line)
+        return select(parsed["uid"]) if parsed else None
+
+    directory = CardDirectory()
+    directory.load(conn)
+
+    def current(line):
+        parsed = parse_card_line(line)
+        return directory.lookup(conn, parsed["card_key"], select) if parsed else None
+
+    results = {}
+    for name, handle in (("legacy", legacy), ("card_identity", current)):
+        start = time.perf_counter()
+        found = sum(1 for line in stream if handle(line) is not None)
+        results[name] = dict(rate(len(stream), time.perf_counter() - start), found=found)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RFID line parsing and card lookup")
+    parser.add_argument("--replay", help="Recorded line log (JSON lines with data/raw_data, or raw lines)")
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument("--cards", type=int, default=1000, help="Distinct cards in a synthetic stream")
+    parser.add_argument("--users", type=int, default=10000, help="Enrolled cards in the users table")
+    parser.add_argument("--noise-ratio", type=float, default=0.2, help="Share of non-card lines (synthetic)")
+    parser.add_argument("--chunk-size", type=int, default=64, help="Bytes per serial read fed to RFIDLogger")
+    parser.add_argument("--repeat", type=int, default=3, help="Parser runs; the fastest is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.replay:
+        stream = replayed_stream(args.replay, args.lines)
+    else:
+        stream = synthetic_stream(args.lines, synthetic_uids(args.cards, rng), args.noise_ratio, rng)
+    swipes = [parsed for parsed in map(parse_card_line, stream) if parsed is not None]
+
+    # Swiped cards are enrolled, padded with other cards up to --users
+    enrolled = list(dict.fromkeys(parsed["uid"] for parsed in swipes))
+    enrolled += synthetic_uids(max(0, args.users - len(enrolled)), rng)
+    conn = users_table(enrolled)
+    try:
+        lookups = time_lookups(conn, swipes)
+        end_to_end = time_end_to_end(conn, stream)
+    finally:
+        conn.close()
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "stream": args.replay or "synthetic",
+        "lines": len(stream),
+        "card_lines": len(swipes),
+        "enrolled_cards": len(enrolled),
+        "parse": {
+            "legacy_parse": time_parser(legacy_parse, stream, args.repeat),
+            "parse_card_line": time_parser(parse_card_line, stream, args.repeat),
+        },
+        "lookup": lookups,
+        "end_to_end": end_to_end,
+    }
+    try:
+        results["parse"]["logger_feed"] = time_logger_feed(stream, args.chunk_size)
+    except ImportError as e:
+        print(f"Skipping logger_feed: {e}", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
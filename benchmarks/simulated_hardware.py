@@ -0,0 +1,114 @@
+"""Stand-ins for the camera and the RFID reader, used to replay recorded swipes offline."""
+import os
+import pty
+import sys
+import time
+import tty
+from threading import Condition, Lock
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+from reasoning.RFID_script import RFIDLogger
+
+
+class ReplayCamera:
+    """
+    cv2.VideoCapture stand-in that serves the frame last passed to show(),
+    paced at `fps` like a real camera.
+    """
+
+    def __init__(self, fps=30, frame=None):
+        self.fps = fps
+        self._frame = frame
+        self._opened = True
+        self._lock = Lock()
+        self._next_read = time.monotonic()
+
+    def show(self, frame):
+        with self._lock:
+            self._frame = frame
+
+    def isOpened(self):
+        return self._opened
+
+    def read(self):
+        delay = self._next_read - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next_read = max(self._next_read, time.monotonic()) + 1.0 / self.fps
+        with self._lock:
+            frame = self._frame
+        return frame is not None and self._opened, frame
+
+    def release(self):
+        self._opened = False
+
+
+class MemorySerial:
+    """Minimal pyserial stand-in whose input is fed from memory."""
+
+    def __init__(self, timeout=0.5):
+        self.timeout = timeout
+        self._buffer = bytearray()
+        self._condition = Condition()
+        self.is_open = True
+
+    def feed(self, data):
+        with self._condition:
+            self._buffer += data
+            self._condition.notify_all()
+
+    @property
+    def in_waiting(self):
+        with self._condition:
+            return len(self._buffer)
+
+    def read(self, size=1):
+        with self._condition:
+            self._condition.wait_for(lambda: self._buffer or not self.is_open, self.timeout)
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            return data
+
+    def close(self):
+        with self._condition:
+            self.is_open = False
+            self._condition.notify_all()
+
+
+class MemoryRFIDLogger(RFIDLogger):
+    """RFIDLogger reading from a MemorySerial instead of a real port."""
+
+    def __init__(self, **kwargs):
+        super().__init__(port="memory", **kwargs)
+        self.link = MemorySerial(timeout=self.read_timeout)
+
+    def connect(self):
+        self.ser = self.link
+        return True
+
+    def inject_line(self, line):
+        """Make a line arrive from the reader, as the Arduino prints it."""
+        self.link.feed(line.encode("utf-8") + b"\r\n")
+
+
+class PtyRFIDLogger(RFIDLogger):
+    """
+    RFIDLogger attached to the slave end of a pseudo-terminal, so the real
+    pyserial code path is exercised. Lines written with inject_line() arrive
+    exactly as they would from the Arduino.
+    """
+
+    def __init__(self, **kwargs):
+        self.master_fd, slave_fd = pty.openpty()
+        tty.setraw(slave_fd)
+        self.slave_fd = slave_fd
+        super().__init__(port=os.ttyname(slave_fd), **kwargs)
+
+    def inject_line(self, line):
+        """Write a line to the reader's end of the pty, as the Arduino prints it."""
+        os.write(self.master_fd, line.encode("utf-8") + b"\r\n")
+
+    def close(self):
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
@@ -0,0 +1,198 @@
+"""
+Speed and FAR/FRR of per-user templates against the existing matchers.
+
+Images from a labelled tree (root/<name>/<images>) are split per person into
+enrollment and probe images. Every probe is tried as a genuine claim of its
+own identity and as an impostor claim of other identities, with:
+
+    top1_name   nearest enrolled image over the whole gallery must belong
+                to the claimed user (the original Chroma top-1 name match)
+    all_max     best cosine over all of the claimed user's images (GalleryIndex)
+    centroid    cosine to the user's centroid only
+    fused       centroid fused with the best of --medoids medoids (TemplateIndex)
+
+Thresholds of the score-based matchers are calibrated on half of the probes
+for a target FAR and evaluated on the other half.
+
+Usage:
+    python benchmarks/template_benchmark.py data --target-far 0.001 --output templates.json
+    python benchmarks/template_benchmark.py data --save-threshold access_control.db
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def load_labelled_images(root):
+    people = {}
+    for name in sorted(os.listdir(root)):
+        folder = os.path.join(root, name)
+        if os.path.isdir(folder):
+            images = sorted(os.path.join(folder, f) for f in os.listdir(folder)
+                            if f.lower().endswith(IMAGE_EXTENSIONS))
+            if len(images) >= 2:
+                people[name] = images
+    return people
+
+
+def split(people, enroll_fraction, rng):
+    enroll, probes = {}, []
+    for user_id, (name, images) in enumerate(people.items(), 1):
+        images = list(images)
+        rng.shuffle(images)
+        count = max(1, min(len(images) - 1, int(round(len(images) * enroll_fraction))))
+        enroll[user_id] = (name, images[:count])
+        probes.extend((user_id, path) for path in images[count:])
+    return enroll, probes
+
+
+def error_rates(genuine, impostor, threshold):
+    genuine, impostor = np.asarray(genuine), np.asarray(impostor)
+    return {
+        "far": float(np.mean(impostor >= threshold)) if len(impostor) else None,
+        "frr": float(np.mean(genuine < threshold)) if len(genuine) else None,
+    }
+
+
+def equal_error_rate(genuine, impostor):
+    thresholds = np.unique(np.concatenate([genuine, impostor]))
+    best = min(thresholds, key=lambda t: abs(
+        error_rates(genuine, impostor, t)["far"] - error_rates(genuine, impostor, t)["frr"]))
+    rates = error_rates(genuine, impostor, best)
+    return {"threshold": float(best), "eer": (rates["far"] + rates["frr"]) / 2}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-user template matching")
+    parser.add_argument("images", help="Folder with one sub-folder of images per person")
+    parser.add_argument("--enroll-fraction", type=float, default=0.7)
+    parser.add_argument("--impostors-per-probe", type=int, default=20,
+                        help="Other identities each probe claims (0 = all)")
+    parser.add_argument("--target-far", type=float, default=0.001)
+    parser.add_argument("--medoids", type=int, default=3)
+    parser.add_argument("--centroid-weight", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-threshold", metavar="DB",
+                        help="Store the calibrated fused threshold, with the medoid count and centroid "
+                             "weight it was calibrated for, in this access control database")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    from reasoning.face_recognition_model import extract_embeddings_batch
+    from reasoning.gallery_index import GalleryIndex
+    from reasoning.templates import TemplateIndex, calibrate_threshold
+
+    rng = np.random.default_rng(args.seed)
+    people = load_labelled_images(args.images)
+    if len(people) < 2:
+        parser.error("Need at least two people with two or more images each")
+    enroll, probes = split(people, args.enroll_fraction, rng)
+
+    print(f"Embedding images of {len(people)} people...", file=sys.stderr)
+    gallery = GalleryIndex()
+    templates = TemplateIndex(medoids=args.medoids, centroid_weight=args.centroid_weight)
+    centroids = TemplateIndex(medoids=0, centroid_weight=1.0)
+    for user_id, (name, images) in enroll.items():
+        pairs = [(f"{user_id}-{i}", e) for i, e in enumerate(extract_embeddings_batch(images)) if e is not None]
+        if not pairs:
+            continue
+        ids, embeddings = zip(*pairs)
+        gallery.add(user_id, ids, embeddings, name=name)
+        templates.on_enrollment(user_id, name, None, ids, embeddings)
+        centroids.on_enrollment(user_id, name, None, ids, embeddings)
+
+    probe_embeddings = extract_embeddings_batch([path for _, path in probes])
+    probes = [(user_id, e) for (user_id, _), e in zip(probes, probe_embeddings)
+              if e is not None and gallery.template_count(user_id)]
+    user_ids = [u for u in enroll if gallery.template_count(u)]
+
+    trials = []
+    for probe_index, (user_id, embedding) in enumerate(probes):
+        others = [u for u in user_ids if u != user_id]
+        if args.impostors_per_probe and len(others) > args.impostors_per_probe:
+            others = list(rng.choice(others, args.impostors_per_probe, replace=False))
+        trials.append((probe_index, user_id, embedding, True))
+        trials.extend((probe_index, claimed, embedding, False) for claimed in others)
+
+    def top1_name(claimed, embedding):
+        best = gallery.identify(embedding, 1)
+        return 1.0 if best and best[0][0] == claimed else 0.0
+
+    matchers = {
+        "top1_name": top1_name,
+        "all_max": lambda claimed, embedding: gallery.verify(claimed, embedding, -1.0)[1],
+        "centroid": lambda claimed, embedding: centroids.verify(claimed, embedding, -1.0)[1],
+        "fused": lambda claimed, embedding: templates.verify(claimed, embedding, -1.0)[1],
+    }
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "people": len(user_ids),
+        "enrolled_images": len(gallery),
+        "probes": len(probes),
+        "genuine_trials": sum(1 for t in trials if t[3]),
+        "impostor_trials": sum(1 for t in trials if not t[3]),
+        "target_far": args.target_far,
+        "matchers": {},
+    }
+
+    for label, matcher in matchers.items():
+        start = time.perf_counter()
+        scores = [matcher(claimed, embedding) for _, claimed, embedding, _ in trials]
+        per_call_us = (time.perf_counter() - start) / len(trials) * 1e6
+        scores = np.asarray(scores, dtype=np.float64)
+        genuine_mask = np.array([t[3] for t in trials])
+        calibration_mask = np.array([t[0] % 2 == 0 for t in trials])
+
+        entry = {"verify_us": per_call_us}
+        if label == "top1_name":
+            entry.update(error_rates(scores[genuine_mask], scores[~genuine_mask], 0.5))
+        else:
+            calibration = calibrate_threshold(scores[genuine_mask & calibration_mask],
+                                              scores[~genuine_mask & calibration_mask], args.target_far)
+            test = ~calibration_mask
+            entry["threshold"] = calibration["threshold"]
+            entry["calibration"] = calibration
+            entry.update(error_rates(scores[genuine_mask & test], scores[~genuine_mask & test],
+                                     calibration["threshold"]))
+            entry["eer"] = equal_error_rate(scores[genuine_mask], scores[~genuine_mask])
+            if label == "all_max":
+                entry["at_default_threshold"] = error_rates(scores[genuine_mask], scores[~genuine_mask],
+                                                            gallery.threshold)
+        results["matchers"][label] = entry
+
+    if args.save_threshold:
+        import sqlite3
+        from reasoning.templates import TemplateStore
+
+        conn = sqlite3.connect(args.save_threshold)
+        store = TemplateStore(conn)
+        store.set_setting("fused_threshold", results["matchers"]["fused"]["threshold"])
+        store.set_setting("centroid_weight", args.centroid_weight)
+        # The threshold only holds for templates with this many medoids;
+        # stored templates with another count are rebuilt on the next load
+        store.set_setting("medoids", args.medoids)
+        conn.close()
+        print(f"Saved fused threshold to {args.save_threshold}", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import sys
 import os
 import time
+import argparse
+import logging
 from threading import Thread
 from reasoning.thread_safe_access_control import AccessControlSystem
 
@@ -10,12 +12,73 @@ sys.path.append(project_root)
 
 def main():
     """Entry point for the access control application."""
+    parser = argparse.ArgumentParser(description="Dual-factor face + RFID access control")
+    parser.add_argument("--doors", help="JSON config describing several reader/camera pairs")
+    parser.add_argument("--verbose", action="store_true", help="Log per-request details and stage timings")
+    parser.add_argument("--model-cache", help="TorchScript FaceNet cache file (created on first run)")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default="torch", help="FaceNet inference backend")
+    parser.add_argument("--quantize", action="store_true", help="Run FaceNet with dynamic int8 quantization")
+    parser.add_argument("--channels-last", action="store_true", help="Use NHWC tensors (torch backend)")
+    parser.add_argument("--inference-threads", type=int, help="Intra-op threads used for FaceNet inference")
+    parser.add_argument("--match-mode", choices=["all", "templates"], default="all",
+                        help="Verify against every enrolled image or per-user centroid/medoid templates")
+    parser.add_argument("--no-quality-gate", action="store_true",
+                        help="Embed the sharpest frame near the swipe without quality or motion checks")
+    parser.add_argument("--require-motion", action="store_true",
+                        help="Refuse faces that do not move across the capture burst (a held-up photo)")
+    parser.add_argument("--verification-socket", metavar="SOCKET",
+                        help="Send decisions to a running reasoning/verification_server.py")
+    parser.add_argument("--snapshot-dir", help="Memory-map the gallery from snapshots published here by enrollment")
+    parser.add_argument("--ann-index-dir",
+                        help="Identify mismatched faces with the 1:N index kept here by enrollment")
+    parser.add_argument("--asyncio", dest="use_asyncio", action="store_true",
+                        help="Run the doors on the asyncio pipeline (reasoning/async_door_agent.py)")
+    parser.add_argument("--onnx-path", default="facenet.onnx", help="ONNX graph file (exported on first run)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(message)s")
+
+    if args.model_cache:
+        from reasoning.face_recognition_model import set_model_cache
+        set_model_cache(args.model_cache)
+
+    from reasoning.face_recognition_model import set_inference_backend
+    if args.backend == "onnx":
+        set_inference_backend("onnx", onnx_path=args.onnx_path, quantize=args.quantize,
+                              num_threads=args.inference_threads)
+    else:
+        set_inference_backend("torch", quantize=args.quantize, channels_last=args.channels_last,
+                              num_threads=args.inference_threads)
+
+    quality_gate_options = {"require_motion": args.require_motion}
+
     print("\n=== Access Control System ===")
     print("Initializing application...\n")
 
     try:
-        # Initialize the Access Control System
-        system = AccessControlSystem(camera_index=0,db_path="access_control.db")  # Use default camera index
+        if args.use_asyncio:
+            # Serial, capture, verification and logging as asyncio pipeline stages
+            from reasoning.async_door_agent import AsyncDoorAgent, single_door_agent
+            if args.doors:
+                system = AsyncDoorAgent.from_config(args.doors)
+            else:
+                system = single_door_agent(db_path="access_control.db", match_mode=args.match_mode,
+                                           use_quality_gate=not args.no_quality_gate,
+                                           verification_socket=args.verification_socket,
+                                           snapshot_dir=args.snapshot_dir, ann_index_dir=args.ann_index_dir,
+                                           quality_gate_options=quality_gate_options)
+        elif args.doors:
+            # Several doors served by one shared worker pool
+            from reasoning.multi_door import MultiDoorAccessSystem
+            system = MultiDoorAccessSystem.from_config(args.doors)
+        else:
+            # Initialize the Access Control System
+            system = AccessControlSystem(camera_index=0,db_path="access_control.db",
+                                         match_mode=args.match_mode,
+                                         use_quality_gate=not args.no_quality_gate,
+                                         verification_socket=args.verification_socket,
+                                         snapshot_dir=args.snapshot_dir,
+                                         ann_index_dir=args.ann_index_dir,
+                                         quality_gate_options=quality_gate_options)  # Use default camera index
 
         # Run the system
         print("Starting the system. Press Ctrl+C to exit.\n")
@@ -2,46 +2,57 @@ import serial
 import time
 import os
 import json
+import logging
+import sys
 from datetime import datetime
+from threading import Thread, Event
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+from reasoning.card_identity import parse_card_line
+from reasoning.tracing import RequestTrace
+
+logger = logging.getLogger(__name__)
 
 class RFIDLogger:
-    def __init__(self, port="/dev/ttyACM0", baud=9600, log_file="rfid_log.txt"):
+    def __init__(self, port="/dev/ttyACM0", baud=9600, log_file="rfid_log.txt", read_timeout=0.5,
+                 audit_writer=None):
         self.port = port
         self.baud = baud
         self.log_file = log_file
+        self.audit_writer = audit_writer
+        self._log_handle = None
+        self.read_timeout = read_timeout
         self.ser = None
+        self.subscribers = []
+        self.stop_event = Event()
+        self._thread = None
+        self._buffer = bytearray()
+        self._line_start_ns = None
         os.makedirs(os.path.dirname(log_file) if os.path.dirname(log_file) else '.', exist_ok=True)
 
     def connect(self):
         try:
-            self.ser = serial.Serial(self.port, self.baud)
-            print(f"Connected to Arduino on port: {self.port}")
+            # The read timeout only bounds how long a blocked read waits, so
+            # listen() can notice stop() without polling
+            self.ser = serial.Serial(self.port, self.baud, timeout=self.read_timeout)
+            logger.info("Connected to Arduino on port: %s", self.port)
             return True
         except serial.SerialException as e:
-            print(f"Error connecting to port {self.port}: {e}")
+            logger.error("Error connecting to port %s: %s", self.port, e)
             return False
 
     def parse_rfid_data(self, data):
-        # Extract Card UID
-        if "Card UID:" in data:
-            parts = data.split("|")
-            uid = parts[0].replace("Card UID:", "").strip()
-            
-            # Determine recognition status
-            is_recognized = "Card recognized" in data
-            
-            return {
-                "uid": uid,
-                "is_recognized": is_recognized,
-                "raw_data": data.strip()
-            }
-        return None
+        """Parse a decoded line; see reasoning.card_identity.parse_card_line."""
+        return parse_card_line(data)
 
     def log_data(self, data):
         parsed_data = self.parse_rfid_data(data)
         if not parsed_data:
             return False
+        return self.log_event(parsed_data)
 
+    def log_event(self, parsed_data, event_time=None):
+        """Append a parsed card event to the JSON lines log."""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         log_entry = {
             "timestamp": timestamp,
@@ -51,31 +62,120 @@ class RFIDLogger:
             "type": "access_granted" if parsed_data["is_recognized"] else "access_denied"
         }
 
+        if self.audit_writer is not None:
+            self.audit_writer.append_line(self.log_file, json.dumps(log_entry))
+            return True
+
         try:
-            with open(self.log_file, "a") as file:
-                file.write(json.dumps(log_entry) + "\n")
+            # Keep the log open across lines instead of reopening it per event
+            if self._log_handle is None:
+                self._log_handle = open(self.log_file, "a")
+            self._log_handle.write(json.dumps(log_entry) + "\n")
+            self._log_handle.flush()
             return True
         except IOError as e:
-            print(f"Error writing to log file: {e}")
+            logger.error("Error writing to log file: %s", e)
+            return False
+
+    def subscribe(self, callback):
+        """
+        Register a callback for parsed card events. It is called from the
+        reading thread as callback(parsed_data, event_time), where event_time
+        is the time.monotonic() at which the line was completed. parsed_data
+        carries a RequestTrace under "trace" with the serial read and parse
+        stages; the access path pops it and carries it on.
+        """
+        self.subscribers.append(callback)
+
+    def _publish(self, line, event_time, line_start_ns, line_end_ns):
+        trace = RequestTrace(start_ns=line_start_ns)
+        trace.add("serial_read", line_start_ns, line_end_ns)
+        with trace.stage("parse"):
+            parsed = parse_card_line(line)
+        if not parsed:
+            return
+        parsed["trace"] = trace
+        for callback in self.subscribers:
+            try:
+                callback(parsed, event_time)
+            except Exception as e:
+                logger.error("Error in RFID subscriber: %s", e)
+
+    def listen(self):
+        """
+        Read the serial port until stop() is called, publishing every complete
+        line to the subscribers as soon as its newline arrives.
+
+        Reads block in the driver instead of polling in_waiting; the read
+        timeout only bounds how long stop() takes to be noticed.
+        """
+        self._buffer.clear()
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    # Take whatever is already buffered, or block for the next byte
+                    chunk = self.ser.read(self.ser.in_waiting or 1)
+                except serial.SerialException as e:
+                    logger.error("Error reading from port %s: %s", self.port, e)
+                    break
+                if chunk:
+                    self.feed(chunk)
+        finally:
+            # The stop has been honoured, whoever runs this loop; a later
+            # start() or listen() reads again
+            self.stop_event.clear()
+
+    def feed(self, chunk):
+        """
+        Add bytes read from the port, publishing every line they complete.
+        Used by listen() and by event-loop readers that do their own reads.
+        """
+        event_time = time.monotonic()
+        now_ns = time.perf_counter_ns()
+        if not self._buffer:
+            self._line_start_ns = now_ns
+        self._buffer += chunk
+        newline = self._buffer.find(b"\n")
+        while newline >= 0:
+            line = bytes(self._buffer[:newline])
+            del self._buffer[:newline + 1]
+            self._publish(line, event_time, self._line_start_ns, now_ns)
+            # Any bytes left over belong to a line that started in this chunk
+            self._line_start_ns = now_ns
+            newline = self._buffer.find(b"\n")
+
+    def start(self):
+        """Connect and listen on a background thread."""
+        if not self.connect():
             return False
+        self._thread = Thread(target=self.listen, name=f"rfid-{self.port}", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """
+        Stop listening; returns once the reading thread started by start()
+        has exited. A stop before start() or listen() is kept, so they
+        return at once.
+        """
+        self.stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def print_event(self, parsed_data, event_time=None):
+        """Subscriber used by run() to echo logged cards."""
+        print(f"Card UID: {parsed_data['uid']} | Recognized: {parsed_data['is_recognized']}")
 
     def run(self):
         if not self.connect():
             return
         print(f"Storing data in {self.log_file}")
+        self.subscribe(self.log_event)
+        self.subscribe(self.print_event)
         
         try:
-            while True:
-                if self.ser.in_waiting > 0:
-                    data = self.ser.readline().decode("utf-8").strip()
-                    if data:
-                        if self.log_data(data):
-                            parsed = self.parse_rfid_data(data)
-                            if parsed:
-                                print(f"Card UID: {parsed['uid']} | Recognized: {parsed['is_recognized']}")
-                        else:
-                            print(f"Failed to log: {data}")
-                time.sleep(0.1)
+            self.listen()
         except KeyboardInterrupt:
             print("\nData collection stopped by user.")
         except Exception as e:
@@ -83,8 +183,12 @@ class RFIDLogger:
         finally:
             if self.ser:
                 self.ser.close()
+            if self._log_handle:
+                self._log_handle.close()
+                self._log_handle = None
             print("Serial connection closed.")
 
 if __name__ == "__main__":
-    logger = RFIDLogger()
-    logger.run()
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    rfid_logger = RFIDLogger()
+    rfid_logger.run()
\ No newline at end of file
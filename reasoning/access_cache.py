@@ -0,0 +1,135 @@
+import time
+import logging
+from collections import OrderedDict
+from threading import Lock
+from reasoning.card_identity import lookup_key
+
+logger = logging.getLogger(__name__)
+
+_NOT_REGISTERED = object()
+
+
+class AccessCache:
+    """
+    Short-lived cache in front of the card lookup and the access decision.
+
+    - User rows are cached by card UID for `ttl` seconds, and cards that are
+      not registered are remembered for `negative_ttl` seconds, so a card
+      swiped again and again does not hit SQLite each time. AccessControl
+      skips this cache when it has a CardDirectory, which follows changes
+      to the users table itself.
+    - A card swiped again at the same door within `debounce_window` seconds
+      of its last remembered decision there gets that decision back without
+      another face check; readers report a card several times while it is
+      held in front of them. Decisions are kept per (door, card), so a grant
+      at one door never opens another. AccessControl only remembers grants
+      and unregistered cards, never face denials.
+
+    Cards are keyed by reasoning.card_identity.lookup_key() of their UID.
+    Both maps are LRU-bounded to `max_entries` entries. Entries for a card are
+    dropped when it is enrolled (see on_enrollment), and everything is
+    dropped by clear(), which AccessControl.reload() calls.
+    """
+
+    def __init__(self, max_entries=1024, ttl=30.0, negative_ttl=5.0, debounce_window=1.5,
+                 clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.debounce_window = debounce_window
+        self.clock = clock
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.debounced = 0
+        self._users = OrderedDict()
+        self._decisions = OrderedDict()
+        self._lock = Lock()
+
+    def _get(self, entries, key):
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if self.clock() >= expires_at:
+            del entries[key]
+            return None
+        entries.move_to_end(key)
+        return value
+
+    def _put(self, entries, key, value, ttl):
+        entries[key] = (self.clock() + ttl, value)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def get_user(self, card_uid, loader):
+        """
+        Return the users row for a card, calling `loader(card_uid)` on a miss.
+
+        Returns:
+            tuple: The (id, name, face_embedding_id) row, or None when the
+            card is not registered
+        """
+        with self._lock:
+            row = self._get(self._users, card_uid)
+            if row is _NOT_REGISTERED:
+                self.negative_hits += 1
+                return None
+            if row is not None:
+                self.hits += 1
+                return row
+            self.misses += 1
+
+        row = loader(card_uid)
+        with self._lock:
+            if row is None:
+                self._put(self._users, card_uid, _NOT_REGISTERED, self.negative_ttl)
+            else:
+                self._put(self._users, card_uid, tuple(row), self.ttl)
+        return row
+
+    def recent_decision(self, card_uid, door_id=None):
+        """The response given to this card at this door within the debounce window, if any."""
+        if not self.debounce_window:
+            return None
+        with self._lock:
+            response = self._get(self._decisions, (door_id, card_uid))
+            if response is not None:
+                self.debounced += 1
+            return response
+
+    def remember_decision(self, card_uid, response, door_id=None):
+        """Record the response given to a card at a door, for debouncing repeated swipes."""
+        if not self.debounce_window:
+            return
+        with self._lock:
+            self._put(self._decisions, (door_id, card_uid), response, self.debounce_window)
+
+    def invalidate(self, card_uid):
+        """Forget the cached row and the last decisions at every door for one card."""
+        key = lookup_key(card_uid)
+        with self._lock:
+            self._users.pop(key, None)
+            for decision_key in [entry for entry in self._decisions if entry[1] == key]:
+                del self._decisions[decision_key]
+
+    def clear(self):
+        """Forget everything."""
+        with self._lock:
+            self._users.clear()
+            self._decisions.clear()
+
+    def on_enrollment(self, user_id, name, card_uid, embedding_ids, embeddings):
+        """Enrollment listener (see EnhancedDatabaseManager.add_enrollment_listener)."""
+        self.invalidate(card_uid)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "debounced": self.debounced,
+                "cached_cards": len(self._users),
+            }
@@ -2,20 +2,118 @@ import sys
 import os
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.append(project_root)
-from chroma_check import search_face_embedding, extract_embedding, get_embeddings
+from reasoning.face_recognition_model import extract_embedding_from_frame, get_embeddings
+from reasoning.face_detector import get_face_detector
+from reasoning.gallery_index import GalleryIndex
+from reasoning.templates import TemplateIndex
+from reasoning.tracing import RequestTrace
+from reasoning.access_reports import create_access_log_indexes
+from reasoning.card_identity import ensure_card_identity_schema, format_uid, lookup_key
 # from face_recognition_model import trace_and_annotate_faces
-from langchain_community.vectorstores import Chroma
 import sqlite3
+import cv2
+import logging
+
+logger = logging.getLogger(__name__)
+
 class AccessControl:
-    def __init__(self, conn, db_path="../access_control.db", chroma_dir="chroma_db_test"):
+    # Kept as constants so sqlite3's per-connection statement cache reuses the
+    # compiled statements for the lifetime of a long-lived instance.
+    USER_BY_CARD_SQL = "SELECT id, name, face_embedding_id FROM users WHERE card_uid = ?"
+    INSERT_ACCESS_LOG_SQL = "INSERT INTO access_logs (user_id, action) VALUES (?, ?)"
+    NOT_REGISTERED_MESSAGE = "Card not registered"
+
+    # "all" compares the probe with every enrolled image of the claimed user;
+    # "templates" with the user's centroid and medoids (reasoning.templates)
+    MATCH_MODES = {
+        "all": GalleryIndex,
+        "templates": TemplateIndex,
+    }
+
+    def __init__(self, conn, db_path="../access_control.db", chroma_dir="chroma_db_test",
+                 initialize_schema=True, gallery=None, match_threshold=None,
+                 identify_on_mismatch=False, chroma_db=None, audit_writer=None, access_cache=None,
+                 match_mode="all", quality_gate=None, embedder=None, ann_index=None,
+                 snapshot_dir=None, card_directory=None, ann_index_dir=None):
+        """
+        `match_threshold` overrides the gallery's own threshold (0.6 cosine
+        for "all", the calibrated fused threshold for "templates").
+        `quality_gate` (a reasoning.quality_gate.QualityGate) picks which
+        frames of a burst are embedded; without it the first frame is used.
+        `embedder` maps a BGR face crop to its embedding (or None); it
+        defaults to extract_embedding_from_frame, the verification server
+        passes an EmbeddingBatcher's embed to batch across callers.
+        `ann_index` (reasoning.ann_index) answers 1:N lookups such as
+        identify_on_mismatch instead of a full scan of the gallery;
+        `ann_index_dir` opens the one enrollment keeps there (building it
+        the first time) and turns identify_on_mismatch on.
+        `snapshot_dir` holds gallery snapshots (reasoning.gallery_snapshot);
+        in "all" mode a current snapshot is memory-mapped instead of
+        rebuilding the gallery from Chroma.
+        `card_directory` (reasoning.card_identity.CardDirectory) answers card
+        lookups from memory instead of querying users by card_uid.
+        """
         self.conn = conn
         self.cursor = self.conn.cursor()
-        os.makedirs(chroma_dir, exist_ok=True)
-        self.chroma_db = Chroma(
-            persist_directory=chroma_dir,
+        self.chroma_dir = chroma_dir
+        self.match_threshold = match_threshold
+        if match_mode not in self.MATCH_MODES:
+            raise ValueError(f"Unknown match mode {match_mode!r}, expected one of {sorted(self.MATCH_MODES)}")
+        self.match_mode = match_mode
+        self.identify_on_mismatch = identify_on_mismatch or bool(ann_index_dir)
+        self.audit_writer = audit_writer
+        self.access_cache = access_cache
+        self.quality_gate = quality_gate
+        self.embedder = embedder or extract_embedding_from_frame
+        self.ann_index_dir = ann_index_dir
+        self.snapshot_dir = snapshot_dir
+        self.card_directory = card_directory
+        self.face_detector = get_face_detector()
+        self.chroma_db = chroma_db if chroma_db is not None else self.open_chroma()
+        if initialize_schema:
+            self.initialize_database()
+        self.gallery = gallery if gallery is not None else self.load_gallery()
+        self.ann_index = ann_index if ann_index is not None else self.open_ann_index()
+
+    def load_gallery(self):
+        """Build the in-memory index used for face verification."""
+        if self.snapshot_dir and self.match_mode == "all":
+            return GalleryIndex.load_with_snapshot(self.conn, self.chroma_db, self.snapshot_dir)
+        return self.MATCH_MODES[self.match_mode].load(self.conn, self.chroma_db)
+
+    def open_ann_index(self):
+        """Open the 1:N identification index in ann_index_dir, if one is configured."""
+        if not self.ann_index_dir:
+            return None
+        from reasoning.ann_index import open_ann_index
+
+        return open_ann_index(self.ann_index_dir, self.conn, self.chroma_db)
+
+    def open_chroma(self):
+        """Open the Chroma store backing face verification."""
+        from langchain_community.vectorstores import Chroma
+
+        os.makedirs(self.chroma_dir, exist_ok=True)
+        return Chroma(
+            persist_directory=self.chroma_dir,
             embedding_function=get_embeddings()
         )
-        self.initialize_database()
+
+    def reload(self):
+        """
+        Re-open the Chroma handle and drop the connection's snapshot so that
+        changes made by enrollment become visible to this instance.
+        """
+        logger.info("Reloading verification stores...")
+        self.conn.commit()
+        self.chroma_db = self.open_chroma()
+        self.gallery = self.load_gallery()
+        if self.ann_index_dir:
+            self.ann_index = self.open_ann_index()
+        if self.access_cache is not None:
+            self.access_cache.clear()
+        if self.card_directory is not None:
+            self.card_directory.invalidate()
 
     def initialize_database(self):
         self.cursor.execute("""
@@ -26,6 +124,16 @@ class AccessControl:
                 face_embedding_id TEXT NOT NULL
             )
         """)
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS face_embeddings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                face_embedding_id TEXT NOT NULL,
+                image_path TEXT NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users (id),
+                UNIQUE (face_embedding_id)
+            )
+        """)
         self.cursor.execute("""
             CREATE TABLE IF NOT EXISTS access_logs (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -35,13 +143,24 @@ class AccessControl:
                 FOREIGN KEY (user_id) REFERENCES users (id)
             )
         """)
+        create_access_log_indexes(self.cursor)
+        ensure_card_identity_schema(self.cursor)
         self.conn.commit()
 
     def log_access(self, user_id, action):
-        self.cursor.execute("INSERT INTO access_logs (user_id, action) VALUES (?, ?)", 
-                          (user_id, action))
+        if self.audit_writer is not None:
+            self.audit_writer.log_access(user_id, action)
+            return
+        self.cursor.execute(self.INSERT_ACCESS_LOG_SQL, (user_id, action))
         self.conn.commit()
 
+    def log_unregistered_card(self, card_uid):
+        if self.audit_writer is not None:
+            self.audit_writer.log_unregistered_card(card_uid)
+            return
+        with open("unregistered_cards.log", "a") as log_file:
+            log_file.write(f"{card_uid}\n")
+
     # def process_access_request(self, rfid_data, face_path=None):
     #     if not rfid_data["is_recognized"]:
     #         self.log_access(None, "access_denied: unknown_card")
@@ -76,67 +195,179 @@ class AccessControl:
     #         "name": name
     #     }
 
-    def process_access_request(self, rfid_data, face_path=None):
-        print("\n=== Starting Access Request Processing ===")
-        print(f"RFID Data: {rfid_data}")
-        print(f"Face Path: {face_path}")
+    def process_access_request(self, rfid_data, face_path=None, face_frame=None, trace=None,
+                               face_frames=None):
+        """
+        Verify a card swipe, optionally against a face.
+
+        The face is taken from `face_frames` (a burst of in-memory BGR frames,
+        nearest to the swipe first) or `face_frame` when given, otherwise from
+        the image at `face_path`. Stage timings are added to `trace`; when no
+        trace is passed in, one is created and finished here.
+        """
+        if not face_frames and face_frame is not None:
+            face_frames = [face_frame]
+        if trace is not None:
+            return self._process_access_request(rfid_data, face_path, face_frames, trace)
+
+        trace = RequestTrace()
+        try:
+            return self._process_access_request(rfid_data, face_path, face_frames, trace)
+        finally:
+            trace.finish()
+
+    def select_faces(self, frames, trace):
+        """
+        Return (face crops to embed, reason when there are none). Reasons are
+        "no_face", "low_quality" and "no_motion".
+        """
+        if self.quality_gate is not None:
+            with trace.stage("quality_gate"):
+                selection = self.quality_gate.select(frames)
+            logger.debug("Quality gate: %d candidates from %d frames (motion %s)",
+                         len(selection["candidates"]), len(selection["assessments"]), selection["motion"])
+            return selection["candidates"], selection["reason"]
+
+        with trace.stage("face_detect"):
+            face = self.face_detector.crop(frames[0])
+        return ([face], None) if face is not None else ([], "no_face")
+
+    def identify(self, embedding, top_k=1, threshold=None):
+        """1:N search over every enrolled user, through the ANN index when one is set."""
+        index = self.ann_index if self.ann_index is not None else self.gallery
+        return index.identify(embedding, top_k, threshold)
+
+    def find_user_by_card(self, card_uid):
+        """Return the (id, name, face_embedding_id) row for a card, or None."""
+        if self.card_directory is not None:
+            return self.card_directory.lookup(self.conn, card_uid, self.select_user_by_card)
+        if isinstance(card_uid, int):
+            card_uid = format_uid(card_uid)
+        return self.select_user_by_card(card_uid)
+
+    def select_user_by_card(self, card_uid):
+        """Look a card up in the users table itself."""
+        self.cursor.execute(self.USER_BY_CARD_SQL, (card_uid,))
+        return self.cursor.fetchone()
+
+    def _log_decision(self, trace, user_id, action):
+        with trace.stage("log_write"):
+            self.log_access(user_id, action)
+
+    def _process_access_request(self, rfid_data, face_path, face_frames, trace):
+        logger.debug("Processing access request: %s (face path: %s)", rfid_data, face_path)
 
         if not rfid_data["is_recognized"]:
-            print("Card not recognized")
-            self.log_access(None, "access_denied: unknown_card")
+            logger.info("Card not recognized")
+            self._log_decision(trace, None, "access_denied: unknown_card")
             return {"status": "denied", "message": "Unknown card"}
 
         card_uid = rfid_data["uid"]
-        print(f" card_uid : {card_uid}")
-        i = 0
-        if i == 0:
-            self.cursor.execute("SELECT * FROM users")
-            result = self.cursor.fetchone()
-            print(f"result: {result}")
-        self.cursor.execute("SELECT id, name, face_embedding_id FROM users WHERE card_uid = ?", 
-                        (card_uid,))
-        result = self.cursor.fetchone()
+        if self.access_cache is not None:
+            key = rfid_data.get("card_key") or lookup_key(card_uid)
+            door_id = rfid_data.get("door_id")
+            previous = self.access_cache.recent_decision(key, door_id)
+            if previous is not None:
+                logger.debug("Repeated swipe of %s, reusing the last decision", card_uid)
+                # Every opening of the door still gets its audit row
+                if previous["status"] == "granted":
+                    self._log_decision(trace, previous["user_id"], "access_granted: debounced")
+                else:
+                    self._log_decision(trace, None, "access_denied: unknown_card")
+                return dict(previous, debounced=True)
+            response = self._verify_card(rfid_data, card_uid, face_path, face_frames, trace, key)
+            # Face denials are not debounced, so a user can retry right after a false reject
+            if response["status"] == "granted" or response["message"] == self.NOT_REGISTERED_MESSAGE:
+                self.access_cache.remember_decision(key, response, door_id)
+            return response
+        return self._verify_card(rfid_data, card_uid, face_path, face_frames, trace)
+
+    def _verify_card(self, rfid_data, card_uid, face_path, face_frames, trace, key=None):
+        with trace.stage("sql_lookup"):
+            if self.card_directory is not None:
+                # The directory follows users_version; a row cache in front of
+                # it would keep serving deleted or re-assigned cards
+                result = self.find_user_by_card(key if key is not None else card_uid)
+            elif self.access_cache is not None:
+                result = self.access_cache.get_user(key, self.find_user_by_card)
+            else:
+                result = self.find_user_by_card(card_uid)
         if not result:
-            print(f"Card {card_uid} not registered in database")
-            with open("unregistered_cards.log", "a") as log_file:
-                log_file.write(f"{card_uid}\n")
-            self.log_access(None, "access_denied: unknown_card")
-            return {"status": "denied", "message": "Card not registered"}
+            logger.info("Card %s not registered in database", card_uid)
+            with trace.stage("log_write"):
+                self.log_unregistered_card(card_uid)
+            self._log_decision(trace, None, "access_denied: unknown_card")
+            return {"status": "denied", "message": self.NOT_REGISTERED_MESSAGE}
 
         user_id, name, face_embedding_id = result
-        print(f"Found user in database: {name} (ID: {user_id})")
+        logger.debug("Found user in database: %s (ID: %s)", name, user_id)
 
-        if face_path:
-            print("\n=== Starting Face Verification ===")
+        if face_frames or face_path:
             try:
-                print("Extracting face embedding from captured image...")
-                face_embedding = extract_embedding(face_path)
-                print(f"Embedding extracted successfully: {face_embedding[:5]}... (showing first 5 elements)")
-                
-                print("\nSearching for matching face in database...")
-                matched_name = search_face_embedding(self.chroma_db, face_embedding, 1)
-                print(f"Database search result - Matched name: {matched_name}")
-                print(f"Expected name: {name}")
+                if not face_frames:
+                    with trace.stage("image_decode"):
+                        face_frame = cv2.imread(face_path)
+                    if face_frame is None:
+                        raise ValueError(f"could not read image {face_path}")
+                    face_frames = [face_frame]
+
+                # Only run FaceNet on detected faces worth embedding; bail out early without one
+                faces, reason = self.select_faces(face_frames, trace)
+                if reason == "no_face":
+                    logger.info("No face detected in captured image")
+                    self._log_decision(trace, user_id, "access_denied: no_face_detected")
+                    return {"status": "denied", "message": "Face verification failed - No face detected"}
+                if reason == "no_motion":
+                    logger.info("Face did not move across the capture burst")
+                    self._log_decision(trace, user_id, "access_denied: liveness_failed")
+                    return {"status": "denied", "message": "Face verification failed - Liveness check failed"}
+                if not faces:
+                    logger.info("No captured frame was good enough to verify")
+                    self._log_decision(trace, user_id, "access_denied: low_quality")
+                    return {"status": "denied", "message": "Face verification failed - Image quality too low"}
+
+                # Embed the best candidate first; try the runner-up only on a mismatch
+                score = None
+                for face in faces:
+                    with trace.stage("embedding"):
+                        face_embedding = self.embedder(face)
+                    if face_embedding is None:
+                        raise ValueError("could not extract face embedding")
+
+                    with trace.stage("vector_search"):
+                        is_match, candidate_score = self.gallery.verify(user_id, face_embedding, self.match_threshold)
+                    if candidate_score is not None and (score is None or candidate_score > score):
+                        score = candidate_score
+                    if is_match or candidate_score is None:
+                        break
+                logger.debug("Best similarity for %s: %s (threshold %s)", name, score,
+                             self.match_threshold if self.match_threshold is not None else self.gallery.threshold)
                 
-                if not matched_name:
-                    print("No matching face found in database")
-                    self.log_access(user_id, "access_denied: no_face_match")
+                if score is None:
+                    logger.info("No face templates enrolled for %s", name)
+                    self._log_decision(trace, user_id, "access_denied: no_face_match")
                     return {"status": "denied", "message": "Face verification failed - No match found"}
                 
-                if matched_name.lower() != name.lower():
-                    print(f"Face mismatch: Expected {name}, got {matched_name}")
-                    self.log_access(user_id, "access_denied: face_mismatch")
+                if not is_match:
+                    if self.identify_on_mismatch:
+                        with trace.stage("vector_search"):
+                            closest = self.identify(face_embedding, 1)
+                        for other_id, _, other_score in closest:
+                            other_name = self.gallery.user_names.get(other_id, other_id)
+                            logger.info("Closest enrolled user: %s (%.3f)", other_name, other_score)
+                    logger.info("Face mismatch: %s scored %.3f", name, score)
+                    self._log_decision(trace, user_id, "access_denied: face_mismatch")
                     return {"status": "denied", "message": "Face verification failed - Identity mismatch"}
                     
             except Exception as e:
-                print(f"Error during face verification: {str(e)}")
-                self.log_access(user_id, "access_denied: face_verification_error")
+                logger.error("Error during face verification: %s", e)
+                self._log_decision(trace, user_id, "access_denied: face_verification_error")
                 return {"status": "denied", "message": f"Face verification error: {str(e)}"}
         else:
-            print("No face image provided for verification")
+            logger.warning("No face image provided for verification")
 
-        print("\nAccess granted!")
-        self.log_access(user_id, "access_granted")
+        logger.debug("Access granted to %s", name)
+        self._log_decision(trace, user_id, "access_granted")
         return {
             "status": "granted",
             "message": f"Welcome {name}!",
@@ -148,6 +379,7 @@ class AccessControl:
         self.conn.close()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG, format="%(message)s")
     conn = sqlite3.connect("../access_control.db")
     access_control = AccessControl(conn=conn)
     
@@ -0,0 +1,321 @@
+import os
+import sqlite3
+import logging
+import argparse
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+# Per-user history and time-range scans (rollups, retention) both read
+# access_logs by timestamp; denials by reason are answered from the rollups,
+# so action does not need its own index on the write-hot table.
+ACCESS_LOG_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_access_logs_user_time ON access_logs (user_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_access_logs_timestamp ON access_logs (timestamp)",
+]
+
+REPORT_SCHEMA = [
+    # user_key is users.id, or 0 for swipes that matched no user, so that it
+    # can be part of the primary key (NULLs are never equal in a key)
+    """
+    CREATE TABLE IF NOT EXISTS access_log_hourly (
+        hour TEXT NOT NULL,
+        user_key INTEGER NOT NULL,
+        action TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (hour, user_key, action)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_access_log_hourly_action ON access_log_hourly (action, hour)",
+    """
+    CREATE TABLE IF NOT EXISTS report_state (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    """,
+]
+
+ARCHIVE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS archive.access_logs (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        action TEXT NOT NULL,
+        timestamp DATETIME
+    )
+"""
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def create_access_log_indexes(cursor):
+    """Create the access_logs indexes (used by AccessControl.initialize_database)."""
+    for statement in ACCESS_LOG_INDEXES:
+        cursor.execute(statement)
+
+
+def _format_time(value):
+    """Accept a datetime or an already formatted UTC timestamp string."""
+    if value is None or isinstance(value, str):
+        return value
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+class AccessReports:
+    """
+    Reporting and housekeeping over access_logs, run on its own connection.
+
+    Hourly counts per user and action are kept in access_log_hourly and
+    brought up to date incrementally: refresh_rollups() only folds in rows
+    whose id is past the watermark stored in report_state. Reports read the
+    rollups, so they stay cheap however large the raw log gets.
+
+    archive() moves rows older than `retention_days` out of the hot database
+    into one SQLite file per month under `archive_dir`, in small batches so
+    the door path's writer is never blocked for long. Rollups are refreshed
+    first, so hourly counts and denial reports still cover archived months.
+
+    Timestamps are UTC, as written by CURRENT_TIMESTAMP and AuditWriter.
+    """
+
+    def __init__(self, db_path="../access_control.db", archive_dir="access_log_archive",
+                 retention_days=90, batch_size=5000, timeout=30.0):
+        self.db_path = db_path
+        self.archive_dir = archive_dir
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.conn = sqlite3.connect(db_path, timeout=timeout)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.cursor = self.conn.cursor()
+        self.initialize_schema()
+
+    def initialize_schema(self):
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS access_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                action TEXT NOT NULL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        """)
+        create_access_log_indexes(self.cursor)
+        for statement in REPORT_SCHEMA:
+            self.cursor.execute(statement)
+        self.conn.commit()
+
+    def _watermark(self):
+        self.cursor.execute("SELECT value FROM report_state WHERE name = 'hourly_rollup_id'")
+        row = self.cursor.fetchone()
+        return row[0] if row else 0
+
+    def refresh_rollups(self):
+        """
+        Fold access_logs rows added since the last refresh into the hourly
+        rollups.
+
+        Returns:
+            int: Number of log rows folded in
+        """
+        watermark = self._watermark()
+        self.cursor.execute("SELECT MAX(id) FROM access_logs")
+        last_id = self.cursor.fetchone()[0]
+        if last_id is None or last_id <= watermark:
+            return 0
+
+        with self.conn:
+            self.cursor.execute("""
+                INSERT INTO access_log_hourly (hour, user_key, action, count)
+                SELECT strftime('%Y-%m-%d %H:00:00', timestamp), COALESCE(user_id, 0), action, COUNT(*)
+                FROM access_logs
+                WHERE id > ? AND id <= ?
+                GROUP BY 1, 2, 3
+                ON CONFLICT (hour, user_key, action) DO UPDATE SET count = count + excluded.count
+            """, (watermark, last_id))
+            self.cursor.execute("SELECT COUNT(*) FROM access_logs WHERE id > ? AND id <= ?",
+                                (watermark, last_id))
+            folded = self.cursor.fetchone()[0]
+            self.cursor.execute("""
+                INSERT INTO report_state (name, value) VALUES ('hourly_rollup_id', ?)
+                ON CONFLICT (name) DO UPDATE SET value = excluded.value
+            """, (last_id,))
+        logger.debug("Rolled up %d access log rows (up to id %d)", folded, last_id)
+        return folded
+
+    def user_history(self, user_id, since=None, until=None, limit=100):
+        """
+        Most recent access decisions for one user still in the hot database.
+
+        Returns:
+            list: (timestamp, action) tuples, newest first
+        """
+        query = "SELECT timestamp, action FROM access_logs WHERE user_id = ?"
+        params = [user_id]
+        if since is not None:
+            query += " AND timestamp >= ?"
+            params.append(_format_time(since))
+        if until is not None:
+            query += " AND timestamp < ?"
+            params.append(_format_time(until))
+        query += " ORDER BY timestamp DESC LIMIT ?"
+        params.append(limit)
+        self.cursor.execute(query, params)
+        return self.cursor.fetchall()
+
+    def denials_by_reason(self, since=None, until=None, user_id=None):
+        """
+        Denied requests per reason, e.g. {"face_mismatch": 12, "unknown_card": 40}.
+        """
+        self.refresh_rollups()
+        query = """
+            SELECT action, SUM(count) FROM access_log_hourly
+            WHERE action LIKE 'access_denied%'
+        """
+        query, params = self._filter_rollups(query, since, until, user_id)
+        self.cursor.execute(query + " GROUP BY action ORDER BY 2 DESC", params)
+        return {
+            action.split(": ", 1)[-1] if ": " in action else action: total
+            for action, total in self.cursor.fetchall()
+        }
+
+    def hourly_counts(self, since=None, until=None, user_id=None):
+        """
+        Granted and denied counts per hour.
+
+        Returns:
+            list: (hour, granted, denied) tuples, oldest first
+        """
+        self.refresh_rollups()
+        query = """
+            SELECT hour,
+                   SUM(CASE WHEN action LIKE 'access_granted%' THEN count ELSE 0 END),
+                   SUM(CASE WHEN action LIKE 'access_denied%' THEN count ELSE 0 END)
+            FROM access_log_hourly WHERE 1 = 1
+        """
+        query, params = self._filter_rollups(query, since, until, user_id)
+        self.cursor.execute(query + " GROUP BY hour ORDER BY hour", params)
+        return self.cursor.fetchall()
+
+    @staticmethod
+    def _filter_rollups(query, since, until, user_id):
+        params = []
+        if since is not None:
+            query += " AND hour >= strftime('%Y-%m-%d %H:00:00', ?)"
+            params.append(_format_time(since))
+        if until is not None:
+            query += " AND hour < ?"
+            params.append(_format_time(until))
+        if user_id is not None:
+            query += " AND user_key = ?"
+            params.append(user_id)
+        return query, params
+
+    def archive_path(self, month):
+        return os.path.join(self.archive_dir, f"access_logs_{month}.db")
+
+    def archive(self, retention_days=None, now=None):
+        """
+        Move rows older than the retention period into monthly archive files
+        (access_logs_YYYY-MM.db) and delete them from the hot database.
+
+        Returns:
+            dict: Rows archived per month
+        """
+        retention_days = self.retention_days if retention_days is None else retention_days
+        now = now or datetime.now(timezone.utc)
+        cutoff = _format_time(now - timedelta(days=retention_days))
+
+        # Archived rows must be counted before they leave the hot table
+        self.refresh_rollups()
+
+        self.cursor.execute(
+            "SELECT DISTINCT substr(timestamp, 1, 7) FROM access_logs WHERE timestamp < ?", (cutoff,)
+        )
+        months = [row[0] for row in self.cursor.fetchall()]
+        if not months:
+            return {}
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        archived = {}
+        for month in sorted(months):
+            archived[month] = self._archive_month(month, cutoff)
+            logger.info("Archived %d access log rows for %s to %s",
+                        archived[month], month, self.archive_path(month))
+        return archived
+
+    def _archive_month(self, month, cutoff):
+        self.cursor.execute("ATTACH DATABASE ? AS archive", (self.archive_path(month),))
+        try:
+            self.cursor.execute(ARCHIVE_SCHEMA)
+            moved = 0
+            while True:
+                # One short write transaction per batch keeps door-path
+                # inserts from waiting behind a long delete
+                with self.conn:
+                    self.cursor.execute("""
+                        SELECT id FROM access_logs
+                        WHERE timestamp < ? AND substr(timestamp, 1, 7) = ?
+                        ORDER BY id LIMIT ?
+                    """, (cutoff, month, self.batch_size))
+                    ids = [row[0] for row in self.cursor.fetchall()]
+                    if not ids:
+                        break
+                    placeholders = ",".join("?" * len(ids))
+                    self.cursor.execute(f"""
+                        INSERT OR IGNORE INTO archive.access_logs (id, user_id, action, timestamp)
+                        SELECT id, user_id, action, timestamp FROM access_logs WHERE id IN ({placeholders})
+                    """, ids)
+                    self.cursor.execute(f"DELETE FROM access_logs WHERE id IN ({placeholders})", ids)
+                moved += len(ids)
+            return moved
+        finally:
+            self.cursor.execute("DETACH DATABASE archive")
+
+    def maintain(self):
+        """Refresh rollups and apply retention; meant to run from cron or a timer."""
+        folded = self.refresh_rollups()
+        archived = self.archive()
+        return {"rolled_up": folded, "archived": archived}
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Access log reports and retention")
+    parser.add_argument("--db", default="access_control.db", help="Access control database")
+    parser.add_argument("--archive-dir", default="access_log_archive")
+    parser.add_argument("--retention-days", type=int, default=90)
+    parser.add_argument("--since", help="UTC start, e.g. '2024-12-01 00:00:00'")
+    parser.add_argument("--until", help="UTC end (exclusive)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("maintain", help="Refresh rollups and archive old rows")
+    history = subparsers.add_parser("history", help="Recent decisions for one user")
+    history.add_argument("user_id", type=int)
+    history.add_argument("--limit", type=int, default=50)
+    subparsers.add_parser("denials", help="Denied requests by reason")
+    hourly = subparsers.add_parser("hourly", help="Granted/denied counts per hour")
+    hourly.add_argument("--user-id", type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    reports = AccessReports(args.db, archive_dir=args.archive_dir, retention_days=args.retention_days)
+    try:
+        if args.command == "maintain":
+            print(reports.maintain())
+        elif args.command == "history":
+            for timestamp, action in reports.user_history(args.user_id, args.since, args.until, args.limit):
+                print(f"{timestamp}  {action}")
+        elif args.command == "denials":
+            for reason, total in reports.denials_by_reason(args.since, args.until).items():
+                print(f"{reason:30s} {total}")
+        elif args.command == "hourly":
+            for hour, granted, denied in reports.hourly_counts(args.since, args.until, args.user_id):
+                print(f"{hour}  granted={granted}  denied={denied}")
+    finally:
+        reports.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,640 @@
+"""
+Approximate nearest-neighbour indexes for 1:N identification over very
+large galleries, kept alongside the Chroma store.
+
+Two index kinds share one interface (add, on_enrollment, identify, save,
+load_ann_index):
+
+    ivf   inverted file over spherical k-means lists, pure numpy. Recall
+          versus latency is tuned with `nprobe` (lists scanned per query)
+          and `nlist` (lists built). Saved as .npy files that load
+          memory-mapped, so opening a 1M-template index reads only its
+          small metadata.
+
+Each save writes its files under new, generation-tagged names and then
+replaces meta.json, which lists the files of its generation; a reader
+that opens the index mid-save still gets one consistent generation.
+    hnsw  hnswlib graph (optional dependency: pip install hnswlib), tuned
+          with `ef_search`, `M` and `ef_construction`. Its graph is loaded
+          into memory.
+
+Usage:
+    python reasoning/ann_index.py build --db access_control.db --chroma-dir chroma_db_test --out ann_index
+    python reasoning/ann_index.py info ann_index
+"""
+import sys
+import os
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+import json
+import math
+import time
+import logging
+import argparse
+import threading
+import numpy as np
+from reasoning.gallery_index import GalleryIndex
+
+logger = logging.getLogger(__name__)
+
+META_FILE = "meta.json"
+
+
+def default_nlist(count):
+    """About 4 * sqrt(n) lists, the usual starting point for IVF."""
+    return int(max(1, min(65536, 4 * math.sqrt(max(count, 1)))))
+
+
+def assign_lists(vectors, centroids, chunk_size=8192):
+    """Index of the most similar centroid for every (normalized) vector."""
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+        assignments[start:start + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def spherical_kmeans(vectors, k, iterations=10, seed=0):
+    """k-means on the unit sphere (cosine similarity); returns normalized centroids."""
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)]
+    for _ in range(iterations):
+        assignments = assign_lists(vectors, centroids)
+        counts = np.bincount(assignments, minlength=k)
+        order = np.argsort(assignments, kind="stable")
+        nonempty = np.flatnonzero(counts)
+        starts = (np.cumsum(counts) - counts)[nonempty]
+        sums = np.zeros_like(centroids)
+        sums[nonempty] = np.add.reduceat(vectors[order], starts, axis=0)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed dead lists with random vectors
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        centroids = GalleryIndex.normalize(sums)
+    return centroids
+
+
+def _write_array(directory, name, array, generation):
+    """Save `array` under a name tagged with the save generation; returns the file name."""
+    file_name = f"{name}.{generation}.npy"
+    tmp_path = os.path.join(directory, file_name + ".tmp.npy")
+    np.save(tmp_path, array)
+    os.replace(tmp_path, os.path.join(directory, file_name))
+    return file_name
+
+
+def _read_array(directory, files, name, mmap=False):
+    return np.load(os.path.join(directory, files[name]), mmap_mode="r" if mmap else None)
+
+
+def _meta_files(directory, meta):
+    """The files a meta.json refers to, by array name."""
+    if "files" in meta:
+        return meta["files"]
+    # Saved before files were generation-tagged: one plain-named file per array
+    files = {}
+    for file_name in os.listdir(directory):
+        name, extension = os.path.splitext(file_name)
+        if extension in (".npy", ".bin") and "." not in name:
+            files[name] = file_name
+    return files
+
+
+def _saved_generation(directory):
+    """(generation, files) of the index currently saved in `directory`, or (0, {})."""
+    try:
+        with open(os.path.join(directory, META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+    except (OSError, ValueError):
+        return 0, {}
+    return meta.get("generation", 0), _meta_files(directory, meta)
+
+
+class AnnIndex:
+    """
+    Row bookkeeping shared by the index kinds.
+
+    Every added vector gets the next row number. Rows keep their owner's
+    users.id and face_embeddings.face_embedding_id, so results have the
+    same (user_id, face_embedding_id, score) shape as
+    GalleryIndex.identify. Re-adding a face_embedding_id (re-embedding
+    after an image changed) retires its old row.
+    """
+
+    kind = None
+
+    def __init__(self, dim=512):
+        self.dim = dim
+        self.removed = 0
+        self._user_ids = np.empty(0, dtype=np.int64)
+        self._embedding_ids = np.empty(0, dtype="S36")
+        self._new_user_ids = []
+        self._new_embedding_ids = []
+        self._deleted = set()
+        self._row_by_embedding_id = None
+        # Directory the index was last saved to or loaded from; files there
+        # that still hold unchanged arrays are not written again
+        self._directory = None
+        self._lock = threading.RLock()
+
+    @property
+    def count(self):
+        """Rows ever added, including retired ones."""
+        return len(self._user_ids) + len(self._new_user_ids)
+
+    def __len__(self):
+        return self.count - self.removed
+
+    def options(self):
+        """Constructor options, saved with the index."""
+        return {}
+
+    def _owner(self, row):
+        stored = len(self._user_ids)
+        if row < stored:
+            return int(self._user_ids[row]), self._embedding_ids[row].decode()
+        return self._new_user_ids[row - stored], self._new_embedding_ids[row - stored]
+
+    def _rows_by_embedding_id(self):
+        # Built on first add so that a loaded index can be searched without it
+        if self._row_by_embedding_id is None:
+            rows = {embedding_id.decode(): row for row, embedding_id in enumerate(self._embedding_ids)}
+            stored = len(self._embedding_ids)
+            rows.update((embedding_id, stored + i) for i, embedding_id in enumerate(self._new_embedding_ids))
+            self._row_by_embedding_id = rows
+        return self._row_by_embedding_id
+
+    def add(self, user_id, embedding_ids, embeddings, name=None):
+        """
+        Add templates, like GalleryIndex.add.
+
+        Args:
+            user_id (int or list): users.id of every template, or one per template
+            embedding_ids (list): face_embeddings.face_embedding_id of each template
+            embeddings (list): One embedding per id
+            name (str): Accepted for listener compatibility; names are not stored
+        """
+        embedding_ids = list(embedding_ids)
+        if not embedding_ids:
+            return
+        vectors = GalleryIndex.normalize(embeddings)
+        if vectors.shape != (len(embedding_ids), self.dim):
+            raise ValueError(f"Expected {len(embedding_ids)} embeddings of size {self.dim}, "
+                             f"got shape {vectors.shape}")
+        user_ids = np.broadcast_to(np.asarray(user_id, dtype=np.int64), (len(embedding_ids),))
+
+        with self._lock:
+            rows_by_id = self._rows_by_embedding_id()
+            replaced = [rows_by_id[embedding_id] for embedding_id in embedding_ids if embedding_id in rows_by_id]
+            rows = np.arange(self.count, self.count + len(embedding_ids), dtype=np.int64)
+            self._new_user_ids.extend(int(owner) for owner in user_ids)
+            self._new_embedding_ids.extend(embedding_ids)
+            rows_by_id.update(zip(embedding_ids, rows.tolist()))
+            if replaced:
+                self.remove_rows(replaced)
+            self._add_vectors(rows, vectors)
+
+    def on_enrollment(self, user_id, name, card_uid, embedding_ids, embeddings):
+        """Enrollment listener (see EnhancedDatabaseManager.add_enrollment_listener)."""
+        self.add(user_id, embedding_ids, embeddings, name=name)
+
+    def remove(self, embedding_ids):
+        """Retire the rows of face_embedding_ids that were deleted."""
+        with self._lock:
+            rows_by_id = self._rows_by_embedding_id()
+            self.remove_rows([rows_by_id.pop(embedding_id) for embedding_id in embedding_ids
+                              if embedding_id in rows_by_id])
+
+    def remove_rows(self, rows):
+        rows = [row for row in rows if row not in self._deleted]
+        if rows:
+            self._deleted.update(rows)
+            self.removed += len(rows)
+            self._remove_vectors(rows)
+
+    def build(self):
+        """Re-organize after a bulk load; a no-op for graph indexes."""
+
+    def identify(self, embedding, top_k=1, threshold=None):
+        """
+        1:N search of a probe embedding.
+
+        Returns:
+            list: (user_id, face_embedding_id, score) tuples, best first
+        """
+        probe = GalleryIndex.normalize(embedding)[0]
+        with self._lock:
+            rows, scores = self._search(probe, top_k)
+            results = [self._owner(int(row)) + (float(score),) for row, score in zip(rows, scores)]
+        if threshold is not None:
+            results = [result for result in results if result[2] >= threshold]
+        return results
+
+    def save(self, directory):
+        """
+        Write the index to `directory`. Files that changed are written under
+        the next generation's names, then meta.json is replaced to point at
+        them; files of the previous generation are kept for readers that
+        opened it just before.
+        """
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            previous_generation, previous = _saved_generation(directory)
+            generation = previous_generation + 1
+            files = dict(previous) if self._directory == os.path.abspath(directory) else {}
+            if self._new_user_ids:
+                self._user_ids = np.concatenate([np.asarray(self._user_ids), np.asarray(self._new_user_ids, dtype=np.int64)])
+                new_ids = np.asarray([embedding_id.encode() for embedding_id in self._new_embedding_ids])
+                self._embedding_ids = np.concatenate([np.asarray(self._embedding_ids), new_ids])
+                self._new_user_ids, self._new_embedding_ids = [], []
+                files["user_ids"] = _write_array(directory, "user_ids", self._user_ids, generation)
+                files["embedding_ids"] = _write_array(directory, "embedding_ids", self._embedding_ids, generation)
+            elif "user_ids" not in files:
+                files["user_ids"] = _write_array(directory, "user_ids", np.asarray(self._user_ids), generation)
+                files["embedding_ids"] = _write_array(directory, "embedding_ids",
+                                                      np.asarray(self._embedding_ids), generation)
+            files["deleted"] = _write_array(directory, "deleted",
+                                            np.asarray(sorted(self._deleted), dtype=np.int64), generation)
+            self._save_vectors(directory, files, generation)
+            meta = {
+                "kind": self.kind,
+                "dim": self.dim,
+                "count": self.count,
+                "removed": self.removed,
+                "options": self.options(),
+                "state": self._state(),
+                "generation": generation,
+                "files": files,
+                "saved_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            tmp_path = os.path.join(directory, META_FILE + ".tmp")
+            with open(tmp_path, "w") as meta_file:
+                json.dump(meta, meta_file, indent=2)
+            os.replace(tmp_path, os.path.join(directory, META_FILE))
+            self._directory = os.path.abspath(directory)
+        self._prune(directory, set(files.values()) | set(previous.values()))
+
+    @staticmethod
+    def _prune(directory, keep):
+        """Remove index files that neither of the last two generations uses."""
+        for file_name in os.listdir(directory):
+            if file_name.endswith((".npy", ".bin")) and ".tmp" not in file_name and file_name not in keep:
+                try:
+                    os.remove(os.path.join(directory, file_name))
+                except OSError:
+                    pass
+
+    def _load(self, directory, meta, mmap):
+        files = _meta_files(directory, meta)
+        self.removed = meta["removed"]
+        self._user_ids = _read_array(directory, files, "user_ids", mmap)
+        self._embedding_ids = _read_array(directory, files, "embedding_ids", mmap)
+        self._deleted = set(_read_array(directory, files, "deleted").tolist())
+        self._load_vectors(directory, files, meta.get("state", {}), mmap)
+        self._directory = os.path.abspath(directory)
+
+    def _state(self):
+        return {}
+
+    def _add_vectors(self, rows, vectors):
+        raise NotImplementedError
+
+    def _remove_vectors(self, rows):
+        raise NotImplementedError
+
+    def _search(self, probe, top_k):
+        raise NotImplementedError
+
+    def _save_vectors(self, directory):
+        raise NotImplementedError
+
+    def _load_vectors(self, directory, state, mmap):
+        raise NotImplementedError
+
+
+class IVFIndex(AnnIndex):
+    """
+    Inverted-file index: vectors are grouped into `nlist` lists around
+    spherical k-means centroids and stored contiguously per list; a query
+    scans only the `nprobe` lists whose centroids are closest.
+
+    New vectors go to an exactly-scanned delta until it reaches
+    `rebuild_ratio` of the packed vectors, then they are merged into their
+    lists. Lists are re-trained once the index has grown `retrain_factor`
+    times past the size they were trained on. Retired rows are skipped at
+    query time and dropped at the next merge. `dtype="float16"` halves
+    memory and disk use at a small cost in score precision.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, dim=512, nlist=None, nprobe=16, min_train_size=1024, rebuild_ratio=0.25,
+                 retrain_factor=4.0, dtype="float32", seed=0):
+        super().__init__(dim)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.rebuild_ratio = rebuild_ratio
+        self.retrain_factor = retrain_factor
+        self.dtype = np.dtype(dtype)
+        self.seed = seed
+        self.trained_on = 0
+        self.centroids = None
+        self._base = np.empty((0, dim), dtype=self.dtype)
+        self._base_rows = np.empty(0, dtype=np.int64)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._delta_chunks = []
+        self._delta_row_chunks = []
+        self._base_dirty = False
+
+    def options(self):
+        return {"nlist": self.nlist, "nprobe": self.nprobe, "min_train_size": self.min_train_size,
+                "rebuild_ratio": self.rebuild_ratio, "retrain_factor": self.retrain_factor,
+                "dtype": self.dtype.name, "seed": self.seed}
+
+    def _state(self):
+        return {"trained": self.centroids is not None, "trained_on": self.trained_on}
+
+    def _delta(self):
+        if len(self._delta_chunks) > 1:
+            self._delta_chunks = [np.concatenate(self._delta_chunks)]
+            self._delta_row_chunks = [np.concatenate(self._delta_row_chunks)]
+        if not self._delta_chunks:
+            return np.empty((0, self.dim), dtype=np.float32), np.empty(0, dtype=np.int64)
+        return self._delta_chunks[0], self._delta_row_chunks[0]
+
+    def _delta_size(self):
+        return sum(len(rows) for rows in self._delta_row_chunks)
+
+    def _add_vectors(self, rows, vectors):
+        self._delta_chunks.append(vectors)
+        self._delta_row_chunks.append(rows)
+        if self.centroids is None:
+            if len(self) >= self.min_train_size:
+                self.build()
+        elif len(self) > self.retrain_factor * self.trained_on:
+            self.build()
+        elif self._delta_size() > self.rebuild_ratio * max(len(self._base_rows), self.min_train_size):
+            self._merge_delta()
+
+    def _remove_vectors(self, rows):
+        pass  # tombstones in self._deleted are skipped by _search
+
+    def _live(self, vectors, rows, lists=None):
+        if not self._deleted:
+            return vectors, rows, lists
+        keep = ~np.isin(rows, np.fromiter(self._deleted, dtype=np.int64))
+        return vectors[keep], rows[keep], lists[keep] if lists is not None else None
+
+    def build(self):
+        """Train the lists on every live vector and pack them."""
+        with self._lock:
+            delta, delta_rows = self._delta()
+            vectors = np.concatenate([np.asarray(self._base, dtype=np.float32), delta])
+            rows = np.concatenate([np.asarray(self._base_rows), delta_rows])
+            vectors, rows, _ = self._live(vectors, rows)
+            if not len(rows):
+                return
+            start = time.perf_counter()
+            nlist = min(self.nlist or default_nlist(len(rows)), len(rows))
+            rng = np.random.default_rng(self.seed)
+            sample_size = min(len(rows), max(nlist * 32, 10000), 200000)
+            sample = vectors[rng.choice(len(rows), sample_size, replace=False)]
+            self.centroids = spherical_kmeans(sample, nlist, seed=self.seed)
+            self._pack(vectors, rows, assign_lists(vectors, self.centroids))
+            self.trained_on = len(rows)
+            logger.info("Trained IVF index: %d vectors in %d lists in %.1fs",
+                        len(rows), nlist, time.perf_counter() - start)
+
+    def _merge_delta(self):
+        base_lists = np.repeat(np.arange(len(self.centroids)), np.diff(self._offsets))
+        delta, delta_rows = self._delta()
+        vectors = np.concatenate([np.asarray(self._base, dtype=np.float32), delta])
+        rows = np.concatenate([np.asarray(self._base_rows), delta_rows])
+        lists = np.concatenate([base_lists, assign_lists(delta, self.centroids)])
+        self._pack(*self._live(vectors, rows, lists))
+
+    def _pack(self, vectors, rows, lists):
+        order = np.argsort(lists, kind="stable")
+        self._base = vectors[order].astype(self.dtype)
+        self._base_rows = rows[order]
+        self._offsets = np.searchsorted(lists[order], np.arange(len(self.centroids) + 1)).astype(np.int64)
+        self._delta_chunks, self._delta_row_chunks = [], []
+        self._deleted = set()
+        self._base_dirty = True
+
+    def _search(self, probe, top_k):
+        score_parts, row_parts = [], []
+        if self.centroids is not None and len(self._base_rows):
+            nprobe = min(self.nprobe, len(self.centroids))
+            lists = np.argpartition(-(self.centroids @ probe), nprobe - 1)[:nprobe]
+            for index in lists:
+                start, end = self._offsets[index], self._offsets[index + 1]
+                if end > start:
+                    score_parts.append(self._base[start:end] @ probe)
+                    row_parts.append(self._base_rows[start:end])
+        delta, delta_rows = self._delta()
+        if len(delta_rows):
+            score_parts.append(delta @ probe)
+            row_parts.append(delta_rows)
+        if not row_parts:
+            return [], []
+
+        scores, rows, _ = self._live(np.concatenate(score_parts), np.concatenate(row_parts))
+        if not len(rows):
+            return [], []
+        top_k = min(top_k, len(rows))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return rows[top], scores[top]
+
+    def _save_vectors(self, directory, files, generation):
+        if self.centroids is not None and (self._base_dirty or "base" not in files):
+            files["centroids"] = _write_array(directory, "centroids", self.centroids, generation)
+            files["base"] = _write_array(directory, "base", np.asarray(self._base), generation)
+            files["base_rows"] = _write_array(directory, "base_rows", np.asarray(self._base_rows), generation)
+            files["offsets"] = _write_array(directory, "offsets", self._offsets, generation)
+            self._base_dirty = False
+        delta, delta_rows = self._delta()
+        files["delta"] = _write_array(directory, "delta", delta, generation)
+        files["delta_rows"] = _write_array(directory, "delta_rows", delta_rows, generation)
+
+    def _load_vectors(self, directory, files, state, mmap):
+        self.trained_on = state.get("trained_on", 0)
+        if state.get("trained"):
+            self.centroids = _read_array(directory, files, "centroids")
+            self._base = _read_array(directory, files, "base", mmap)
+            self._base_rows = _read_array(directory, files, "base_rows", mmap)
+            self._offsets = _read_array(directory, files, "offsets")
+        delta, delta_rows = _read_array(directory, files, "delta"), _read_array(directory, files, "delta_rows")
+        if len(delta_rows):
+            self._delta_chunks, self._delta_row_chunks = [delta], [delta_rows]
+
+
+class HNSWIndex(AnnIndex):
+    """
+    hnswlib graph over inner product (cosine on normalized vectors).
+    `ef_search` trades latency for recall at query time; `M` and
+    `ef_construction` set graph quality when vectors are added. Retired
+    rows are marked deleted in the graph.
+    """
+
+    kind = "hnsw"
+
+    def __init__(self, dim=512, M=16, ef_construction=200, ef_search=64, initial_capacity=1024):
+        super().__init__(dim)
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.initial_capacity = initial_capacity
+        self._index = None
+
+    def options(self):
+        return {"M": self.M, "ef_construction": self.ef_construction, "ef_search": self.ef_search,
+                "initial_capacity": self.initial_capacity}
+
+    @staticmethod
+    def _hnswlib():
+        try:
+            import hnswlib
+        except ImportError as e:
+            raise ImportError("The hnsw index needs hnswlib: pip install hnswlib") from e
+        return hnswlib
+
+    def _ensure_capacity(self, needed):
+        if self._index is None:
+            self._index = self._hnswlib().Index(space="ip", dim=self.dim)
+            self._index.init_index(max_elements=max(self.initial_capacity, needed),
+                                   ef_construction=self.ef_construction, M=self.M)
+        elif needed > self._index.get_max_elements():
+            self._index.resize_index(max(needed, 2 * self._index.get_max_elements()))
+
+    def _add_vectors(self, rows, vectors):
+        self._ensure_capacity(self.count)
+        self._index.add_items(vectors, rows)
+
+    def _remove_vectors(self, rows):
+        for row in rows:
+            self._index.mark_deleted(int(row))
+
+    def _search(self, probe, top_k):
+        if self._index is None or len(self) == 0:
+            return [], []
+        top_k = min(top_k, len(self))
+        self._index.set_ef(max(self.ef_search, top_k))
+        labels, distances = self._index.knn_query(probe.reshape(1, -1), k=top_k)
+        return labels[0].astype(np.int64), 1.0 - distances[0]
+
+    def _save_vectors(self, directory, files, generation):
+        if self._index is not None:
+            file_name = f"hnsw.{generation}.bin"
+            tmp_path = os.path.join(directory, file_name + ".tmp")
+            self._index.save_index(tmp_path)
+            os.replace(tmp_path, os.path.join(directory, file_name))
+            files["hnsw"] = file_name
+
+    def _load_vectors(self, directory, files, state, mmap):
+        if "hnsw" in files:
+            path = os.path.join(directory, files["hnsw"])
+            self._index = self._hnswlib().Index(space="ip", dim=self.dim)
+            self._index.load_index(path, max_elements=max(self.count, self.initial_capacity))
+
+
+ANN_INDEXES = {
+    "ivf": IVFIndex,
+    "hnsw": HNSWIndex,
+}
+
+
+def create_ann_index(kind="ivf", dim=512, **options):
+    """Create an empty index of the given kind; None options keep their defaults."""
+    if kind not in ANN_INDEXES:
+        raise ValueError(f"Unknown ANN index {kind!r}, expected one of {sorted(ANN_INDEXES)}")
+    return ANN_INDEXES[kind](dim=dim, **{name: value for name, value in options.items() if value is not None})
+
+
+def load_ann_index(directory, mmap=True, **overrides):
+    """
+    Open a saved index. `overrides` replace saved options that only affect
+    queries, e.g. nprobe or ef_search.
+    """
+    with open(os.path.join(directory, META_FILE)) as meta_file:
+        meta = json.load(meta_file)
+    index = create_ann_index(meta["kind"], dim=meta["dim"], **dict(meta["options"], **overrides))
+    start = time.perf_counter()
+    index._load(directory, meta, mmap)
+    logger.info("Loaded %s index with %d templates from %s in %.3fs",
+                meta["kind"], len(index), directory, time.perf_counter() - start)
+    return index
+
+
+def build_from_stores(conn, chroma_db, kind="ivf", dim=512, chunk_size=1000, **options):
+    """Build an index from the face_embeddings table and the vectors held in Chroma."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT face_embedding_id, user_id FROM face_embeddings")
+    owners = dict(cursor.fetchall())
+    index = create_ann_index(kind, dim=dim, **options)
+    ids = list(owners)
+    for start in range(0, len(ids), chunk_size):
+        result = chroma_db.get(ids=ids[start:start + chunk_size], include=["embeddings"])
+        if result["ids"]:
+            index.add([owners[embedding_id] for embedding_id in result["ids"]], result["ids"], result["embeddings"])
+    index.build()
+    return index
+
+
+def open_ann_index(directory, conn, chroma_db, kind="ivf", **options):
+    """Load the index saved in `directory`, building and saving it from the stores the first time."""
+    if os.path.exists(os.path.join(directory, META_FILE)):
+        return load_ann_index(directory)
+    logger.info("No ANN index in %s yet, building it from the stores...", directory)
+    index = build_from_stores(conn, chroma_db, kind=kind, **options)
+    index.save(directory)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the 1:N identification index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Build an index from SQLite and Chroma")
+    build.add_argument("--db", default="access_control.db")
+    build.add_argument("--chroma-dir", default="chroma_db_test")
+    build.add_argument("--out", default="ann_index", help="Directory to write the index to")
+    build.add_argument("--kind", choices=sorted(ANN_INDEXES), default="ivf")
+    build.add_argument("--nlist", type=int, help="IVF lists (default about 4 * sqrt(n))")
+    build.add_argument("--nprobe", type=int, help="IVF lists scanned per query")
+    build.add_argument("--dtype", choices=["float32", "float16"], help="IVF vector storage")
+    build.add_argument("--M", type=int, help="HNSW graph degree")
+    build.add_argument("--ef-construction", type=int)
+    build.add_argument("--ef-search", type=int)
+    info = commands.add_parser("info", help="Print a saved index's metadata")
+    info.add_argument("directory")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.command == "info":
+        with open(os.path.join(args.directory, META_FILE)) as meta_file:
+            print(meta_file.read())
+        return
+
+    import sqlite3
+    from langchain_community.vectorstores import Chroma
+    from reasoning.face_recognition_model import get_embeddings
+
+    if args.kind == "ivf":
+        options = {"nlist": args.nlist, "nprobe": args.nprobe, "dtype": args.dtype}
+    else:
+        options = {"M": args.M, "ef_construction": args.ef_construction, "ef_search": args.ef_search}
+    conn = sqlite3.connect(args.db)
+    try:
+        chroma_db = Chroma(persist_directory=args.chroma_dir, embedding_function=get_embeddings())
+        index = build_from_stores(conn, chroma_db, kind=args.kind, **options)
+    finally:
+        conn.close()
+    index.save(args.out)
+    print(f"Saved {args.kind} index with {len(index)} templates to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
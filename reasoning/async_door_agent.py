@@ -0,0 +1,371 @@
+"""
+asyncio runtime for one or more doors, as an alternative to
+AccessControlSystem.run and MultiDoorAccessSystem.run.
+
+Each swipe flows through stages joined by bounded asyncio queues:
+
+    serial  event-loop readers on every reader's file descriptor; each
+            completed line is parsed and queued without a thread or poll
+    capture picks the frames around the swipe from the door's ring buffer
+    verify  runs AccessControl (or a RemoteAccessControl) on a small
+            executor, `verify_concurrency` requests at a time
+    log     records per-door stats and writes the decisions' access log
+            rows and card log lines in batches on one writer thread
+
+Cameras are still drained by a FrameGrabber thread each: OpenCV captures
+expose no descriptor the event loop could wait on.
+
+Usage:
+    python reasoning/async_door_agent.py doors.json
+"""
+import sys
+import os
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+import json
+import time
+import signal
+import sqlite3
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import local
+from reasoning.access_control import AccessControl
+from reasoning.access_cache import AccessCache
+from reasoning.card_identity import CardDirectory
+from reasoning.audit_writer import AuditWriter, access_event, line_event
+from reasoning.face_recognition_model import warm_up
+from reasoning.multi_door import DoorLane, build_lanes
+from reasoning.quality_gate import QualityGate
+from reasoning.tracing import RequestTrace, get_registry
+from reasoning.verification_client import VerificationClient, RemoteAccessControl
+
+logger = logging.getLogger(__name__)
+
+
+class DecisionLog:
+    """
+    Audit writer stand-in for one request: AccessControl's log calls are
+    kept as events and handed to the log stage with the decision.
+    """
+
+    def __init__(self, unregistered_log="unregistered_cards.log"):
+        self.unregistered_log = unregistered_log
+        self.events = []
+
+    def log_access(self, user_id, action):
+        self.events.append(access_event(user_id, action))
+
+    def log_unregistered_card(self, card_uid):
+        self.events.append(line_event(self.unregistered_log, card_uid))
+
+    def append_line(self, path, line):
+        self.events.append(line_event(path, line))
+
+
+class AsyncDoorAgent:
+    """
+    Serves doors from a single event loop.
+
+    Every stage has a fixed number of tasks, which is its concurrency
+    limit, and every queue is bounded. A swipe arriving while the capture
+    queue is full is dropped and counted; the later stages apply
+    backpressure by awaiting room downstream. Requests of one door are
+    verified one at a time and in swipe order.
+
+    Shutdown (SIGINT/SIGTERM or stop()) removes the serial readers, lets
+    the queued swipes drain through every stage for up to `drain_timeout`
+    seconds, then cancels the stage tasks and closes the doors.
+    """
+
+    def __init__(self, doors, db_path="../access_control.db", chroma_dir="chroma_db_test",
+                 verify_concurrency=2, queue_size=32, log_batch_size=64, debounce_window=1.5,
+                 match_mode="all", use_quality_gate=True, verification_socket=None,
+                 drain_timeout=5.0, stats_interval=60, snapshot_dir=None, ann_index_dir=None,
+                 quality_gate_options=None):
+        self.lanes = {lane.door_id: lane for lane in doors}
+        self.db_path = db_path
+        self.chroma_dir = chroma_dir
+        self.verify_concurrency = verify_concurrency
+        self.queue_size = queue_size
+        self.log_batch_size = log_batch_size
+        self.match_mode = match_mode
+        self.quality_gate = QualityGate(**(quality_gate_options or {})) if use_quality_gate else None
+        self.verification_socket = verification_socket
+        self.snapshot_dir = snapshot_dir
+        self.ann_index_dir = ann_index_dir
+        self.drain_timeout = drain_timeout
+        self.stats_interval = stats_interval
+        self.access_cache = AccessCache(debounce_window=debounce_window)
+        self.card_directory = CardDirectory()
+        self.audit_writer = AuditWriter(db_path)
+        self.chroma_db = self.gallery = self.ann_index = None
+        self._local = local()
+        self._engines = []
+        self._stop = None
+
+    @classmethod
+    def from_config(cls, config_path):
+        """Build the agent from the same JSON file MultiDoorAccessSystem.from_config reads."""
+        with open(config_path) as config_file:
+            config = json.load(config_file)
+
+        return cls(
+            build_lanes(config),
+            db_path=config.get("db_path", "../access_control.db"),
+            chroma_dir=config.get("chroma_dir", "chroma_db_test"),
+            verify_concurrency=config.get("verify_concurrency", config.get("workers", 2)),
+            queue_size=config.get("queue_size", 32),
+            debounce_window=config.get("debounce_window", 1.5),
+            match_mode=config.get("match_mode", "all"),
+            use_quality_gate=config.get("quality_gate", True),
+            quality_gate_options=config.get("quality_gate_options"),
+            verification_socket=config.get("verification_socket"),
+            snapshot_dir=config.get("snapshot_dir"),
+            ann_index_dir=config.get("ann_index_dir"),
+        )
+
+    # Verify stage helpers, run on the executor threads
+
+    def _load_shared_stores(self):
+        if self.verification_socket:
+            return
+        conn = sqlite3.connect(self.db_path)
+        loader = AccessControl(conn, db_path=self.db_path, chroma_dir=self.chroma_dir, match_mode=self.match_mode,
+                               snapshot_dir=self.snapshot_dir, ann_index_dir=self.ann_index_dir)
+        self.chroma_db, self.gallery, self.ann_index = loader.chroma_db, loader.gallery, loader.ann_index
+        loader.close()
+        warm_up()
+
+    def _engine(self):
+        """The calling executor thread's AccessControl."""
+        engine = getattr(self._local, "engine", None)
+        if engine is None:
+            if self.verification_socket:
+                engine = RemoteAccessControl(VerificationClient(self.verification_socket))
+            else:
+                # Only ever used by this thread; closed from the loop thread at shutdown
+                conn = sqlite3.connect(self.db_path, check_same_thread=False)
+                engine = AccessControl(conn, db_path=self.db_path, chroma_dir=self.chroma_dir,
+                                       initialize_schema=False, gallery=self.gallery,
+                                       chroma_db=self.chroma_db, access_cache=self.access_cache,
+                                       match_mode=self.match_mode, quality_gate=self.quality_gate,
+                                       card_directory=self.card_directory, ann_index=self.ann_index,
+                                       identify_on_mismatch=bool(self.ann_index_dir))
+            self._local.engine = engine
+            self._engines.append(engine)
+        return engine
+
+    def _verify(self, request):
+        engine = self._engine()
+        decision_log = DecisionLog()
+        engine.audit_writer = decision_log
+        response = engine.process_access_request(
+            request["rfid_data"], face_frame=request["frame"], trace=request["trace"],
+            face_frames=request["frames"]
+        )
+        return response, decision_log.events
+
+    # Stages
+
+    def _open_serial(self, loop, lane, capture_queue):
+        rfid_logger = lane.rfid_logger
+        if not rfid_logger.connect():
+            logger.error("[%s] Failed to connect to RFID reader", lane.door_id)
+            return False
+        rfid_logger.ser.timeout = 0  # reads return at once; the loop says when data is there
+
+        def on_card(rfid_data, swipe_time):
+            rfid_data["is_recognized"] = True
+            rfid_data["door_id"] = lane.door_id
+            try:
+                capture_queue.put_nowait((lane, rfid_data, swipe_time))
+            except asyncio.QueueFull:
+                lane.stats.record_drop()
+                logger.warning("[%s] System busy, swipe dropped", lane.door_id)
+
+        def on_readable():
+            try:
+                chunk = rfid_logger.ser.read(rfid_logger.ser.in_waiting or 1)
+            except Exception as e:
+                logger.error("[%s] Error reading RFID reader: %s", lane.door_id, e)
+                loop.remove_reader(rfid_logger.ser.fileno())
+                return
+            if chunk:
+                rfid_logger.feed(chunk)
+
+        rfid_logger.subscribe(on_card)
+        loop.add_reader(rfid_logger.ser.fileno(), on_readable)
+        return True
+
+    async def _capture_stage(self, capture_queue, verify_queue):
+        while True:
+            lane, rfid_data, swipe_time = await capture_queue.get()
+            try:
+                trace = rfid_data.pop("trace", None) or RequestTrace()
+                with trace.stage("frame_capture"):
+                    if self.quality_gate is not None:
+                        frames, photo_path = lane.capture_burst(swipe_time)
+                        frame = frames[0] if frames else None
+                    else:
+                        frame, photo_path = lane.capture_photo(swipe_time)
+                        frames = None
+                await verify_queue.put({
+                    "lane": lane,
+                    "rfid_data": rfid_data,
+                    "frame": frame,
+                    "frames": frames,
+                    "photo_path": photo_path,
+                    "swipe_time": swipe_time,
+                    "trace": trace,
+                    "queued_ns": time.perf_counter_ns(),
+                })
+            finally:
+                capture_queue.task_done()
+
+    async def _verify_stage(self, executor, verify_queue, log_queue, door_locks):
+        loop = asyncio.get_running_loop()
+        while True:
+            request = await verify_queue.get()
+            try:
+                lane = request["lane"]
+                async with door_locks[lane.door_id]:
+                    request["trace"].add("queue_wait", request["queued_ns"], time.perf_counter_ns())
+                    try:
+                        response, events = await loop.run_in_executor(executor, self._verify, request)
+                    except Exception as e:
+                        logger.error("[%s] Error verifying swipe: %s", lane.door_id, e)
+                        continue
+                await log_queue.put((request, response, events))
+            finally:
+                verify_queue.task_done()
+
+    async def _log_stage(self, log_executor, log_queue):
+        loop = asyncio.get_running_loop()
+        conn = await loop.run_in_executor(log_executor, self.audit_writer.open_connection)
+        try:
+            while True:
+                decisions = [await log_queue.get()]
+                while len(decisions) < self.log_batch_size and not log_queue.empty():
+                    decisions.append(log_queue.get_nowait())
+                try:
+                    events = []
+                    for request, response, decision_events in decisions:
+                        events.extend(decision_events)
+                        request["trace"].finish()
+                        lane = request["lane"]
+                        latency = time.monotonic() - request["swipe_time"]
+                        lane.stats.record(response["status"], latency)
+                        mark = "✅ Access granted" if response["status"] == "granted" else "❌ Access denied"
+                        logger.info("[%s] %s: %s (%.0f ms)", lane.door_id, mark, response["message"], latency * 1000)
+                    if events:
+                        await loop.run_in_executor(log_executor, self.audit_writer.write_batch, conn, events)
+                finally:
+                    for _ in decisions:
+                        log_queue.task_done()
+        finally:
+            await asyncio.shield(loop.run_in_executor(log_executor, conn.close))
+
+    async def _report_stats(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            for door_id, summary in self.stats().items():
+                logger.info("[%s] %s", door_id, summary)
+
+    async def _drain(self, queues):
+        for queue in queues:
+            await queue.join()
+
+    def stop(self):
+        """Request a clean shutdown; safe to call from the loop thread only."""
+        if self._stop is not None:
+            self._stop.set()
+
+    async def serve(self):
+        """Run every door until stop() is called or SIGINT/SIGTERM arrives."""
+        loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, self._stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        executor = ThreadPoolExecutor(max_workers=self.verify_concurrency, thread_name_prefix="verify")
+        log_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="access-log")
+        capture_queue = asyncio.Queue(self.queue_size)
+        verify_queue = asyncio.Queue(self.queue_size)
+        log_queue = asyncio.Queue(self.queue_size)
+        door_locks = {door_id: asyncio.Lock() for door_id in self.lanes}
+        readers = []
+        tasks = []
+        try:
+            logger.info("Starting async agent with %d doors (verify concurrency %d)...",
+                        len(self.lanes), self.verify_concurrency)
+            await loop.run_in_executor(executor, self._load_shared_stores)
+            for lane in self.lanes.values():
+                if lane.capture_sink:
+                    lane.capture_sink.start()
+                lane.frame_grabber.start()
+                if self._open_serial(loop, lane, capture_queue):
+                    readers.append(lane.rfid_logger.ser.fileno())
+
+            tasks.append(asyncio.create_task(self._capture_stage(capture_queue, verify_queue), name="capture"))
+            tasks.extend(
+                asyncio.create_task(self._verify_stage(executor, verify_queue, log_queue, door_locks),
+                                    name=f"verify-{i}")
+                for i in range(self.verify_concurrency)
+            )
+            tasks.append(asyncio.create_task(self._log_stage(log_executor, log_queue), name="access-log"))
+            if self.stats_interval:
+                tasks.append(asyncio.create_task(self._report_stats(), name="stats"))
+            logger.info("Waiting for cards to be scanned...")
+
+            await self._stop.wait()
+            logger.info("Shutting down async agent...")
+        finally:
+            for fd in readers:
+                loop.remove_reader(fd)
+            try:
+                await asyncio.wait_for(self._drain([capture_queue, verify_queue, log_queue]), self.drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Gave up draining queued swipes after %.1fs", self.drain_timeout)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            executor.shutdown(wait=True)
+            log_executor.shutdown(wait=True)
+            self.cleanup()
+
+    def stats(self):
+        """Return per-door statistics."""
+        return {door_id: lane.stats.summary() for door_id, lane in self.lanes.items()}
+
+    def run(self):
+        """Run the agent on a new event loop until interrupted."""
+        asyncio.run(self.serve())
+
+    def cleanup(self):
+        """Closes the verification engines and every door's camera, reader and capture writer."""
+        logger.info("Cleaning up resources...")
+        for engine in self._engines:
+            engine.close()
+        self._engines = []
+        for lane in self.lanes.values():
+            lane.close()
+        for stage, summary in get_registry().summary().items():
+            logger.info("Latency %s: %s", stage, summary)
+        logger.info("Card cache: %s", self.access_cache.stats())
+        logger.info("Card directory: %s", self.card_directory.stats())
+        logger.info("Cleanup completed")
+
+
+def single_door_agent(camera_index=0, serial_port="/dev/ttyACM0", **options):
+    """An agent for the one camera and reader main.py uses."""
+    return AsyncDoorAgent([DoorLane("main", camera_index=camera_index, serial_port=serial_port)], **options)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    config_path = sys.argv[1] if len(sys.argv) > 1 else "doors.json"
+    AsyncDoorAgent.from_config(config_path).run()
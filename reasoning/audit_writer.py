@@ -0,0 +1,140 @@
+import sqlite3
+import time
+import logging
+from datetime import datetime, timezone
+from queue import Queue, Empty
+from threading import Thread
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+def access_event(user_id, action):
+    """An access_logs row event, stamped now (UTC, like CURRENT_TIMESTAMP)."""
+    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    return ("access", (user_id, action, timestamp))
+
+
+def line_event(path, line):
+    """An event appending `line` to the text log at `path`."""
+    return ("line", (path, line))
+
+
+class AuditWriter:
+    """
+    Single background writer for access decisions and card logs.
+
+    Callers only enqueue; a writer thread group-commits access_logs rows once
+    `batch_size` events are waiting or `flush_interval` seconds have passed,
+    and appends text log lines (unregistered cards, RFID JSON lines) with one
+    open/write per file per batch. close() drains everything still queued.
+    """
+
+    INSERT_ACCESS_LOG_SQL = "INSERT INTO access_logs (user_id, action, timestamp) VALUES (?, ?, ?)"
+
+    def __init__(self, db_path, batch_size=64, flush_interval=0.25,
+                 unregistered_log="unregistered_cards.log"):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.unregistered_log = unregistered_log
+        self.written = 0
+        self._queue = Queue()
+        self._thread = None
+
+    def start(self):
+        """Start the writer thread."""
+        if self._thread is not None:
+            return
+        self._thread = Thread(target=self._write_loop, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Flush every queued event and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def log_access(self, user_id, action):
+        """Queue an access_logs row, stamped now (UTC, like CURRENT_TIMESTAMP)."""
+        self._queue.put(access_event(user_id, action))
+
+    def log_unregistered_card(self, card_uid):
+        """Queue a line for the unregistered cards log."""
+        self.append_line(self.unregistered_log, card_uid)
+
+    def append_line(self, path, line):
+        """Queue a line to be appended to a text log file."""
+        self._queue.put(line_event(path, line))
+
+    def open_connection(self):
+        conn = sqlite3.connect(self.db_path)
+        # WAL lets the door path keep reading while a batch is committed, and
+        # NORMAL sync makes each group commit a single WAL append
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _write_loop(self):
+        conn = self.open_connection()
+        try:
+            stopping = False
+            while not stopping:
+                try:
+                    event = self._queue.get(timeout=self.flush_interval)
+                except Empty:
+                    continue
+
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+                while True:
+                    if event is _STOP:
+                        stopping = True
+                        break
+                    batch.append(event)
+                    remaining = deadline - time.monotonic()
+                    if len(batch) >= self.batch_size or remaining <= 0:
+                        break
+                    try:
+                        event = self._queue.get(timeout=remaining)
+                    except Empty:
+                        break
+
+                # A stop may have arrived before everything queued behind it was read
+                if stopping:
+                    while not self._queue.empty():
+                        event = self._queue.get_nowait()
+                        if event is not _STOP:
+                            batch.append(event)
+
+                self.write_batch(conn, batch)
+        finally:
+            conn.close()
+
+    def write_batch(self, conn, batch):
+        """Write a batch of events: one commit for the rows, one append per log file."""
+        access_rows = [payload for kind, payload in batch if kind == "access"]
+        lines_by_path = {}
+        for kind, payload in batch:
+            if kind == "line":
+                path, line = payload
+                lines_by_path.setdefault(path, []).append(line)
+
+        if access_rows:
+            try:
+                conn.executemany(self.INSERT_ACCESS_LOG_SQL, access_rows)
+                conn.commit()
+                self.written += len(access_rows)
+            except sqlite3.Error as e:
+                logger.error("Error writing %d access log rows: %s", len(access_rows), e)
+                conn.rollback()
+
+        for path, lines in lines_by_path.items():
+            try:
+                with open(path, "a") as log_file:
+                    log_file.write("\n".join(lines) + "\n")
+            except IOError as e:
+                logger.error("Error writing to log file %s: %s", path, e)
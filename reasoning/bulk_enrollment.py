@@ -0,0 +1,284 @@
+"""
+Bulk enrollment of a folder tree shaped like root/<name>/<images>.
+
+A manifest maps each folder name to its card UID, either as JSON
+({"anas": "F1 11 8A 3F", ...}) or as a CSV file with name,card_uid rows.
+
+Usage:
+    python reasoning/bulk_enrollment.py data manifest.json --checkpoint enroll.ckpt.json
+"""
+import sys
+import os
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+import csv
+import json
+import time
+import uuid
+import argparse
+import logging
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from reasoning.card_identity import normalize_uid
+from reasoning.reconciliation import file_fingerprint
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif'}
+
+
+def load_manifest(path):
+    """Read a name -> card UID mapping from a JSON or CSV manifest."""
+    if path.lower().endswith(".csv"):
+        with open(path, newline="") as manifest_file:
+            return {
+                row[0].strip(): row[1].strip()
+                for row in csv.reader(manifest_file)
+                if len(row) >= 2 and row[0].strip() and row[0].strip().lower() != "name"
+            }
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+    if isinstance(manifest, list):
+        return {entry["name"]: entry["card_uid"] for entry in manifest}
+    return dict(manifest)
+
+
+def _decode_face(image_path):
+    """Process-pool worker: decode, detect and crop one image to a 160x160 face."""
+    from reasoning.face_recognition_model import load_face_image
+
+    try:
+        return load_face_image(image_path), None
+    except Exception as e:
+        return None, str(e)
+
+
+class BulkEnrollmentJob:
+    """
+    Enrolls every person in a folder tree in resumable chunks.
+
+    For each person, images are hashed first and skipped when the same
+    content is already enrolled for that user (or appeared earlier in the
+    run). The remaining images are decoded and face-cropped on a process
+    pool, embedded in model-sized batches, and written to Chroma and SQLite
+    `chunk_size` images at a time, with a commit per chunk. After every
+    commit the checkpoint file records which images are done, so a rerun
+    with the same checkpoint skips them; images that committed without
+    their checkpoint being written are caught by the hash check.
+
+    The per-user report gives images found, enrolled, duplicates, failures
+    and throughput.
+    """
+
+    def __init__(self, manager, root, manifest, checkpoint_path=None, workers=None,
+                 chunk_size=64, progress=None):
+        self.manager = manager
+        self.root = root
+        self.manifest = manifest
+        self.checkpoint_path = checkpoint_path
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.checkpoint = self._load_checkpoint()
+
+    def _load_checkpoint(self):
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+            logger.info("Resuming from checkpoint %s", self.checkpoint_path)
+            return {name: set(paths) for name, paths in checkpoint.get("done", {}).items()}
+        return {}
+
+    def _save_checkpoint(self):
+        if not self.checkpoint_path:
+            return
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as checkpoint_file:
+            json.dump({
+                "root": os.path.abspath(self.root),
+                "updated_at": datetime.now().isoformat(),
+                "done": {name: sorted(paths) for name, paths in self.checkpoint.items()},
+            }, checkpoint_file)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def list_images(self, name):
+        folder = os.path.join(self.root, name)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(
+            os.path.join(folder, filename) for filename in os.listdir(folder)
+            if os.path.splitext(filename.lower())[1] in IMAGE_EXTENSIONS
+        )
+
+    def _get_or_create_user(self, name, card_uid):
+        card_uid = normalize_uid(card_uid)
+        cursor = self.manager.cursor
+        cursor.execute("SELECT id, name FROM users WHERE card_uid = ?", (card_uid,))
+        existing = cursor.fetchone()
+        if existing:
+            if existing[1] != name:
+                logger.warning("Card %s already belongs to %s; adding %s's images to that user",
+                               card_uid, existing[1], name)
+            return existing[0], existing[1]
+        cursor.execute("INSERT INTO users (name, card_uid) VALUES (?, ?)", (name, card_uid))
+        self.manager.conn.commit()
+        return cursor.lastrowid, name
+
+    def _enrolled_hashes(self, user_id):
+        self.manager.cursor.execute(
+            "SELECT content_hash FROM face_embeddings WHERE user_id = ? AND content_hash IS NOT NULL",
+            (user_id,)
+        )
+        return {row[0] for row in self.manager.cursor.fetchall()}
+
+    def run(self):
+        """
+        Enroll every manifest entry that has a folder under `root`.
+
+        Returns:
+            dict: Per-user stats plus totals
+        """
+        report = {"users": {}, "started_at": datetime.now().isoformat()}
+        start = time.perf_counter()
+        # spawn, not fork: the parent may already hold torch's thread pools
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+            for name, card_uid in self.manifest.items():
+                images = self.list_images(name)
+                if not images:
+                    logger.warning("No images for %s under %s", name, self.root)
+                    continue
+                report["users"][name] = self._enroll_user(pool, name, card_uid, images)
+
+        users = report["users"].values()
+        report["seconds"] = time.perf_counter() - start
+        report["enrolled"] = sum(stats["enrolled"] for stats in users)
+        report["images_per_second"] = (
+            sum(stats["processed"] for stats in users) / report["seconds"] if report["seconds"] else None
+        )
+        return report
+
+    def _enroll_user(self, pool, name, card_uid, images):
+        user_start = time.perf_counter()
+        user_id, user_name = self._get_or_create_user(name, card_uid)
+        done = self.checkpoint.setdefault(name, set())
+        seen_hashes = self._enrolled_hashes(user_id)
+        stats = {"images": len(images), "skipped_checkpoint": 0, "duplicates": 0,
+                 "failed": 0, "enrolled": 0}
+
+        # Hash before decoding so duplicates never reach the pool
+        todo = []
+        for image_path in images:
+            if image_path in done:
+                stats["skipped_checkpoint"] += 1
+                continue
+            fingerprint = file_fingerprint(image_path)
+            if fingerprint is None:
+                stats["failed"] += 1
+                done.add(image_path)
+                continue
+            if fingerprint[0] in seen_hashes:
+                stats["duplicates"] += 1
+                done.add(image_path)
+                continue
+            seen_hashes.add(fingerprint[0])
+            todo.append((image_path, fingerprint))
+
+        chunks = [todo[i:i + self.chunk_size] for i in range(0, len(todo), self.chunk_size)]
+        pending = pool.map(_decode_face, [path for path, _ in chunks[0]]) if chunks else None
+        for index, chunk in enumerate(chunks):
+            decoded = list(pending)
+            # Decode the next chunk while this one is embedded and written
+            if index + 1 < len(chunks):
+                pending = pool.map(_decode_face, [path for path, _ in chunks[index + 1]])
+            stats["enrolled"] += self._write_chunk(user_id, user_name, card_uid, chunk, decoded, stats)
+            done.update(path for path, _ in chunk)
+            self._save_checkpoint()
+            if self.progress:
+                self.progress(name, min((index + 1) * self.chunk_size, len(todo)), len(todo))
+
+        self._save_checkpoint()
+        stats["processed"] = len(todo)
+        stats["seconds"] = time.perf_counter() - user_start
+        stats["images_per_second"] = len(todo) / stats["seconds"] if stats["seconds"] else None
+        logger.info("%s: enrolled %d of %d images (%d duplicates, %d failed) at %.1f images/s",
+                    name, stats["enrolled"], stats["images"], stats["duplicates"], stats["failed"],
+                    stats["images_per_second"] or 0)
+        return stats
+
+    def _write_chunk(self, user_id, name, card_uid, chunk, decoded, stats):
+        from reasoning.face_recognition_model import embed_face_images
+
+        faces, kept = [], []
+        for (image_path, fingerprint), (face, error) in zip(chunk, decoded):
+            if face is None:
+                logger.warning("Skipping %s: %s", image_path, error)
+                stats["failed"] += 1
+                continue
+            faces.append(face)
+            kept.append((image_path, fingerprint))
+        if not faces:
+            return 0
+
+        batch_size = max(1, self.manager.embedding_batch_size)
+        embeddings = []
+        for start in range(0, len(faces), batch_size):
+            embeddings.extend(embed_face_images(faces[start:start + batch_size]))
+
+        ids = [str(uuid.uuid4()) for _ in kept]
+        added_at = datetime.now().isoformat()
+        self.manager.store_face_vectors(
+            ids, embeddings, [image_path for image_path, _ in kept],
+            [{"name": name, "card_uid": card_uid, "added_at": added_at}] * len(kept)
+        )
+        self.manager.cursor.executemany("""
+            INSERT INTO face_embeddings
+            (user_id, face_embedding_id, image_path, content_hash, file_mtime_ns, file_size)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(user_id, embedding_id, image_path) + fingerprint
+              for embedding_id, (image_path, fingerprint) in zip(ids, kept)])
+        self.manager.cursor.execute(
+            "UPDATE users SET face_embedding_id = ? WHERE id = ?", (ids[-1], user_id)
+        )
+        self.manager.conn.commit()
+        self.manager._notify_enrollment(user_id, name, card_uid, ids, embeddings)
+        return len(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-enroll a root/<name>/<images> tree")
+    parser.add_argument("root", help="Folder with one sub-folder of images per person")
+    parser.add_argument("manifest", help="JSON or CSV file mapping folder name to card UID")
+    parser.add_argument("--db", default="access_control.db", help="Access control database")
+    parser.add_argument("--chroma-dir", default="chroma_db_test")
+    parser.add_argument("--checkpoint", help="Checkpoint file used to resume an interrupted run")
+    parser.add_argument("--workers", type=int, help="Decode processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=64, help="Images per commit")
+    parser.add_argument("--output", help="Write the JSON report here as well")
+    parser.add_argument("--ann-index-dir", help="Keep the 1:N identification index here up to date")
+    parser.add_argument("--snapshot-dir", help="Publish a gallery snapshot here when done")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    from reasoning.database import EnhancedDatabaseManager
+
+    manager = EnhancedDatabaseManager(sqlite_db_path=args.db, chroma_dir=args.chroma_dir,
+                                      ann_index_dir=args.ann_index_dir, snapshot_dir=args.snapshot_dir)
+    try:
+        job = BulkEnrollmentJob(manager, args.root, load_manifest(args.manifest),
+                                checkpoint_path=args.checkpoint, workers=args.workers,
+                                chunk_size=args.chunk_size)
+        report = job.run()
+    finally:
+        manager.close()
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import os
+import cv2
+import time
+import logging
+from collections import deque
+from itertools import count
+from queue import Queue, Full, Empty
+from threading import Thread
+
+logger = logging.getLogger(__name__)
+
+
+class CaptureSink:
+    """
+    Archives captured frames to disk on a background thread.
+
+    Frames are queued without blocking the caller and dropped when the queue is
+    full. File names carry millisecond resolution plus a sequence number so two
+    swipes in the same second never overwrite each other, and the oldest files
+    are removed once the directory holds more than `max_files` captures.
+    """
+
+    def __init__(self, directory="captures", max_pending=16, max_files=1000, prefix="face"):
+        self.directory = directory
+        self.max_files = max_files
+        self.prefix = prefix
+        self.dropped = 0
+        self._queue = Queue(maxsize=max_pending)
+        self._sequence = count()
+        self._thread = None
+        self.is_running = False
+
+        os.makedirs(directory, exist_ok=True)
+        existing = [
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if name.startswith(prefix + "_") and name.endswith(".jpg")
+        ]
+        self._written = deque(sorted(existing, key=os.path.getmtime))
+
+    def start(self):
+        """Start the writer thread."""
+        if self.is_running:
+            return
+        self.is_running = True
+        self._thread = Thread(target=self._write_loop, name="capture-sink", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Write out every queued frame, then stop the writer thread."""
+        self.is_running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def next_path(self):
+        """Return a new unique capture path."""
+        now = time.time()
+        timestamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+        millis = int((now % 1) * 1000)
+        return os.path.join(
+            self.directory,
+            f"{self.prefix}_{timestamp}-{millis:03d}-{next(self._sequence):06d}.jpg"
+        )
+
+    def submit(self, frame):
+        """
+        Queue a frame for archiving.
+
+        Returns:
+            str: The path the frame will be written to, or None if it was dropped
+        """
+        photo_path = self.next_path()
+        try:
+            self._queue.put_nowait((photo_path, frame))
+        except Full:
+            self.dropped += 1
+            logger.warning("Capture queue full, dropped frame (%d dropped so far)", self.dropped)
+            return None
+        return photo_path
+
+    def _write_loop(self):
+        while self.is_running or not self._queue.empty():
+            try:
+                photo_path, frame = self._queue.get(timeout=0.5)
+            except Empty:
+                continue
+            try:
+                cv2.imwrite(photo_path, frame)
+                self._written.append(photo_path)
+                self._prune()
+            except Exception as e:
+                logger.error("Error saving photo %s: %s", photo_path, e)
+
+    def _prune(self):
+        while self.max_files and len(self._written) > self.max_files:
+            oldest = self._written.popleft()
+            try:
+                os.remove(oldest)
+            except OSError:
+                pass
@@ -0,0 +1,325 @@
+"""
+Card identity: canonical keys for RFID card UIDs and the reader's line protocol.
+
+The Arduino reports swipes as lines such as
+
+    Card UID:  F1 11 8A 3F | Card recognized
+
+and enrollment stores UIDs as the spaced upper-case hex the admin types
+("F1 11 8A 3F"). Everything that compares cards goes through card_key(),
+which turns any spelling of a UID (spaced, packed, colon-separated, any
+case) into one integer: the UID bytes read big-endian behind a 0x01
+sentinel byte, so 4-, 7- and 10-byte UIDs never collide even when they
+start with zero bytes. format_uid() turns a key back into the canonical
+spaced hex used in SQL and logs.
+"""
+import time
+import sqlite3
+import logging
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+UID_MARKER = "Card UID:"
+FIELD_SEPARATOR = "|"
+RECOGNIZED_MARKER = "Card recognized"
+
+
+def uid_key(raw):
+    """Integer key of a UID given as its raw bytes."""
+    return int.from_bytes(b"\x01" + raw, "big")
+
+
+def _uid_bytes(text):
+    try:
+        return bytes.fromhex(text.replace(":", " ").replace("-", " "))
+    except ValueError:
+        # Sketches that print bytes with Serial.print(b, HEX) drop leading zeros
+        parts = text.replace(":", " ").replace("-", " ").split()
+        if not parts or any(len(part) > 2 for part in parts):
+            raise ValueError(f"not a card UID: {text!r}") from None
+        return bytes(int(part, 16) for part in parts)
+
+
+def card_key(uid):
+    """
+    Canonical integer key of a card UID.
+
+    Args:
+        uid (str or int): UID in any hex spelling, or a key already
+
+    Raises:
+        ValueError: When the UID is not hex
+    """
+    if isinstance(uid, int):
+        return uid
+    raw = _uid_bytes(uid.strip())
+    if not raw:
+        raise ValueError("empty card UID")
+    return uid_key(raw)
+
+
+def format_uid(key):
+    """Canonical spaced upper-case hex of a card key, e.g. "F1 11 8A 3F"."""
+    return key.to_bytes((key.bit_length() + 7) // 8, "big")[1:].hex(" ").upper()
+
+
+def normalize_uid(uid):
+    """Canonical spelling of a UID, or the stripped input when it is not hex."""
+    try:
+        return format_uid(card_key(uid))
+    except ValueError:
+        return uid.strip()
+
+
+def lookup_key(uid):
+    """The key a card is cached under: its card_key(), or the stripped UID when it is not hex."""
+    try:
+        return card_key(uid)
+    except ValueError:
+        return uid.strip()
+
+
+# Every insert, update and delete on users bumps users_version.version, so
+# a CardDirectory notices changes made by any process with one row read
+USERS_VERSION_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS users_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    """,
+    "INSERT OR IGNORE INTO users_version (id, version) VALUES (1, 0)",
+] + [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS users_version_{event.lower()} AFTER {event} ON users
+    BEGIN
+        UPDATE users_version SET version = version + 1 WHERE id = 1;
+    END
+    """
+    for event in ("INSERT", "UPDATE", "DELETE")
+]
+
+
+def ensure_card_identity_schema(cursor):
+    """
+    Add the users change counter to an existing database. The first time,
+    stored card UIDs are also rewritten to their canonical spelling.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_version'")
+    first_time = cursor.fetchone() is None
+    for statement in USERS_VERSION_SCHEMA:
+        cursor.execute(statement)
+    if first_time:
+        canonicalize_card_uids(cursor)
+
+
+def canonicalize_card_uids(cursor):
+    """
+    Rewrite users.card_uid in canonical spelling ("f1118a3f" -> "F1 11 8A 3F"),
+    so `WHERE card_uid = ?` with a normalized UID finds legacy rows. A row
+    whose canonical UID already belongs to another user is left alone.
+
+    Returns:
+        int: Rows rewritten
+    """
+    cursor.execute("SELECT id, card_uid FROM users")
+    rows = cursor.fetchall()
+    taken = {card_uid for _, card_uid in rows}
+    rewritten = 0
+    for user_id, card_uid in rows:
+        canonical = normalize_uid(card_uid)
+        if canonical == card_uid:
+            continue
+        if canonical in taken:
+            logger.warning("Card %r of user %s is also enrolled as %s; left as is", card_uid, user_id, canonical)
+            continue
+        cursor.execute("UPDATE users SET card_uid = ? WHERE id = ?", (canonical, user_id))
+        taken.discard(card_uid)
+        taken.add(canonical)
+        rewritten += 1
+    if rewritten:
+        logger.info("Rewrote %d card UIDs in canonical form", rewritten)
+    return rewritten
+
+
+def users_version(conn):
+    """The users change counter, or None on a database without it."""
+    try:
+        row = conn.execute("SELECT version FROM users_version WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def parse_card_line(line):
+    """
+    Parse one line from the reader.
+
+    Args:
+        line (bytes or str): A line as read from the serial port
+
+    Returns:
+        dict: "uid" (canonical spelling), "card_key", "is_recognized" and
+        "raw_data", or None when the line does not carry a card UID
+    """
+    # str searches beat bytes searches on these short ASCII lines, and the
+    # decoded line is needed for raw_data anyway
+    data = line.decode("utf-8", "replace") if isinstance(line, bytes) else line
+    start = data.find(UID_MARKER)
+    if start < 0:
+        return None
+    field = data[start + len(UID_MARKER):].partition(FIELD_SEPARATOR)[0]
+    identity = _parsed_fields.get(field) or _parse_uid_field(field)
+    if identity is None:
+        logger.debug("Ignoring malformed card line %r", data)
+        return None
+    return {
+        "uid": identity[0],
+        "card_key": identity[1],
+        "is_recognized": RECOGNIZED_MARKER in data,
+        "raw_data": data.strip(),
+    }
+
+
+# The same few cards are swiped over and over, so the UID field of a line
+# is parsed once and remembered; cleared when it grows past the limit
+_parsed_fields = {}
+_PARSED_FIELDS_LIMIT = 4096
+
+
+def _parse_uid_field(field):
+    try:
+        raw = _uid_bytes(field)
+    except ValueError:
+        return None
+    if not raw:
+        return None
+    if len(_parsed_fields) >= _PARSED_FIELDS_LIMIT:
+        _parsed_fields.clear()
+    identity = _parsed_fields[field] = (raw.hex(" ").upper(), uid_key(raw))
+    return identity
+
+
+class CardDirectory:
+    """
+    In-memory map from card key to the users row, in front of the
+    `WHERE card_uid = ?` lookup.
+
+    The whole users table is loaded on first use and again whenever the
+    users change counter (users_version, kept by triggers) moved, so cards
+    added, deleted or re-assigned by any process are seen within
+    `check_interval` seconds; the counter is read at most that often, so a
+    burst of swipes costs no SQL at all. On a database without the counter
+    the table is reloaded every `max_age` seconds instead. invalidate() (AccessControl.reload() calls
+    it) forces a reload. A card that is not in the map falls back to the
+    SQL lookup and is added when found. Stored UIDs are parsed with
+    card_key(), so a card matches however its UID was typed at enrollment.
+
+    One directory is shared by every AccessControl of a system; each caller
+    passes its own SQLite connection.
+    """
+
+    LOAD_SQL = "SELECT card_uid, id, name, face_embedding_id FROM users"
+
+    def __init__(self, max_age=30.0, check_interval=1.0, clock=time.monotonic):
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self._rows = {}
+        self._loaded_at = None
+        self._version = None
+        self._checked_at = None
+        self._lock = Lock()
+        self._load_lock = Lock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def load(self, conn):
+        """Replace the map with the current users table."""
+        version = users_version(conn)
+        rows, unparsable = {}, 0
+        for card_uid, user_id, name, face_embedding_id in conn.execute(self.LOAD_SQL):
+            try:
+                key = card_key(card_uid)
+            except ValueError:
+                unparsable += 1  # still found through the SQL fallback
+                continue
+            if key in rows:
+                logger.warning("Card %s is enrolled twice (users %s and %s)", format_uid(key), rows[key][0], user_id)
+            rows[key] = (user_id, name, face_embedding_id)
+        with self._lock:
+            self._rows = rows
+            self._version = version
+            self._loaded_at = self._checked_at = self.clock()
+            self.loads += 1
+        if unparsable:
+            logger.info("%d card UIDs are not hex and are looked up in SQL instead", unparsable)
+        logger.debug("Loaded %d cards", len(rows))
+
+    def _is_stale(self, conn, throttle=True):
+        if self._loaded_at is None:
+            return True
+        now = self.clock()
+        if self._version is None:
+            return now - self._loaded_at >= self.max_age
+        if throttle and now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        return users_version(conn) != self._version
+
+    def lookup(self, conn, card, fallback=None):
+        """
+        Return the (id, name, face_embedding_id) row for a card, or None.
+
+        Args:
+            conn: SQLite connection of the calling thread
+            card (str or int): UID or card key
+            fallback: Called with the canonical UID on a miss, e.g.
+                AccessControl.select_user_by_card
+        """
+        if self._is_stale(conn):
+            with self._load_lock:
+                if self._is_stale(conn, throttle=False):
+                    self.load(conn)
+        try:
+            key = card_key(card)
+        except ValueError:
+            self.misses += 1
+            return fallback(card.strip()) if fallback is not None else None
+
+        row = self._rows.get(key)
+        if row is not None:
+            self.hits += 1
+            return row
+        self.misses += 1
+        if fallback is None:
+            return None
+        row = fallback(format_uid(key))
+        if row is not None:
+            with self._lock:
+                self._rows[key] = tuple(row)
+        return row
+
+    def invalidate(self):
+        """Reload the whole table on the next lookup."""
+        with self._lock:
+            self._loaded_at = None
+
+    def on_enrollment(self, user_id, name, card_uid, embedding_ids, embeddings):
+        """Enrollment listener (see EnhancedDatabaseManager.add_enrollment_listener)."""
+        try:
+            key = card_key(card_uid)
+        except (ValueError, AttributeError):
+            return
+        with self._lock:
+            previous = self._rows.get(key)
+            face_embedding_id = embedding_ids[-1] if embedding_ids else (previous[2] if previous else None)
+            self._rows[key] = (user_id, name, face_embedding_id)
+
+    def stats(self):
+        return {"cards": len(self._rows), "hits": self.hits, "misses": self.misses, "loads": self.loads}
@@ -1,24 +1,78 @@
-import sqlite3
-from langchain_community.vectorstores import Chroma
-from face_recognition_model import get_embeddings, extract_embedding
+import sys
 import os
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+import sqlite3
 import uuid
 from datetime import datetime
+from reasoning.card_identity import ensure_card_identity_schema, normalize_uid
+from reasoning.reconciliation import Reconciler, ensure_reconciliation_schema, file_fingerprint
+from reasoning.templates import TemplateStore, chroma_vector_fetcher
 
 class EnhancedDatabaseManager:
-    def __init__(self, sqlite_db_path="../access_control.db", chroma_dir="../chroma_db_test"):
-        """Initialize database connections with support for multiple images per user."""
+    def __init__(self, sqlite_db_path="../access_control.db", chroma_dir="../chroma_db_test",
+                 embedding_batch_size=32, decode_workers=4, chroma_db=None, ann_index_dir=None,
+                 snapshot_dir=None, ann_index=None):
+        """
+        Initialize database connections with support for multiple images per user.
+        `chroma_db` reuses an already open Chroma store instead of opening one.
+        With `ann_index_dir`, the 1:N identification index saved there
+        (reasoning.ann_index) is built if missing and kept up to date with
+        every enrollment; `ann_index` reuses an index already opened from it.
+        With `snapshot_dir`, a new gallery snapshot (reasoning.gallery_snapshot)
+        is published there after every enrollment and reconciliation, for
+        door processes to memory-map.
+        """
         self.sqlite_db_path = sqlite_db_path
+        self.embedding_batch_size = embedding_batch_size
+        self.decode_workers = decode_workers
+        self.enrollment_listeners = []
         self.conn = sqlite3.connect(sqlite_db_path)
         self.cursor = self.conn.cursor()
         self.initialize_sqlite_database()
 
         self.chroma_dir = chroma_dir
-        os.makedirs(chroma_dir, exist_ok=True)
-        self.chroma_db = Chroma(
-            persist_directory=chroma_dir,
-            embedding_function=get_embeddings()
-        )
+        self._chroma_db = chroma_db
+
+        # Per-user centroid/medoid templates follow every enrollment
+        self.templates = TemplateStore(self.conn, fetch_vectors=self.fetch_face_vectors)
+        self.add_enrollment_listener(self.templates.on_enrollment)
+
+        self.ann_index_dir = ann_index_dir
+        self.ann_index = ann_index
+        if ann_index_dir and ann_index is None:
+            from reasoning.ann_index import open_ann_index
+            self.ann_index = open_ann_index(ann_index_dir, self.conn, self.chroma_db)
+        if self.ann_index is not None:
+            self.add_enrollment_listener(self.ann_index.on_enrollment)
+
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_gallery = None
+        self._snapshot_dirty = False
+        if snapshot_dir:
+            from reasoning.gallery_index import GalleryIndex
+            # Every published version descends from this one, so check it in full
+            self.snapshot_gallery = GalleryIndex.load_with_snapshot(self.conn, self.chroma_db, snapshot_dir,
+                                                                    verify=True)
+            self._snapshot_dirty = self.snapshot_gallery.snapshot is None
+            self.add_enrollment_listener(self._on_snapshot_enrollment)
+
+    @property
+    def chroma_db(self):
+        """
+        Chroma store, opened on first use so that SQLite-only actions such as
+        list_users do not load langchain, Chroma or the FaceNet model.
+        """
+        if self._chroma_db is None:
+            from langchain_community.vectorstores import Chroma
+            from reasoning.face_recognition_model import get_embeddings
+
+            os.makedirs(self.chroma_dir, exist_ok=True)
+            self._chroma_db = Chroma(
+                persist_directory=self.chroma_dir,
+                embedding_function=get_embeddings()
+            )
+        return self._chroma_db
 
     def initialize_sqlite_database(self):
         """Create tables with support for multiple face embeddings per user."""
@@ -41,6 +95,8 @@ class EnhancedDatabaseManager:
                 UNIQUE (face_embedding_id)
             )
         """)
+        ensure_reconciliation_schema(self.cursor)
+        ensure_card_identity_schema(self.cursor)
         self.conn.commit()
 
     def get_image_files_from_folder(self, folder_path):
@@ -80,52 +136,77 @@ class EnhancedDatabaseManager:
             print(f"Error reading folder {folder_path}: {e}")
             return []
         
-    def reconcile_chromadb_with_sqlite(self):
+    def add_enrollment_listener(self, listener):
+        """
+        Register a callback run after images are enrolled for a user, e.g. an
+        in-memory GalleryIndex.on_enrollment.
+
+        The listener is called as
+        listener(user_id, name, card_uid, face_embedding_ids, embeddings).
+        """
+        self.enrollment_listeners.append(listener)
+
+    def _notify_enrollment(self, user_id, name, card_uid, face_embedding_ids, embeddings):
+        for listener in self.enrollment_listeners:
+            try:
+                listener(user_id, name, card_uid, face_embedding_ids, embeddings)
+            except Exception as e:
+                print(f"Error in enrollment listener: {e}")
+
+    def extract_embeddings(self, image_paths):
+        """Extract embeddings for a list of images using the configured batch size."""
+        from reasoning.face_recognition_model import extract_embeddings_batch
+
+        return extract_embeddings_batch(
+            image_paths,
+            batch_size=self.embedding_batch_size,
+            num_workers=self.decode_workers
+        )
+
+    def store_face_vectors(self, ids, embeddings, image_paths, metadatas):
+        """
+        Write precomputed embeddings to Chroma as the records' vectors.
+
+        The image path is kept as the (short) document text and Chroma's
+        embedding function is never run, so each vector is stored once and
+        metadata stays a few small fields.
+        """
+        self.chroma_db._collection.upsert(
+            ids=list(ids),
+            embeddings=[[float(x) for x in embedding] for embedding in embeddings],
+            documents=list(image_paths),
+            metadatas=list(metadatas)
+        )
+
+    def fetch_face_vectors(self, face_embedding_ids):
+        """Return the stored vectors for the given face_embedding_ids, skipping missing ones."""
+        return chroma_vector_fetcher(self.chroma_db)(face_embedding_ids)
+
+    def _on_snapshot_enrollment(self, user_id, name, card_uid, face_embedding_ids, embeddings):
+        self.snapshot_gallery.on_enrollment(user_id, name, card_uid, face_embedding_ids, embeddings)
+        self._snapshot_dirty = True
+
+    def reconcile_chromadb_with_sqlite(self, full=False):
         """
-        Ensure that all face embeddings in SQLite are present in ChromaDB.
-        If not, add them to ChromaDB.
+        Bring ChromaDB in line with the face embeddings recorded in SQLite:
+        embed rows that have no vector, re-embed changed images and drop
+        vectors whose row is gone. Only journaled changes are checked unless
+        `full` is set (see reasoning.reconciliation.Reconciler).
         """
         try:
-            # Retrieve all face embeddings from SQLite
-            self.cursor.execute("""
-                SELECT f.face_embedding_id, f.image_path, u.name, u.card_uid 
-                FROM face_embeddings f
-                JOIN users u ON f.user_id = u.id
-            """)
-            embeddings_data = self.cursor.fetchall()
-
-            # Get all existing document IDs in ChromaDB
-            chromadb_ids = self.chroma_db.get()
-            chromadb_ids = set(chromadb_ids['ids'])
-
-            added_count = 0
-
-            # Check and add missing data to ChromaDB
-            for embedding_id, image_path, name, card_uid in embeddings_data:
-                if embedding_id not in chromadb_ids:
-                    # Extract embedding and add to ChromaDB
-                    print(f"Embedding ID {embedding_id} missing in ChromaDB. Adding...")
-                    embedding = extract_embedding(image_path)
-                    if embedding is not None:
-                        metadata = {
-                            "name": name,
-                            "card_uid": card_uid,
-                            "image_path": image_path,
-                            "added_at": datetime.now().isoformat(),
-                            "embedding": str(embedding.tolist())
-                        }
-                        self.chroma_db.add_texts(
-                            texts=[image_path],
-                            metadatas=[metadata],
-                            ids=[embedding_id]
-                        )
-                        added_count += 1
-                    else:
-                        print(f"Warning: Failed to extract embedding for {image_path}")
-
-            print(f"Reconciliation completed. Added {added_count} missing entries to ChromaDB.")
+            report = Reconciler(self, batch_size=max(256, self.embedding_batch_size)).run(full=full)
+            print(f"Reconciliation completed ({report['mode']}): embedded {report['embedded']}, "
+                  f"removed {report['orphans_deleted']} orphaned entries, {report['failed']} failed.")
+            if self.snapshot_gallery is not None and (report['embedded'] or report['orphans_deleted']):
+                # Vectors were replaced or dropped in place; rebuild rather than patch
+                from reasoning.gallery_index import GalleryIndex
+                self.snapshot_gallery = GalleryIndex.load(self.conn, self.chroma_db)
+                self._snapshot_dirty = True
+            self.save_snapshot()
+            return report
         except Exception as e:
             print(f"Error during reconciliation: {e}")
+            return None
 
     def add_user(self, name, card_uid, face_image_input):
         """
@@ -147,6 +228,9 @@ class EnhancedDatabaseManager:
                 # Process as list of image paths
                 face_image_paths = face_image_input
 
+            # Store the card in its canonical spelling, whatever was typed
+            card_uid = normalize_uid(card_uid)
+
             # Check if user with this card_uid already exists
             self.cursor.execute("SELECT id, name FROM users WHERE card_uid = ?", (card_uid,))
             existing_user = self.cursor.fetchone()
@@ -164,57 +248,50 @@ class EnhancedDatabaseManager:
                 user_id = self.cursor.lastrowid
                 print(f"Created new user: {name}")
 
-            # Process each face image
-            successful_images = 0
-            for image_path in face_image_paths:
-                try:
-                    # Generate unique ID for this face embedding
-                    face_embedding_id = str(uuid.uuid4())
-                    print(f"Processing image: {image_path}")
-                    
-                    # Extract face embedding
-                    embedding = extract_embedding(image_path)
-                    
-                    if embedding is None:
-                        print(f"Warning: Could not extract embedding from {image_path}")
-                        continue
-
-                    # Add to ChromaDB
-                    metadata = {
-                        "name": name,
-                        "card_uid": card_uid,
-                        "image_path": image_path,
-                        "added_at": datetime.now().isoformat(),
-                        "embedding": str(embedding.tolist())
-                    }
-                    
-                    self.chroma_db.add_texts(
-                        texts=[image_path],
-                        metadatas=[metadata],
-                        ids=[face_embedding_id]
-                    )
-
-                    # Add to face_embeddings table
-                    self.cursor.execute("""
-                        INSERT INTO face_embeddings 
-                        (user_id, face_embedding_id, image_path) 
-                        VALUES (?, ?, ?)
-                    """, (user_id, face_embedding_id, image_path))
-
-                    # Update the user's face_embedding_id with the latest one
-                    self.cursor.execute("""
-                        UPDATE users 
-                        SET face_embedding_id = ? 
-                        WHERE id = ?
-                    """, (face_embedding_id, user_id))
-                    
-                    successful_images += 1
+            # Embed all images in batches, then write both stores in bulk
+            print(f"Processing {len(face_image_paths)} images...")
+            embeddings = self.extract_embeddings(face_image_paths)
 
-                except Exception as e:
-                    print(f"Error processing image {image_path}: {e}")
+            ids, texts, metadatas, rows, enrolled = [], [], [], [], []
+            for image_path, embedding in zip(face_image_paths, embeddings):
+                if embedding is None:
+                    print(f"Warning: Could not extract embedding from {image_path}")
                     continue
 
+                # Generate unique ID for this face embedding
+                face_embedding_id = str(uuid.uuid4())
+                ids.append(face_embedding_id)
+                texts.append(image_path)
+                metadatas.append({
+                    "name": name,
+                    "card_uid": card_uid,
+                    "added_at": datetime.now().isoformat()
+                })
+                rows.append((user_id, face_embedding_id, image_path) + (file_fingerprint(image_path) or (None,) * 3))
+                enrolled.append(embedding)
+
+            successful_images = len(rows)
+            if rows:
+                self.store_face_vectors(ids, enrolled, texts, metadatas)
+
+                self.cursor.executemany("""
+                    INSERT INTO face_embeddings 
+                    (user_id, face_embedding_id, image_path, content_hash, file_mtime_ns, file_size) 
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, rows)
+
+                # Update the user's face_embedding_id with the latest one
+                self.cursor.execute("""
+                    UPDATE users 
+                    SET face_embedding_id = ? 
+                    WHERE id = ?
+                """, (ids[-1], user_id))
+
             self.conn.commit()
+            if enrolled:
+                self._notify_enrollment(user_id, name, card_uid, ids, enrolled)
+                self.save_ann_index()
+                self.save_snapshot()
             print(f"Successfully processed {successful_images} out of {len(face_image_paths)} images for {name}!")
             return successful_images > 0
 
@@ -223,42 +300,81 @@ class EnhancedDatabaseManager:
             self.conn.rollback()
             return False
 
+    def get_users(self):
+        """Return (name, card_uid, image_count) for every user."""
+        self.cursor.execute("""
+            SELECT 
+                u.name, 
+                u.card_uid, 
+                COUNT(f.id) as image_count
+            FROM users u
+            LEFT JOIN face_embeddings f ON u.id = f.user_id
+            GROUP BY u.id
+        """)
+        return self.cursor.fetchall()
+
     def list_users(self):
         """List all users and their face images."""
         try:
-            self.cursor.execute("""
-                SELECT 
-                    u.name, 
-                    u.card_uid, 
-                    COUNT(f.id) as image_count
-                FROM users u
-                LEFT JOIN face_embeddings f ON u.id = f.user_id
-                GROUP BY u.id
-            """)
-            users = self.cursor.fetchall()
-            
-            if not users:
-                print("No users found in database.")
-                return
-
-            print("\nRegistered Users:")
-            print("-" * 50)
-            for user in users:
-                print(f"Name: {user[0]}")
-                print(f"Card UID: {user[1]}")
-                print(f"Number of face images: {user[2]}")
-                print("-" * 50)
-
+            print_users(self.get_users())
         except Exception as e:
             print(f"Error listing users: {e}")
 
+    def save_ann_index(self):
+        """Persist the identification index's new templates, if one is kept."""
+        if self.ann_index is not None and self.ann_index_dir:
+            try:
+                self.ann_index.save(self.ann_index_dir)
+            except Exception as e:
+                print(f"Error saving ANN index: {e}")
+
+    def save_snapshot(self):
+        """Publish a new gallery snapshot if enrollment changed the gallery since the last one."""
+        if self.snapshot_gallery is None or not self._snapshot_dirty:
+            return
+        try:
+            from reasoning.gallery_snapshot import database_watermark
+
+            self.snapshot_gallery.to_snapshot(self.snapshot_dir, watermark=database_watermark(self.conn))
+            self._snapshot_dirty = False
+        except Exception as e:
+            print(f"Error saving gallery snapshot: {e}")
+
     def close(self):
         """Clean up database connections."""
+        self.save_ann_index()
+        self.save_snapshot()
         self.conn.close()
 
-def main():
-    """Interactive function to add users with multiple images."""
-    db_manager = EnhancedDatabaseManager()
+def print_users(users):
+    """Print (name, card_uid, image_count) rows as returned by get_users."""
+    if not users:
+        print("No users found in database.")
+        return
+
+    print("\nRegistered Users:")
+    print("-" * 50)
+    for user in users:
+        print(f"Name: {user[0]}")
+        print(f"Card UID: {user[1]}")
+        print(f"Number of face images: {user[2]}")
+        print("-" * 50)
+
+def main(server_socket=None, snapshot_dir=None, ann_index_dir=None):
+    """
+    Interactive function to add users with multiple images.
+
+    With `server_socket`, every action is run by the verification service
+    listening there (reasoning/verification_server.py) instead of opening
+    the stores and the model in this process. With `snapshot_dir`, gallery
+    snapshots for the door processes are published there after each change,
+    and with `ann_index_dir` the identification index there is kept current.
+    """
+    if server_socket:
+        from reasoning.verification_client import VerificationClient, RemoteDatabaseManager
+        db_manager = RemoteDatabaseManager(VerificationClient(server_socket))
+    else:
+        db_manager = EnhancedDatabaseManager(snapshot_dir=snapshot_dir, ann_index_dir=ann_index_dir)
     
     try:
         while True:
@@ -266,9 +382,10 @@ def main():
             print("1. Add new user or images to existing user (individual images)")
             print("2. Add new user or images to existing user (folder)")
             print("3. List all users")
-            print("4. Exit")
+            print("4. Full reconciliation (re-check every image)")
+            print("5. Exit")
             
-            choice = input("\nEnter your choice (1-4): ")
+            choice = input("\nEnter your choice (1-5): ")
             
             if choice == "1":
                 name = input("Enter user name: ")
@@ -306,6 +423,9 @@ def main():
                 db_manager.list_users()
                 
             elif choice == "4":
+                db_manager.reconcile_chromadb_with_sqlite(full=True)
+
+            elif choice == "5":
                 print("Exiting...")
                 break
                 
@@ -318,4 +438,12 @@ def main():
         db_manager.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Register users and face images")
+    parser.add_argument("--server", metavar="SOCKET",
+                        help="Enroll through a running verification service instead of locally")
+    parser.add_argument("--snapshot-dir", help="Publish gallery snapshots here for door processes to map")
+    parser.add_argument("--ann-index-dir", help="Keep the 1:N identification index here up to date")
+    args = parser.parse_args()
+    main(args.server, args.snapshot_dir, args.ann_index_dir)
\ No newline at end of file
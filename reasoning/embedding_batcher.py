@@ -0,0 +1,122 @@
+import time
+import logging
+from concurrent.futures import Future
+from queue import Queue, Empty
+from threading import Thread
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batches FaceNet calls from many threads into one forward pass.
+
+    embed() queues a face crop and blocks until its embedding is ready. A
+    single batching thread waits for the first crop, then keeps collecting
+    until `max_batch_size` crops are waiting or `max_wait` seconds have
+    passed, and embeds them together. A lone swipe therefore pays at most
+    `max_wait` extra, while concurrent swipes from several doors share one
+    model call instead of queueing behind each other.
+    """
+
+    def __init__(self, max_batch_size=16, max_wait=0.005):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.embedded = 0
+        self.largest_batch = 0
+        self._queue = Queue()
+        self._thread = None
+
+    def start(self):
+        """Start the batching thread."""
+        if self._thread is not None:
+            return
+        self._thread = Thread(target=self._batch_loop, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Embed every queued crop and stop the batching thread."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, face_frame):
+        """Queue a BGR face crop; the returned Future resolves to its embedding or None."""
+        future = Future()
+        self._queue.put((face_frame, future))
+        return future
+
+    def embed(self, face_frame):
+        """Drop-in replacement for extract_embedding_from_frame that joins the next batch."""
+        return self.submit(face_frame).result()
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "embedded": self.embedded,
+            "mean_batch_size": self.embedded / self.batches if self.batches else None,
+            "largest_batch": self.largest_batch,
+        }
+
+    def _batch_loop(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch = []
+            deadline = time.monotonic() + self.max_wait
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.max_batch_size or remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except Empty:
+                    break
+
+            if stopping:
+                while not self._queue.empty():
+                    item = self._queue.get_nowait()
+                    if item is not _STOP:
+                        batch.append(item)
+            if batch:
+                self._run(batch)
+
+    def _run(self, batch):
+        from reasoning.face_recognition_model import embed_face_images, prepare_face
+
+        faces, waiting = [], []
+        for face_frame, future in batch:
+            try:
+                rgb_frame = cv2.cvtColor(face_frame, cv2.COLOR_BGR2RGB)
+                faces.append(prepare_face(rgb_frame, detect_face=False))
+                waiting.append(future)
+            except Exception as e:
+                logger.error("Error preparing face for embedding: %s", e)
+                future.set_result(None)
+        if not faces:
+            return
+
+        try:
+            embeddings = embed_face_images(faces)
+        except Exception as e:
+            logger.error("Error embedding batch of %d faces: %s", len(faces), e)
+            for future in waiting:
+                future.set_result(None)
+            return
+
+        self.batches += 1
+        self.embedded += len(faces)
+        self.largest_batch = max(self.largest_batch, len(faces))
+        for future, embedding in zip(waiting, embeddings):
+            future.set_result(embedding)
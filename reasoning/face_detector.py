@@ -0,0 +1,98 @@
+import cv2
+from threading import Lock
+
+
+class FaceDetector:
+    """
+    Haar cascade face detector with a crop step for FaceNet.
+
+    Detection runs on a downscaled grayscale copy of the frame and only the
+    largest (or most central) face is kept, so callers can skip the CNN
+    entirely when nothing is found.
+    """
+
+    def __init__(self, cascade_path=None, scale_factor=1.1, min_neighbors=5, min_size=(30, 30),
+                 detection_width=320, margin=0.2, prefer="largest"):
+        if cascade_path is None:
+            cascade_path = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+        self.cascade = cv2.CascadeClassifier(cascade_path)
+        if self.cascade.empty():
+            raise RuntimeError(f"Failed to load face cascade from {cascade_path}")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+        self.detection_width = detection_width
+        self.margin = margin
+        self.prefer = prefer
+        # CascadeClassifier is not safe to share between threads
+        self._lock = Lock()
+
+    def detect(self, frame, rgb=False):
+        """
+        Detect faces in a color (BGR, or RGB when `rgb` is set) or grayscale frame.
+
+        Returns:
+            list: (x, y, w, h) boxes in the coordinates of the original frame
+        """
+        if frame.ndim == 3:
+            gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY if rgb else cv2.COLOR_BGR2GRAY)
+        else:
+            gray = frame
+
+        scale = 1.0
+        if self.detection_width and gray.shape[1] > self.detection_width:
+            scale = self.detection_width / gray.shape[1]
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        min_size = (max(1, int(self.min_size[0] * scale)), max(1, int(self.min_size[1] * scale)))
+        with self._lock:
+            faces = self.cascade.detectMultiScale(
+                gray, scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors, minSize=min_size
+            )
+
+        return [
+            (int(x / scale), int(y / scale), int(w / scale), int(h / scale))
+            for (x, y, w, h) in faces
+        ]
+
+    def select(self, boxes, frame_shape):
+        """Pick the largest or the most central box, depending on `prefer`."""
+        if not boxes:
+            return None
+        if self.prefer == "central":
+            center_x, center_y = frame_shape[1] / 2, frame_shape[0] / 2
+            return min(boxes, key=lambda b: (b[0] + b[2] / 2 - center_x) ** 2 + (b[1] + b[3] / 2 - center_y) ** 2)
+        return max(boxes, key=lambda b: b[2] * b[3])
+
+    def crop(self, frame, rgb=False):
+        """
+        Return the selected face region, padded by `margin`, or None when no
+        face is found.
+        """
+        box = self.select(self.detect(frame, rgb=rgb), frame.shape)
+        if box is None:
+            return None
+        return self.crop_box(frame, box)
+
+    def crop_box(self, frame, box):
+        """Return the region of `box` padded by `margin`, clipped to the frame."""
+        x, y, w, h = box
+        pad_x, pad_y = int(w * self.margin), int(h * self.margin)
+        height, width = frame.shape[:2]
+        x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+        x1, y1 = min(width, x + w + pad_x), min(height, y + h + pad_y)
+        return frame[y0:y1, x0:x1]
+
+
+_detector = None
+_detector_lock = Lock()
+
+
+def get_face_detector():
+    """Return the process-wide FaceDetector, loading the cascade on first use."""
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                _detector = FaceDetector()
+    return _detector
@@ -1,81 +1,220 @@
-from facenet_pytorch import InceptionResnetV1
-from langchain.embeddings.base import Embeddings
-import torch
+import sys
+import os
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
 from PIL import Image
-import os, re
+import re
 import numpy as np
 import csv
 import cv2
+import time
+import logging
+from functools import lru_cache, partial
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from reasoning.face_detector import get_face_detector
+from reasoning.inference_backend import create_backend
 
+logger = logging.getLogger(__name__)
+
+# FaceNet is loaded on first use (or by warm_up()), not at import time, so
+# importing this module does not pay for torch and the pretrained weights.
+_model = None
+_model_lock = Lock()
+model_cache_path = os.environ.get("FACENET_MODEL_CACHE")
+backend_name = os.environ.get("FACENET_BACKEND", "torch")
+backend_options = {}
+model_load_stats = {}
+
+
+def set_model_cache(path):
+    """
+    Use a TorchScript file as a model cache: it is loaded instead of building
+    InceptionResnetV1 from facenet_pytorch, and written on the first load if
+    it does not exist yet. Must be called before the model is first used.
+    """
+    global model_cache_path
+    model_cache_path = path
+
+
+def set_inference_backend(name="torch", **options):
+    """
+    Choose how FaceNet runs (see reasoning.inference_backend): "torch" or
+    "onnx", with options such as quantize, channels_last and num_threads.
+    Must be called before the model is first used.
+    """
+    global backend_name, backend_options
+    backend_name = name
+    backend_options = options
+
+
+def get_model():
+    """Return the process-wide inference backend, loading it once on first call."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                start = time.perf_counter()
+                backend = create_backend(backend_name, model_cache=model_cache_path, **backend_options)
+                model_load_stats.update(backend.describe(), load_seconds=time.perf_counter() - start)
+                logger.info("Loaded FaceNet (%s backend, %s) in %.2fs",
+                            backend_name, backend.source, model_load_stats["load_seconds"])
+                _model = backend
+    return _model
+
+
+def warm_up(batch_size=1):
+    """
+    Load the model and run a dummy forward pass, so the first real swipe does
+    not pay for lazy initialisation. Returns the seconds spent.
+    """
+    start = time.perf_counter()
+    embed_face_images([np.zeros((160, 160, 3), dtype=np.uint8)] * batch_size)
+    model_load_stats["warm_up_seconds"] = time.perf_counter() - start
+    return model_load_stats["warm_up_seconds"]
+
+
+def embed_face_images(face_images):
+    """Run FaceNet on a list of 160x160 RGB uint8 arrays in one forward pass."""
+    return get_model()(np.stack(face_images))
+
+
+def prepare_face(rgb_image, detect_face=True):
+    """
+    Crop the face out of an RGB array and resize it to 160x160.
+    Returns None when detection is enabled and no face is found.
+    """
+    if detect_face:
+        rgb_image = get_face_detector().crop(rgb_image, rgb=True)
+        if rgb_image is None:
+            return None
+    img = Image.fromarray(rgb_image).resize((160, 160))
+    return np.asarray(img, dtype=np.uint8)
+
+
+def load_face_image(image_path, detect_face=True):
+    """Decode an image file into the 160x160 RGB face array FaceNet expects."""
+    img = np.asarray(Image.open(image_path).convert('RGB'))
+    face = prepare_face(img, detect_face=detect_face)
+    if face is None:
+        raise ValueError("no face detected")
+    return face
 
-# Initialize FaceNet model
-model = InceptionResnetV1(pretrained='vggface2').eval()
 
 def extract_embedding(image_path):
     """Extract face embedding from an image."""
     try:
-        print(f"path: {image_path}")
-        img = Image.open(image_path).resize((160, 160)).convert('RGB')
-        print("opening image")
-        img_tensor = torch.tensor(np.array(img)).permute(2, 0, 1).unsqueeze(0).float()
-        print("image_tensor")
-        with torch.no_grad():
-            embedding = model(img_tensor)
-            print(f"image embedding {embedding}")
-
-        print("returning embedding")
-        return embedding.detach().cpu().numpy().flatten()  # Flatten the embedding
+        embedding = embed_face_images([load_face_image(image_path)])[0]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Embedded %s: %s...", image_path, embedding[:5])
+        return embedding
     except Exception as e:
-        print(f"Error processing image {image_path}: {e}")
+        logger.error("Error processing image %s: %s", image_path, e)
         return None
-    
 
-# Define the embedding function wrapper
-class FaceEmbeddingFunction(Embeddings):
-    def embed_documents(self, images):
-        """Embed a list of images (paths)."""
-        return [self._extract_embedding(image) for image in images]
-
-    def embed_query(self, image):
-        """Embed a single image (path)."""
-        return self._extract_embedding(image)
-
-    @staticmethod
-    def _extract_embedding(image_path):
-        """Extract face embedding from an image."""
-        try:
-            img = Image.open(image_path).resize((160, 160)).convert('RGB')
-            img_tensor = torch.tensor(np.array(img)).permute(2, 0, 1).unsqueeze(0).float()
-            with torch.no_grad():
-                embedding = model(img_tensor)
-            return embedding.detach().cpu().numpy().flatten()  # Flatten the embedding
-        except Exception as e:
-            print(f"Error processing image {image_path}: {e}")
-            return None
+
+def _load_face_image_or_none(image_path, detect_face=True):
+    try:
+        return load_face_image(image_path, detect_face=detect_face)
+    except Exception as e:
+        logger.error("Error processing image %s: %s", image_path, e)
+        return None
+
+
+def extract_embeddings_batch(image_paths, batch_size=32, num_workers=4, detect_face=True):
+    """
+    Extract face embeddings for many images, one forward pass per batch.
+
+    Images are decoded and face-cropped on a thread pool (PIL and OpenCV
+    release the GIL) and the next batch is prepared while the current one
+    runs through the model.
+
+    Args:
+        image_paths (list): Paths of the images to embed
+        batch_size (int): Number of images stacked into one forward pass
+        num_workers (int): Number of decoding threads
+        detect_face (bool): Crop to the detected face before embedding
+
+    Returns:
+        list: One flattened embedding per input path, or None where the
+        image could not be decoded or contained no face
+    """
+    image_paths = list(image_paths)
+    embeddings = [None] * len(image_paths)
+    if not image_paths:
+        return embeddings
+
+    batch_size = max(1, int(batch_size))
+    load = partial(_load_face_image_or_none, detect_face=detect_face)
+
+    with ThreadPoolExecutor(max_workers=max(1, int(num_workers))) as pool:
+        def submit(start):
+            return [pool.submit(load, path) for path in image_paths[start:start + batch_size]]
+
+        pending = submit(0)
+        for start in range(0, len(image_paths), batch_size):
+            images = [future.result() for future in pending]
+            next_start = start + batch_size
+            pending = submit(next_start) if next_start < len(image_paths) else []
+
+            valid = [i for i, img in enumerate(images) if img is not None]
+            if not valid:
+                continue
+
+            output = embed_face_images([images[i] for i in valid])
+            for row, i in enumerate(valid):
+                embeddings[start + i] = output[row]
+
+    return embeddings
+
+
+@lru_cache(maxsize=None)
+def _embedding_function_class():
+    # langchain is imported when a Chroma store is opened, like torch when
+    # the model is loaded, so door agents that only warm up skip it
+    from langchain.embeddings.base import Embeddings
+
+    # Define the embedding function wrapper
+    class FaceEmbeddingFunction(Embeddings):
+        def embed_documents(self, images):
+            """Embed a list of images (paths) in batches."""
+            return extract_embeddings_batch(images)
+
+        def embed_query(self, image):
+            """Embed a single image (path)."""
+            return self._extract_embedding(image)
+
+        @staticmethod
+        def _extract_embedding(image_path):
+            """Extract face embedding from an image."""
+            try:
+                return embed_face_images([load_face_image(image_path)])[0]
+            except Exception as e:
+                logger.error("Error processing image %s: %s", image_path, e)
+                return None
+
+    return FaceEmbeddingFunction
 
 
 def get_embeddings():
-    face_embedding_function = FaceEmbeddingFunction()
+    face_embedding_function = _embedding_function_class()()
     return face_embedding_function
 
 
 def extract_embedding_from_frame(face_frame):
-    """Extract face embedding from a detected face frame."""
+    """Extract face embedding from an OpenCV (BGR) frame or detected face region."""
     try:
-        # Convert the frame to PIL image
-        img = Image.fromarray(face_frame).resize((160, 160)).convert('RGB')
-        img_tensor = torch.tensor(np.array(img)).permute(2, 0, 1).unsqueeze(0).float()
-        with torch.no_grad():
-            embedding = model(img_tensor)
-        return embedding.detach().cpu().numpy().flatten()  # Flatten the embedding
+        # Convert the BGR frame to RGB, as if it had been decoded from disk
+        rgb_frame = cv2.cvtColor(face_frame, cv2.COLOR_BGR2RGB)
+        return embed_face_images([prepare_face(rgb_frame, detect_face=False)])[0]
     except Exception as e:
-        print(f"Error extracting embedding: {e}")
+        logger.error("Error extracting embedding: %s", e)
         return None
 
 def trace_and_annotate_faces(camera_index=0):
     """Open the PC camera, detect faces, annotate them, and optionally extract embeddings."""
-    # Load Haar cascade for face detection
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+    # Shared Haar cascade face detector
+    face_detector = get_face_detector()
     
     # Initialize the camera
     cap = cv2.VideoCapture(camera_index)
@@ -91,11 +230,8 @@ def trace_and_annotate_faces(camera_index=0):
                 print("Error: Unable to capture frame")
                 break
 
-            # Convert to grayscale for face detection
-            gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            
             # Detect faces
-            faces = face_cascade.detectMultiScale(gray_frame, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+            faces = face_detector.detect(frame)
             
             for (x, y, w, h) in faces:
                 # Draw a rectangle around the face
@@ -0,0 +1,106 @@
+import cv2
+import time
+from collections import deque
+from threading import Thread, Condition
+
+
+def sharpness(frame):
+    """Variance of the Laplacian; higher means a sharper frame."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    return cv2.Laplacian(gray, cv2.CV_64F).var()
+
+
+class FrameGrabber:
+    """
+    Drains a camera continuously on a dedicated thread into a small ring buffer
+    of (monotonic timestamp, frame) pairs.
+
+    Reading the camera only when a card is swiped returns whatever stale frame
+    the driver queued up; draining it all the time keeps the buffer current so
+    the card path can pick a frame without touching the camera.
+    """
+
+    def __init__(self, camera, buffer_size=8, read_error_delay=0.05):
+        self.camera = camera
+        self.read_error_delay = read_error_delay
+        self.frames = deque(maxlen=buffer_size)
+        self.is_running = False
+        self.read_errors = 0
+        self._condition = Condition()
+        self._thread = None
+
+    def start(self):
+        """Start the capture thread."""
+        if self.is_running:
+            return
+        self.is_running = True
+        self._thread = Thread(target=self._capture_loop, name="frame-grabber", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the capture thread and wait for it to exit."""
+        self.is_running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _capture_loop(self):
+        while self.is_running:
+            ret, frame = self.camera.read()
+            timestamp = time.monotonic()
+            if not ret:
+                self.read_errors += 1
+                time.sleep(self.read_error_delay)
+                continue
+            with self._condition:
+                self.frames.append((timestamp, frame))
+                self._condition.notify_all()
+
+    def wait_for_frame(self, timeout=1.0):
+        """Block until at least one frame is buffered. Returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self.frames) > 0, timeout)
+
+    def snapshot(self):
+        """Return a copy of the buffered (timestamp, frame) pairs, oldest first."""
+        with self._condition:
+            return list(self.frames)
+
+    def latest(self):
+        """Return the most recent (timestamp, frame) pair, or None."""
+        with self._condition:
+            return self.frames[-1] if self.frames else None
+
+    def frame_near(self, timestamp):
+        """Return the buffered (timestamp, frame) pair closest to `timestamp`."""
+        frames = self.snapshot()
+        if not frames:
+            return None
+        return min(frames, key=lambda item: abs(item[0] - timestamp))
+
+    def frames_in_window(self, timestamp, window):
+        """Return the buffered pairs captured within `window` seconds of `timestamp`."""
+        return [item for item in self.snapshot() if abs(item[0] - timestamp) <= window]
+
+    def burst(self, timestamp, window=0.3, max_frames=5):
+        """
+        Return up to `max_frames` frames captured within `window` seconds of
+        `timestamp`, nearest first, or just the closest frame if none is
+        inside the window.
+        """
+        candidates = sorted(self.frames_in_window(timestamp, window), key=lambda item: abs(item[0] - timestamp))
+        if not candidates:
+            nearest = self.frame_near(timestamp)
+            return [nearest[1]] if nearest is not None else []
+        return [frame for _, frame in candidates[:max_frames]]
+
+    def best_frame(self, timestamp, window=0.3, score=sharpness):
+        """
+        Return the highest-scoring (timestamp, frame) pair within `window`
+        seconds of `timestamp`, falling back to the closest frame if none of
+        the buffered frames fall inside the window.
+        """
+        candidates = self.frames_in_window(timestamp, window)
+        if not candidates:
+            return self.frame_near(timestamp)
+        return max(candidates, key=lambda item: score(item[1]))
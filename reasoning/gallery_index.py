@@ -0,0 +1,279 @@
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MATCH_THRESHOLD = 0.6
+
+
+class GalleryIndex:
+    """
+    In-memory gallery of enrolled face embeddings.
+
+    Embeddings are L2-normalized and kept in one contiguous float32 matrix, so
+    cosine similarity is a plain dot product. Each row is keyed by its
+    face_embeddings.face_embedding_id and belongs to a users.id, which lets a
+    card-claimed identity be verified against only that user's templates.
+
+    An index opened with from_snapshot() starts out backed by a read-only
+    memory-mapped snapshot (see reasoning.gallery_snapshot): the matrix and
+    row ids are views of the mapped file, and the first add() copies them
+    into private, growable arrays.
+    """
+
+    def __init__(self, dim=512, initial_capacity=1024):
+        self.dim = dim
+        self.threshold = DEFAULT_MATCH_THRESHOLD
+        self.size = 0
+        self.user_names = {}
+        self._lock = threading.RLock()
+        self._matrix = np.empty((max(1, initial_capacity), dim), dtype=np.float32)
+        self._row_user_ids = np.empty(max(1, initial_capacity), dtype=np.int64)
+        self._row_embedding_ids = []
+        self._row_by_embedding_id = {}
+        self._rows_by_user = {}
+        self.snapshot = None
+
+    @staticmethod
+    def normalize(embeddings):
+        """Return the embeddings as an L2-normalized float32 matrix."""
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def __len__(self):
+        return self.size
+
+    def _ensure_capacity(self, needed):
+        capacity = self._matrix.shape[0]
+        if needed <= capacity and self._matrix.flags.writeable:
+            return
+        capacity = max(capacity, 1)  # a matrix mapped from an empty snapshot has no rows
+        while capacity < needed:
+            capacity *= 2
+        matrix = np.empty((capacity, self.dim), dtype=np.float32)
+        matrix[:self.size] = self._matrix[:self.size]
+        row_user_ids = np.empty(capacity, dtype=np.int64)
+        row_user_ids[:self.size] = self._row_user_ids[:self.size]
+        self._matrix = matrix
+        self._row_user_ids = row_user_ids
+
+    def _embedding_id(self, row):
+        embedding_id = self._row_embedding_ids[row]
+        return embedding_id.decode() if isinstance(embedding_id, bytes) else embedding_id
+
+    def _materialize_ids(self):
+        """Turn snapshot-backed row ids into the list and dict add() updates."""
+        if not isinstance(self._row_embedding_ids, list):
+            self._row_embedding_ids = [self._embedding_id(row) for row in range(self.size)]
+        if self._row_by_embedding_id is None:
+            self._row_by_embedding_id = {embedding_id: row
+                                         for row, embedding_id in enumerate(self._row_embedding_ids)}
+
+    def add(self, user_id, embedding_ids, embeddings, name=None):
+        """
+        Add (or replace) templates for a user. A face_embedding_id already
+        in the index is overwritten in place, and moves to `user_id` if it
+        belonged to someone else.
+
+        Args:
+            user_id (int): users.id the templates belong to
+            embedding_ids (list): face_embeddings.face_embedding_id of each template
+            embeddings (list): One embedding per id
+            name (str): Optional user name, kept for 1:N reporting
+        """
+        embedding_ids = list(embedding_ids)
+        if not embedding_ids:
+            return
+        vectors = self.normalize(embeddings)
+        if vectors.shape != (len(embedding_ids), self.dim):
+            raise ValueError(f"Expected {len(embedding_ids)} embeddings of size {self.dim}, "
+                             f"got shape {vectors.shape}")
+
+        with self._lock:
+            if name is not None:
+                self.user_names[user_id] = name
+            self._ensure_capacity(self.size + len(embedding_ids))
+            self._materialize_ids()
+            user_rows = list(self._rows_by_user.get(user_id, ()))
+
+            for embedding_id, vector in zip(embedding_ids, vectors):
+                row = self._row_by_embedding_id.get(embedding_id)
+                if row is None:
+                    row = self.size
+                    self.size += 1
+                    self._row_embedding_ids.append(embedding_id)
+                    self._row_by_embedding_id[embedding_id] = row
+                    user_rows.append(row)
+                elif self._row_user_ids[row] != user_id:
+                    # The template changed hands: it must no longer verify the old owner's card
+                    self._detach_row(int(self._row_user_ids[row]), row)
+                    user_rows.append(row)
+                self._matrix[row] = vector
+                self._row_user_ids[row] = user_id
+
+            self._rows_by_user[user_id] = np.asarray(user_rows, dtype=np.int64)
+
+    def _detach_row(self, user_id, row):
+        rows = self._rows_by_user.get(user_id)
+        if rows is None:
+            return
+        rows = rows[rows != row]
+        if len(rows):
+            self._rows_by_user[user_id] = rows
+        else:
+            del self._rows_by_user[user_id]
+
+    def on_enrollment(self, user_id, name, card_uid, embedding_ids, embeddings):
+        """Enrollment listener that keeps the index in step with add_user."""
+        self.add(user_id, embedding_ids, embeddings, name=name)
+
+    def template_count(self, user_id):
+        """Number of templates enrolled for a user."""
+        with self._lock:
+            return len(self._rows_by_user.get(user_id, ()))
+
+    def verify(self, user_id, embedding, threshold=None):
+        """
+        1:1 check of a probe embedding against the claimed user's templates.
+
+        Returns:
+            tuple: (is_match, best cosine similarity or None if the user has
+            no templates)
+        """
+        threshold = self.threshold if threshold is None else threshold
+        probe = self.normalize(embedding)[0]
+        with self._lock:
+            rows = self._rows_by_user.get(user_id)
+            if rows is None or len(rows) == 0:
+                return False, None
+            scores = self._matrix[rows] @ probe
+        best_score = float(scores.max())
+        return best_score >= threshold, best_score
+
+    def identify(self, embedding, top_k=1, threshold=None):
+        """
+        1:N search of a probe embedding over the whole gallery.
+
+        Returns:
+            list: (user_id, face_embedding_id, score) tuples, best first
+        """
+        probe = self.normalize(embedding)[0]
+        with self._lock:
+            if self.size == 0:
+                return []
+            scores = self._matrix[:self.size] @ probe
+            top_k = min(top_k, self.size)
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            top = top[np.argsort(-scores[top])]
+            results = [
+                (int(self._row_user_ids[row]), self._embedding_id(row), float(scores[row]))
+                for row in top
+            ]
+        if threshold is not None:
+            results = [result for result in results if result[2] >= threshold]
+        return results
+
+    @classmethod
+    def load(cls, conn, chroma_db, dim=512, chunk_size=1000):
+        """
+        Build the index from the face_embeddings table and the vectors held in
+        Chroma.
+
+        Args:
+            conn: SQLite connection to the access control database
+            chroma_db: Chroma store holding one record per face_embedding_id
+            chunk_size (int): Number of ids fetched from Chroma per call
+        """
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT f.face_embedding_id, f.user_id, u.name
+            FROM face_embeddings f
+            JOIN users u ON f.user_id = u.id
+        """)
+        rows = cursor.fetchall()
+        owners = {embedding_id: (user_id, name) for embedding_id, user_id, name in rows}
+
+        index = cls(dim=dim, initial_capacity=max(1, len(rows)))
+        ids = list(owners)
+        for start in range(0, len(ids), chunk_size):
+            result = chroma_db.get(ids=ids[start:start + chunk_size], include=["embeddings"])
+            by_user = {}
+            for embedding_id, embedding in zip(result["ids"], result["embeddings"]):
+                user_ids, user_embeddings = by_user.setdefault(owners[embedding_id], ([], []))
+                user_ids.append(embedding_id)
+                user_embeddings.append(embedding)
+            for (user_id, name), (embedding_ids, embeddings) in by_user.items():
+                index.add(user_id, embedding_ids, embeddings, name=name)
+
+        logger.info("Loaded %d face templates for %d users", index.size, len(index.user_names))
+        return index
+
+    def to_snapshot(self, directory, watermark=None, keep=3):
+        """
+        Publish the index as a new snapshot version in a directory.
+
+        Args:
+            directory (str): Snapshot directory
+            watermark (dict): database_watermark() the index is current with
+            keep (int): Published versions to keep
+
+        Returns:
+            str: Path of the new snapshot
+        """
+        from reasoning.gallery_snapshot import write_snapshot
+
+        with self._lock:
+            vectors = self._matrix[:self.size].copy()
+            user_ids = self._row_user_ids[:self.size].copy()
+            embedding_ids = [self._embedding_id(row) for row in range(self.size)]
+            user_names = dict(self.user_names)
+        return write_snapshot(directory, vectors, user_ids, embedding_ids, user_names,
+                              watermark=watermark, keep=keep)
+
+    @classmethod
+    def from_snapshot(cls, path, verify=False):
+        """
+        Open an index backed by a memory-mapped snapshot file or directory.
+        Nothing is copied, so this takes milliseconds even for large galleries.
+        """
+        from reasoning.gallery_snapshot import load_snapshot
+
+        snapshot = load_snapshot(path, verify=verify)
+        index = cls(dim=snapshot.dim, initial_capacity=1)
+        index.size = len(snapshot)
+        index.user_names = dict(snapshot.user_names)
+        index._matrix = snapshot.vectors
+        index._row_user_ids = snapshot.user_ids
+        index._row_embedding_ids = snapshot.embedding_ids
+        index._row_by_embedding_id = None
+        index._rows_by_user = {int(user_id): np.arange(start, start + count, dtype=np.int64)
+                               for user_id, start, count in snapshot.users}
+        index.snapshot = snapshot
+        logger.info("Mapped gallery snapshot v%d: %d face templates for %d users",
+                    snapshot.version, index.size, len(index.user_names))
+        return index
+
+    @classmethod
+    def load_with_snapshot(cls, conn, chroma_db, snapshot_dir, dim=512, verify=False):
+        """
+        Open the current snapshot in snapshot_dir if it matches the database,
+        otherwise fall back to load() from the stores. `verify` also checks
+        the body checksum, which reads the whole file; a corrupt snapshot is
+        then treated like a missing one.
+        """
+        from reasoning.gallery_snapshot import SnapshotError, database_watermark
+
+        try:
+            index = cls.from_snapshot(snapshot_dir, verify=verify)
+        except SnapshotError as e:
+            logger.info("No usable gallery snapshot (%s); loading from the stores", e)
+            return cls.load(conn, chroma_db, dim=dim)
+        if index.snapshot.watermark != database_watermark(conn):
+            logger.info("Gallery snapshot v%d is stale; loading from the stores", index.snapshot.version)
+            return cls.load(conn, chroma_db, dim=dim)
+        return index
@@ -0,0 +1,345 @@
+"""
+Versioned on-disk snapshots of the verification gallery.
+
+A snapshot is one file holding everything GalleryIndex needs:
+
+    preamble      magic, format version, header length, header CRC32
+    JSON header   dimension, row count, section offsets, user names, the
+                  database watermark it was taken at, CRC32 of the body
+    body          64-byte aligned sections:
+                    vectors         float32 [rows, dim], L2-normalized
+                    user_ids        int64 [rows]
+                    embedding_ids   fixed-width bytes [rows]
+                    users           int64 [users, 3] (user_id, first row, rows)
+
+Rows are sorted by user so each user's templates are one contiguous block.
+Readers mmap the file read-only, so every door process on a host shares
+the same pages through the page cache, and loading costs a header parse
+instead of a Chroma scan.
+
+Writers never touch a published file: each version is written to a
+temporary file, fsynced and renamed to gallery-<version>.snap, then the
+CURRENT file is replaced to point at it. Readers resolve CURRENT once, so
+they always see a complete version; older versions are pruned but stay
+readable by processes that still have them mapped.
+
+Opening a snapshot checks the preamble, the header CRC and the file size,
+but not the body CRC, which would read every page of the file. Door
+processes skip it to keep start-up at a header parse; the enrollment side
+(EnhancedDatabaseManager) and the `check` command verify the body.
+
+Usage:
+    python reasoning/gallery_snapshot.py write --db access_control.db --chroma-dir chroma_db_test --out snapshots
+    python reasoning/gallery_snapshot.py check snapshots
+"""
+import sys
+import os
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+import json
+import mmap
+import time
+import zlib
+import struct
+import sqlite3
+import logging
+import argparse
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"FACESNAP"
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct("<8sIII")
+ALIGNMENT = 64
+CURRENT_FILE = "CURRENT"
+CRC_CHUNK = 16 * 1024 * 1024
+
+
+class SnapshotError(ValueError):
+    """A snapshot file is missing, truncated, corrupt or of an unknown format."""
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _bytes_view(buffer):
+    # memoryview cannot cast a buffer with a zero in its shape (an empty gallery)
+    view = memoryview(buffer)
+    return view.cast("B") if view.nbytes else memoryview(b"")
+
+
+def _crc32(buffer, crc=0):
+    view = _bytes_view(buffer)
+    for start in range(0, len(view), CRC_CHUNK):
+        crc = zlib.crc32(view[start:start + CRC_CHUNK], crc)
+    return crc
+
+
+def database_watermark(conn):
+    """
+    Cheap fingerprint of the face_embeddings table: row count, highest id
+    and the change journal's sequence (see reasoning.reconciliation). A
+    snapshot taken at a different watermark is stale.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM face_embeddings")
+    rows, max_id = cursor.fetchone()
+    try:
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'face_embedding_changes'")
+        row = cursor.fetchone()
+        journal_seq = row[0] if row else 0
+    except sqlite3.OperationalError:
+        journal_seq = 0
+    return {"rows": rows, "max_id": max_id, "journal_seq": journal_seq}
+
+
+def current_snapshot_path(directory):
+    """Path of the version CURRENT points at, or None if nothing was published yet."""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as current_file:
+            name = current_file.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(directory, name) if name else None
+
+
+def _current_version(directory):
+    path = current_snapshot_path(directory)
+    if path is None:
+        return 0
+    try:
+        return int(os.path.basename(path).split("-")[1].split(".")[0])
+    except (IndexError, ValueError):
+        return 0
+
+
+def write_snapshot(directory, vectors, user_ids, embedding_ids, user_names, watermark=None, keep=3):
+    """
+    Publish a new snapshot version.
+
+    Args:
+        directory (str): Snapshot directory (created if needed)
+        vectors: [rows, dim] L2-normalized embeddings
+        user_ids: users.id of each row
+        embedding_ids: face_embedding_id of each row
+        user_names (dict): users.id -> name
+        watermark (dict): database_watermark() at the time the rows were read
+        keep (int): Published versions to keep, including the new one
+
+    Returns:
+        str: Path of the new version
+    """
+    os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    order = np.argsort(user_ids, kind="stable")
+    user_ids = user_ids[order]
+    vectors = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32)[order])
+    encoded_ids = [embedding_id.encode() if isinstance(embedding_id, str) else bytes(embedding_id)
+                   for embedding_id in embedding_ids]
+    id_width = max((len(embedding_id) for embedding_id in encoded_ids), default=1)
+    embedding_ids = np.array(encoded_ids, dtype=f"S{id_width}").reshape(-1)[order]
+    users, firsts, counts = np.unique(user_ids, return_index=True, return_counts=True)
+    users = np.stack([users, firsts, counts], axis=1).astype(np.int64).reshape(-1, 3)
+
+    sections, layout, offset = [], {}, 0
+    for name, array in (("vectors", vectors), ("user_ids", user_ids),
+                        ("embedding_ids", embedding_ids), ("users", users)):
+        offset = _aligned(offset)
+        layout[name] = {"offset": offset, "nbytes": array.nbytes}
+        sections.append((offset, array))
+        offset += array.nbytes
+    body_size = _aligned(offset)
+
+    body_crc, position = 0, 0
+    for section_offset, array in sections:
+        body_crc = zlib.crc32(bytes(section_offset - position), body_crc)
+        body_crc = _crc32(array, body_crc)
+        position = section_offset + array.nbytes
+    body_crc = zlib.crc32(bytes(body_size - position), body_crc)
+
+    version = _current_version(directory) + 1
+    header = json.dumps({
+        "version": version,
+        "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+        "rows": len(user_ids),
+        "id_width": id_width,
+        "users": len(users),
+        "sections": layout,
+        "body_size": body_size,
+        "body_crc32": body_crc,
+        "user_names": {str(user_id): name for user_id, name in user_names.items()},
+        "watermark": watermark,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }).encode("utf-8")
+    body_offset = _aligned(PREAMBLE.size + len(header))
+
+    name = f"gallery-{version:06d}.snap"
+    tmp_path = os.path.join(directory, f".{name}.tmp")
+    with open(tmp_path, "wb") as snapshot_file:
+        snapshot_file.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header), zlib.crc32(header)))
+        snapshot_file.write(header)
+        snapshot_file.write(bytes(body_offset - PREAMBLE.size - len(header)))
+        position = 0
+        for section_offset, array in sections:
+            snapshot_file.write(bytes(section_offset - position))
+            snapshot_file.write(_bytes_view(array))
+            position = section_offset + array.nbytes
+        snapshot_file.write(bytes(body_size - position))
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    path = os.path.join(directory, name)
+    os.replace(tmp_path, path)
+
+    current_tmp = os.path.join(directory, CURRENT_FILE + ".tmp")
+    with open(current_tmp, "w") as current_file:
+        current_file.write(name + "\n")
+        current_file.flush()
+        os.fsync(current_file.fileno())
+    os.replace(current_tmp, os.path.join(directory, CURRENT_FILE))
+
+    _prune(directory, version, keep)
+    logger.info("Wrote gallery snapshot v%d (%d templates, %.1f MB) in %.2fs", version, len(user_ids),
+                (body_offset + body_size) / 1e6, time.perf_counter() - start)
+    return path
+
+
+def _prune(directory, version, keep):
+    for name in os.listdir(directory):
+        if name.startswith("gallery-") and name.endswith(".snap"):
+            try:
+                old_version = int(name[len("gallery-"):-len(".snap")])
+            except ValueError:
+                continue
+            if old_version <= version - keep:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+
+class GallerySnapshot:
+    """
+    A snapshot mapped read-only. `vectors`, `user_ids`, `embedding_ids`
+    and `users` are numpy views of the mapped file; nothing is copied.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as snapshot_file:
+            try:
+                self._mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:  # empty file
+                raise SnapshotError(f"{path}: {e}") from e
+        if len(self._mmap) < PREAMBLE.size:
+            raise SnapshotError(f"{path}: truncated")
+        magic, format_version, header_size, header_crc = PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise SnapshotError(f"{path}: not a gallery snapshot")
+        if format_version != FORMAT_VERSION:
+            raise SnapshotError(f"{path}: unsupported snapshot format {format_version}")
+        header = self._mmap[PREAMBLE.size:PREAMBLE.size + header_size]
+        if len(header) != header_size or zlib.crc32(header) != header_crc:
+            raise SnapshotError(f"{path}: header checksum mismatch")
+        self.header = json.loads(header)
+        self.body_offset = _aligned(PREAMBLE.size + header_size)
+        if len(self._mmap) < self.body_offset + self.header["body_size"]:
+            raise SnapshotError(f"{path}: truncated")
+
+        self.version = self.header["version"]
+        self.dim = self.header["dim"]
+        self.watermark = self.header.get("watermark")
+        self.user_names = {int(user_id): name for user_id, name in self.header["user_names"].items()}
+        rows = self.header["rows"]
+        self.vectors = self._section("vectors", np.float32, (rows, self.dim))
+        self.user_ids = self._section("user_ids", np.int64, (rows,))
+        self.embedding_ids = self._section("embedding_ids", f"S{self.header['id_width']}", (rows,))
+        self.users = self._section("users", np.int64, (self.header["users"], 3))
+
+    def __len__(self):
+        return self.header["rows"]
+
+    def _section(self, name, dtype, shape):
+        section = self.header["sections"][name]
+        count = int(np.prod(shape))
+        return np.frombuffer(self._mmap, dtype=dtype, count=count,
+                             offset=self.body_offset + section["offset"]).reshape(shape)
+
+    def verify(self):
+        """Check the body checksum; reads the whole file once."""
+        body = memoryview(self._mmap)[self.body_offset:self.body_offset + self.header["body_size"]]
+        try:
+            if _crc32(body) != self.header["body_crc32"]:
+                raise SnapshotError(f"{self.path}: body checksum mismatch")
+        finally:
+            body.release()
+
+    def is_current_for(self, conn):
+        """True when the database has not changed since the snapshot was taken."""
+        return self.watermark is not None and self.watermark == database_watermark(conn)
+
+
+def load_snapshot(path, verify=False):
+    """Map a snapshot file, or the CURRENT version of a snapshot directory."""
+    if os.path.isdir(path):
+        resolved = current_snapshot_path(path)
+        if resolved is None:
+            raise SnapshotError(f"{path}: no snapshot published")
+        path = resolved
+    try:
+        snapshot = GallerySnapshot(path)
+    except FileNotFoundError as e:
+        raise SnapshotError(f"{path}: {e}") from e
+    if verify:
+        snapshot.verify()
+    return snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write or check gallery snapshots")
+    commands = parser.add_subparsers(dest="command", required=True)
+    write = commands.add_parser("write", help="Publish a snapshot of the current stores")
+    write.add_argument("--db", default="access_control.db")
+    write.add_argument("--chroma-dir", default="chroma_db_test")
+    write.add_argument("--out", default="snapshots", help="Snapshot directory")
+    write.add_argument("--keep", type=int, default=3, help="Versions to keep")
+    check = commands.add_parser("check", help="Verify a snapshot's checksums and freshness")
+    check.add_argument("path", help="Snapshot file or directory")
+    check.add_argument("--db", help="Also report whether it matches this database")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.command == "check":
+        start = time.perf_counter()
+        snapshot = load_snapshot(args.path)
+        mapped = time.perf_counter() - start
+        snapshot.verify()
+        print(f"{snapshot.path}: v{snapshot.version}, {len(snapshot)} templates for "
+              f"{len(snapshot.user_names)} users, mapped in {mapped * 1000:.1f} ms, checksum OK")
+        if args.db:
+            conn = sqlite3.connect(args.db)
+            try:
+                print("Up to date with the database" if snapshot.is_current_for(conn)
+                      else "Stale: the database changed since it was written")
+            finally:
+                conn.close()
+        return
+
+    from langchain_community.vectorstores import Chroma
+    from reasoning.face_recognition_model import get_embeddings
+    from reasoning.gallery_index import GalleryIndex
+
+    conn = sqlite3.connect(args.db)
+    try:
+        chroma_db = Chroma(persist_directory=args.chroma_dir, embedding_function=get_embeddings())
+        watermark = database_watermark(conn)
+        gallery = GalleryIndex.load(conn, chroma_db)
+    finally:
+        conn.close()
+    print(f"Published {gallery.to_snapshot(args.out, watermark=watermark, keep=args.keep)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import os
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INPUT_SHAPE = (3, 160, 160)
+
+
+def load_facenet(cache_path=None):
+    """
+    Build the pretrained InceptionResnetV1 (vggface2), or load it from a
+    TorchScript cache file. The cache is traced and written atomically on
+    the first load if it does not exist yet.
+
+    Returns:
+        tuple: (model in eval mode, "torchscript_cache" or "pretrained")
+    """
+    import torch
+
+    if cache_path and os.path.exists(cache_path):
+        return torch.jit.load(cache_path, map_location="cpu").eval(), "torchscript_cache"
+
+    from facenet_pytorch import InceptionResnetV1
+    model = InceptionResnetV1(pretrained='vggface2').eval()
+    if cache_path:
+        save_torchscript(model, cache_path)
+    return model, "pretrained"
+
+
+def save_torchscript(model, path):
+    """Trace a model on a dummy face batch and save it to `path` atomically."""
+    import torch
+
+    try:
+        with torch.inference_mode():
+            traced = torch.jit.trace(model, torch.zeros(1, *INPUT_SHAPE))
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        traced.save(tmp_path)
+        os.replace(tmp_path, path)
+        logger.info("Saved TorchScript model cache to %s", path)
+    except Exception as e:
+        logger.warning("Could not write model cache %s: %s", path, e)
+
+
+def variant_path(path, suffix):
+    """facenet.pt -> facenet.<suffix>.pt, so each backend variant caches separately."""
+    if not path:
+        return None
+    root, ext = os.path.splitext(path)
+    return f"{root}.{suffix}{ext}"
+
+
+class TorchBackend:
+    """
+    FaceNet on the CPU through PyTorch.
+
+    Args:
+        model_cache (str): Optional TorchScript cache file (see load_facenet)
+        quantize (bool): Apply dynamic int8 quantization. PyTorch only
+            quantizes the Linear layers dynamically, so on FaceNet this
+            mostly shrinks the final projection; use the onnx backend with
+            quantize=True to also run the convolutions in int8.
+        channels_last (bool): Run the convolutions on NHWC tensors
+        num_threads (int): Intra-op threads for inference. Keep this below
+            the core count so the camera and RFID threads are not starved.
+    """
+
+    name = "torch"
+
+    def __init__(self, model_cache=None, quantize=False, channels_last=False, num_threads=None):
+        import torch
+
+        self.quantize = quantize
+        self.channels_last = channels_last
+        self.num_threads = num_threads
+        if num_threads:
+            torch.set_num_threads(int(num_threads))
+
+        if quantize:
+            cache = variant_path(model_cache, "int8")
+            if cache and os.path.exists(cache):
+                model, source = torch.jit.load(cache, map_location="cpu").eval(), "torchscript_cache"
+            else:
+                model, source = load_facenet()
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+                if cache:
+                    save_torchscript(model, cache)
+        else:
+            model, source = load_facenet(model_cache)
+
+        if channels_last:
+            model = model.to(memory_format=torch.channels_last)
+        self.model = model
+        self.source = source
+
+    def describe(self):
+        return {
+            "backend": self.name,
+            "source": self.source,
+            "quantize": self.quantize,
+            "channels_last": self.channels_last,
+            "num_threads": self.num_threads,
+        }
+
+    def __call__(self, batch):
+        """Embed an (N, 160, 160, 3) uint8 RGB batch; returns an (N, 512) float32 array."""
+        import torch
+
+        img_tensor = torch.from_numpy(np.ascontiguousarray(batch)).permute(0, 3, 1, 2).float()
+        if self.channels_last:
+            img_tensor = img_tensor.contiguous(memory_format=torch.channels_last)
+        with torch.inference_mode():
+            return self.model(img_tensor).cpu().numpy()
+
+
+class OnnxBackend:
+    """
+    FaceNet exported to ONNX and run with onnxruntime.
+
+    The graph is exported from the PyTorch model the first time `onnx_path`
+    is missing. With quantize=True a dynamically int8-quantized copy
+    (weights of the convolutions and the projection) is written next to it
+    and used instead.
+
+    Args:
+        onnx_path (str): Where the exported graph is kept
+        quantize (bool): Run the int8-quantized graph
+        num_threads (int): onnxruntime intra-op threads
+    """
+
+    name = "onnx"
+
+    def __init__(self, onnx_path="facenet.onnx", quantize=False, num_threads=None, model_cache=None):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise RuntimeError("The onnx backend needs onnxruntime (pip install onnxruntime)") from e
+
+        self.quantize = quantize
+        self.num_threads = num_threads
+        if not os.path.exists(onnx_path):
+            self.export(onnx_path, model_cache=model_cache)
+
+        model_path = onnx_path
+        if quantize:
+            model_path = variant_path(onnx_path, "int8")
+            if not os.path.exists(model_path):
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+                quantize_dynamic(onnx_path, model_path, weight_type=QuantType.QInt8)
+                logger.info("Wrote int8 ONNX model to %s", model_path)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.inter_op_num_threads = 1
+        if num_threads:
+            options.intra_op_num_threads = int(num_threads)
+        self.session = onnxruntime.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+        self.source = model_path
+
+    @staticmethod
+    def export(onnx_path, model_cache=None):
+        """Export FaceNet to an ONNX graph with a dynamic batch dimension."""
+        import torch
+
+        model, _ = load_facenet(model_cache)
+        os.makedirs(os.path.dirname(os.path.abspath(onnx_path)), exist_ok=True)
+        tmp_path = onnx_path + ".tmp"
+        with torch.inference_mode():
+            torch.onnx.export(
+                model, torch.zeros(1, *INPUT_SHAPE), tmp_path,
+                input_names=["faces"], output_names=["embeddings"],
+                dynamic_axes={"faces": {0: "batch"}, "embeddings": {0: "batch"}},
+                opset_version=13,
+            )
+        os.replace(tmp_path, onnx_path)
+        logger.info("Exported FaceNet to %s", onnx_path)
+
+    def describe(self):
+        return {
+            "backend": self.name,
+            "source": self.source,
+            "quantize": self.quantize,
+            "num_threads": self.num_threads,
+        }
+
+    def __call__(self, batch):
+        """Embed an (N, 160, 160, 3) uint8 RGB batch; returns an (N, 512) float32 array."""
+        faces = np.ascontiguousarray(np.asarray(batch).transpose(0, 3, 1, 2), dtype=np.float32)
+        return self.session.run(None, {self.input_name: faces})[0]
+
+
+BACKENDS = {
+    "torch": TorchBackend,
+    "onnx": OnnxBackend,
+}
+
+
+def create_backend(name="torch", **options):
+    """
+    Create an inference backend by name.
+
+    Args:
+        name (str): "torch" or "onnx"
+        **options: Passed to the backend class; options set to None are dropped
+
+    Raises:
+        ValueError: If the backend name is unknown
+    """
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown inference backend {name!r}, expected one of {sorted(BACKENDS)}")
+    return backend_class(**{key: value for key, value in options.items() if value is not None})
@@ -0,0 +1,193 @@
+"""
+One-shot migration of a Chroma store written by older versions of add_user
+and reconcile_chromadb_with_sqlite.
+
+Those records carried the 512-d embedding a second time as a decimal string
+in the "embedding" metadata field (and the image path twice). Each record is
+rewritten with the vector as its embedding and compact metadata
+(name, card_uid, added_at), then the store's SQLite file is vacuumed. Disk
+size and query latency are measured before and after.
+
+Usage:
+    python reasoning/migrate_chroma_metadata.py chroma_db_test --output migration_report.json
+"""
+import sys
+import os
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+import ast
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LEGACY_KEYS = ("embedding", "image_path")
+
+
+def directory_size(path):
+    """Total size in bytes of every file under `path`."""
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                pass
+    return total
+
+
+def open_collection(chroma_dir):
+    from langchain_community.vectorstores import Chroma
+    from reasoning.face_recognition_model import get_embeddings
+
+    return Chroma(persist_directory=chroma_dir, embedding_function=get_embeddings())._collection
+
+
+def measure_latency(collection, probe_ids, rounds=20, n_results=5):
+    """Median milliseconds for the reads the access path and tools issue."""
+    if not probe_ids:
+        return {}
+    probes = collection.get(ids=probe_ids, include=["embeddings"])["embeddings"]
+
+    def median_ms(action):
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            action()
+            samples.append((time.perf_counter() - start) * 1000)
+        return float(np.median(samples))
+
+    return {
+        "get_metadata_ms": median_ms(
+            lambda: collection.get(ids=probe_ids, include=["metadatas", "documents"])),
+        "get_embeddings_ms": median_ms(
+            lambda: collection.get(ids=probe_ids, include=["embeddings"])),
+        "query_ms": median_ms(
+            lambda: collection.query(query_embeddings=[list(map(float, p)) for p in probes[:1]],
+                                     n_results=n_results, include=["metadatas", "distances"])),
+    }
+
+
+def legacy_ids(collection, page_size=1000):
+    """Ids of records whose metadata still holds the legacy fields."""
+    ids = []
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        ids.extend(
+            record_id for record_id, metadata in zip(page["ids"], page["metadatas"])
+            if metadata and any(key in metadata for key in LEGACY_KEYS)
+        )
+        offset += len(page["ids"])
+    return ids
+
+
+def rewrite(collection, ids, batch_size=500):
+    """
+    Re-add the given records with their vector as the embedding and the
+    legacy metadata fields dropped.
+
+    Returns:
+        int: Number of records rewritten
+    """
+    rewritten = 0
+    for start in range(0, len(ids), batch_size):
+        batch = collection.get(ids=ids[start:start + batch_size],
+                               include=["embeddings", "metadatas", "documents"])
+        records = []
+        for record_id, embedding, metadata, document in zip(
+                batch["ids"], batch["embeddings"], batch["metadatas"], batch["documents"]):
+            metadata = dict(metadata or {})
+            legacy_vector = metadata.pop("embedding", None)
+            image_path = metadata.pop("image_path", None)
+            if embedding is None or len(embedding) == 0:
+                if legacy_vector is None:
+                    logger.warning("Record %s has no vector, skipped", record_id)
+                    continue
+                embedding = ast.literal_eval(legacy_vector)
+            records.append((record_id, [float(x) for x in embedding], metadata, document or image_path or ""))
+
+        if not records:
+            continue
+        record_ids, embeddings, metadatas, documents = map(list, zip(*records))
+        # Delete and re-add rather than upsert, so the old metadata keys are
+        # dropped instead of merged
+        collection.delete(ids=record_ids)
+        collection.add(ids=record_ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+        rewritten += len(record_ids)
+        logger.info("Rewrote %d/%d records", start + len(batch["ids"]), len(ids))
+    return rewritten
+
+
+def vacuum(chroma_dir):
+    """Reclaim the space freed by the rewrite in Chroma's SQLite file."""
+    sqlite_path = os.path.join(chroma_dir, "chroma.sqlite3")
+    if not os.path.exists(sqlite_path):
+        return False
+    conn = sqlite3.connect(sqlite_path, timeout=30)
+    try:
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    return True
+
+
+def migrate(chroma_dir, backup=True, batch_size=500, probes=50, rounds=20):
+    """Rewrite a Chroma store in place and return a before/after report."""
+    if backup:
+        backup_dir = f"{chroma_dir.rstrip(os.sep)}.bak-{time.strftime('%Y%m%d-%H%M%S')}"
+        shutil.copytree(chroma_dir, backup_dir)
+        logger.info("Backed up %s to %s", chroma_dir, backup_dir)
+
+    collection = open_collection(chroma_dir)
+    probe_ids = collection.get(include=[], limit=probes)["ids"]
+    report = {
+        "chroma_dir": chroma_dir,
+        "records": collection.count(),
+        "before": dict(size_bytes=directory_size(chroma_dir),
+                       **measure_latency(collection, probe_ids, rounds)),
+    }
+
+    ids = legacy_ids(collection)
+    start = time.perf_counter()
+    report["rewritten"] = rewrite(collection, ids, batch_size)
+    report["vacuumed"] = vacuum(chroma_dir)
+    report["migration_seconds"] = time.perf_counter() - start
+
+    report["after"] = dict(size_bytes=directory_size(chroma_dir),
+                           **measure_latency(collection, probe_ids, rounds))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drop embedding strings from Chroma metadata")
+    parser.add_argument("chroma_dir", help="Chroma persist directory to migrate in place")
+    parser.add_argument("--no-backup", action="store_true", help="Do not copy the store first")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--probes", type=int, default=50, help="Records read per latency sample")
+    parser.add_argument("--rounds", type=int, default=20, help="Latency samples per read")
+    parser.add_argument("--output", help="Write the JSON report here as well")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if not os.path.isdir(args.chroma_dir):
+        parser.error(f"{args.chroma_dir} is not a directory")
+
+    report = migrate(args.chroma_dir, backup=not args.no_backup, batch_size=args.batch_size,
+                     probes=args.probes, rounds=args.rounds)
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
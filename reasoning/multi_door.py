@@ -0,0 +1,407 @@
+import sys
+import os
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+from reasoning.RFID_script import RFIDLogger
+from reasoning.access_control import AccessControl
+from reasoning.face_recognition_model import warm_up
+from reasoning.frame_grabber import FrameGrabber
+from reasoning.capture_sink import CaptureSink
+from reasoning.audit_writer import AuditWriter
+from reasoning.access_cache import AccessCache
+from reasoning.card_identity import CardDirectory
+from reasoning.quality_gate import QualityGate
+from reasoning.verification_client import VerificationClient, RemoteAccessControl
+from reasoning.thread_safe_access_control import open_camera
+from reasoning.tracing import RequestTrace, LatencyHistogram, get_registry
+import cv2
+import json
+import time
+import sqlite3
+import logging
+from collections import deque
+from queue import Queue, Empty
+from threading import Thread, Lock, Condition, Event
+
+logger = logging.getLogger(__name__)
+
+
+class DoorStats:
+    """Per-door counters and swipe-to-decision latencies."""
+
+    def __init__(self):
+        self.granted = 0
+        self.denied = 0
+        self.dropped = 0
+        self.latency = LatencyHistogram()
+        self._lock = Lock()
+
+    def record(self, status, latency):
+        with self._lock:
+            if status == "granted":
+                self.granted += 1
+            else:
+                self.denied += 1
+        self.latency.record(latency)
+
+    def record_drop(self):
+        with self._lock:
+            self.dropped += 1
+
+    def summary(self):
+        """Return counts and swipe-to-decision latency percentiles (in milliseconds)."""
+        with self._lock:
+            summary = {"granted": self.granted, "denied": self.denied, "dropped": self.dropped}
+        summary.update(self.latency.summary())
+        return summary
+
+
+class DoorLane:
+    """One RFID reader and camera pair."""
+
+    def __init__(self, door_id, camera_index=0, serial_port="/dev/ttyACM0", baud=9600,
+                 frame_buffer_size=8, frame_window=0.3, capture_sink=None, burst_size=5):
+        self.door_id = door_id
+        self.frame_window = frame_window
+        self.burst_size = burst_size
+        self.rfid_logger = RFIDLogger(port=serial_port, baud=baud)
+        self.camera = open_camera(camera_index)
+        self.frame_grabber = FrameGrabber(self.camera, buffer_size=frame_buffer_size)
+        self.capture_sink = capture_sink
+        self.stats = DoorStats()
+
+    def capture_photo(self, swipe_time):
+        """Return (frame, photo_path) for the sharpest frame around the swipe."""
+        captured = self.frame_grabber.best_frame(swipe_time, window=self.frame_window)
+        if captured is None:
+            logger.warning("[%s] Failed to capture photo: no frames buffered yet", self.door_id)
+            return None, None
+        _, frame = captured
+        photo_path = self.capture_sink.submit(frame) if self.capture_sink else None
+        return frame, photo_path
+
+    def capture_burst(self, swipe_time):
+        """Return (frames nearest the swipe first, photo_path of the archived nearest frame)."""
+        frames = self.frame_grabber.burst(swipe_time, window=self.frame_window, max_frames=self.burst_size)
+        if not frames:
+            logger.warning("[%s] Failed to capture photo: no frames buffered yet", self.door_id)
+            return [], None
+        photo_path = self.capture_sink.submit(frames[0]) if self.capture_sink else None
+        return frames, photo_path
+
+    def close(self):
+        self.frame_grabber.stop()
+        if self.capture_sink:
+            self.capture_sink.stop()
+        self.camera.release()
+        if self.rfid_logger.ser:
+            self.rfid_logger.ser.close()
+
+
+def build_lanes(config):
+    """Open a DoorLane for every entry under "doors" in a multi-door config."""
+    capture_dir = config.get("capture_dir", "captures")
+    lanes = []
+    for door in config["doors"]:
+        door_id = door["door_id"]
+        sink = None
+        if config.get("archive_captures", True):
+            # One subdirectory per door: each sink prunes every capture in its
+            # directory, so doors must not share one ("front" vs "front_2")
+            sink = CaptureSink(os.path.join(capture_dir, str(door_id)),
+                               max_files=config.get("max_archived_captures", 1000))
+        lanes.append(DoorLane(
+            door_id,
+            camera_index=door.get("camera_index", 0),
+            serial_port=door.get("serial_port", "/dev/ttyACM0"),
+            baud=door.get("baud", 9600),
+            frame_window=door.get("frame_window", 0.3),
+            capture_sink=sink,
+            burst_size=door.get("burst_size", 5),
+        ))
+    return lanes
+
+
+class MultiDoorAccessSystem:
+    """
+    Runs several doors in one process.
+
+    Every door feeds a shared, bounded pool of pending requests that a fixed
+    set of verification workers serves. A door is handed to at most one worker
+    at a time, so requests from the same door are decided in swipe order while
+    different doors are processed in parallel. The FaceNet model, the Chroma
+    handle and the gallery index are loaded once and shared by all workers,
+    unless `verification_socket` names a running verification service, in
+    which case the workers are thin clients of it.
+    """
+
+    def __init__(self, doors, db_path="../access_control.db", chroma_dir="chroma_db_test",
+                 workers=2, queue_size=32, enqueue_timeout=0.5, debounce_window=1.5, match_mode="all",
+                 use_quality_gate=True, verification_socket=None, snapshot_dir=None, ann_index_dir=None,
+                 quality_gate_options=None):
+        self.db_path = db_path
+        self.chroma_dir = chroma_dir
+        self.worker_count = workers
+        self.queue_size = queue_size
+        self.enqueue_timeout = enqueue_timeout
+        self.lanes = {lane.door_id: lane for lane in doors}
+        self.is_running = True
+        self.reload_requested = Event()
+        self.audit_writer = AuditWriter(db_path)
+        self.access_cache = AccessCache(debounce_window=debounce_window)
+        self.card_directory = CardDirectory()
+        for lane in self.lanes.values():
+            lane.rfid_logger.audit_writer = self.audit_writer
+
+        self.match_mode = match_mode
+        self.quality_gate = QualityGate(**(quality_gate_options or {})) if use_quality_gate else None
+        self.verification_socket = verification_socket
+        self.snapshot_dir = snapshot_dir
+        self.ann_index_dir = ann_index_dir
+        self.chroma_db = self.gallery = self.ann_index = None
+        self.generation = 0
+        if not verification_socket:
+            # Load the shared stores once; workers reuse them with their own connections
+            conn = sqlite3.connect(db_path)
+            loader = AccessControl(conn, db_path=db_path, chroma_dir=chroma_dir, match_mode=match_mode,
+                                   snapshot_dir=snapshot_dir, ann_index_dir=ann_index_dir)
+            self.chroma_db = loader.chroma_db
+            self.gallery = loader.gallery
+            self.ann_index = loader.ann_index
+            loader.close()
+
+        self._mailboxes = {door_id: deque() for door_id in self.lanes}
+        self._scheduled = set()
+        self._pending = 0
+        self._ready = Queue()
+        self._lock = Lock()
+        self._not_full = Condition(self._lock)
+        self._reload_lock = Lock()
+
+    @classmethod
+    def from_config(cls, config_path):
+        """
+        Build the system from a JSON file such as:
+
+            {"db_path": "access_control.db", "workers": 4, "queue_size": 64,
+             "quality_gate_options": {"require_motion": true},
+             "doors": [{"door_id": "front", "camera_index": 0, "serial_port": "/dev/ttyACM0"},
+                       {"door_id": "back", "camera_index": 1, "serial_port": "/dev/ttyACM1"}]}
+        """
+        with open(config_path) as config_file:
+            config = json.load(config_file)
+
+        lanes = build_lanes(config)
+
+        return cls(
+            lanes,
+            db_path=config.get("db_path", "../access_control.db"),
+            chroma_dir=config.get("chroma_dir", "chroma_db_test"),
+            workers=config.get("workers", 2),
+            queue_size=config.get("queue_size", 32),
+            enqueue_timeout=config.get("enqueue_timeout", 0.5),
+            debounce_window=config.get("debounce_window", 1.5),
+            match_mode=config.get("match_mode", "all"),
+            use_quality_gate=config.get("quality_gate", True),
+            quality_gate_options=config.get("quality_gate_options"),
+            verification_socket=config.get("verification_socket"),
+            snapshot_dir=config.get("snapshot_dir"),
+            ann_index_dir=config.get("ann_index_dir"),
+        )
+
+    def request_reload(self):
+        """Reload the shared gallery and Chroma handle before the next request."""
+        self.reload_requested.set()
+
+    def watch_enrollments(self, manager):
+        """
+        Follow users enrolled through an EnhancedDatabaseManager in this
+        process: cached card lookups are dropped and the shared stores reload.
+        """
+        manager.add_enrollment_listener(self.access_cache.on_enrollment)
+        manager.add_enrollment_listener(self.card_directory.on_enrollment)
+        manager.add_enrollment_listener(lambda *enrollment: self.request_reload())
+
+    def submit(self, door_id, access_request):
+        """
+        Queue a request for a door, waiting up to `enqueue_timeout` for room.
+
+        Returns:
+            bool: False when the system is saturated and the swipe was dropped
+        """
+        with self._not_full:
+            if not self._not_full.wait_for(lambda: self._pending < self.queue_size, self.enqueue_timeout):
+                self.lanes[door_id].stats.record_drop()
+                logger.warning("[%s] System busy, swipe dropped", door_id)
+                return False
+            self._pending += 1
+            self._mailboxes[door_id].append(access_request)
+            if door_id not in self._scheduled:
+                self._scheduled.add(door_id)
+                self._ready.put(door_id)
+        return True
+
+    def _finish(self, door_id):
+        with self._not_full:
+            self._pending -= 1
+            self._not_full.notify()
+            if self._mailboxes[door_id]:
+                self._ready.put(door_id)
+            else:
+                self._scheduled.discard(door_id)
+
+    def rfid_listener(self, lane):
+        """Listens for card scans on one door and submits them."""
+        if not lane.rfid_logger.connect():
+            logger.error("[%s] Failed to connect to RFID reader", lane.door_id)
+            return
+
+        def on_card_event(rfid_data, swipe_time):
+            trace = rfid_data.pop('trace', None) or RequestTrace()
+            rfid_data['is_recognized'] = True
+            rfid_data['door_id'] = lane.door_id
+            with trace.stage("frame_capture"):
+                if self.quality_gate is not None:
+                    frames, photo_path = lane.capture_burst(swipe_time)
+                    frame = frames[0] if frames else None
+                else:
+                    frame, photo_path = lane.capture_photo(swipe_time)
+                    frames = None
+            self.submit(lane.door_id, {
+                'rfid_data': rfid_data,
+                'frame': frame,
+                'frames': frames,
+                'photo_path': photo_path,
+                'swipe_time': swipe_time,
+                'trace': trace,
+                'queued_ns': time.perf_counter_ns(),
+            })
+
+        lane.rfid_logger.subscribe(on_card_event)
+        lane.rfid_logger.listen()
+
+    def _sync_shared_state(self, access_control, worker_generation):
+        if self.verification_socket:
+            if self.reload_requested.is_set():
+                self.reload_requested.clear()
+                access_control.reload()
+            return worker_generation
+        with self._reload_lock:
+            if self.reload_requested.is_set():
+                self.reload_requested.clear()
+                access_control.reload()
+                self.chroma_db, self.gallery = access_control.chroma_db, access_control.gallery
+                self.ann_index = access_control.ann_index
+                self.generation += 1
+            if worker_generation != self.generation:
+                access_control.chroma_db, access_control.gallery = self.chroma_db, self.gallery
+                access_control.ann_index = self.ann_index
+            return self.generation
+
+    def verification_worker(self):
+        """Serves doors from the ready queue with a thread-local AccessControl."""
+        if self.verification_socket:
+            access_control = RemoteAccessControl(VerificationClient(self.verification_socket))
+        else:
+            conn = sqlite3.connect(self.db_path)
+            access_control = AccessControl(conn, db_path=self.db_path, chroma_dir=self.chroma_dir,
+                                           initialize_schema=False, gallery=self.gallery,
+                                           chroma_db=self.chroma_db, audit_writer=self.audit_writer,
+                                           access_cache=self.access_cache, match_mode=self.match_mode,
+                                           quality_gate=self.quality_gate, card_directory=self.card_directory,
+                                           ann_index=self.ann_index, ann_index_dir=self.ann_index_dir)
+        generation = self.generation
+        try:
+            while self.is_running:
+                try:
+                    door_id = self._ready.get(timeout=1.0)
+                except Empty:
+                    continue
+
+                with self._lock:
+                    access_request = self._mailboxes[door_id].popleft()
+                trace = access_request['trace']
+                trace.add("queue_wait", access_request['queued_ns'], time.perf_counter_ns())
+                try:
+                    generation = self._sync_shared_state(access_control, generation)
+                    response = access_control.process_access_request(
+                        access_request['rfid_data'], face_frame=access_request['frame'], trace=trace,
+                        face_frames=access_request['frames']
+                    )
+                    trace.finish()
+                    latency = time.monotonic() - access_request['swipe_time']
+                    self.lanes[door_id].stats.record(response['status'], latency)
+                    mark = "✅ Access granted" if response['status'] == 'granted' else "❌ Access denied"
+                    logger.info("[%s] %s: %s (%.0f ms)", door_id, mark, response['message'], latency * 1000)
+                except Exception as e:
+                    logger.error("[%s] Error in verification worker: %s", door_id, e)
+                finally:
+                    self._finish(door_id)
+        finally:
+            access_control.close()
+
+    def stats(self):
+        """Return per-door statistics."""
+        return {door_id: lane.stats.summary() for door_id, lane in self.lanes.items()}
+
+    def latency_stats(self):
+        """Per-stage latency percentiles across all doors."""
+        return get_registry().summary()
+
+    def run(self, stats_interval=60):
+        """Starts every door and the worker pool until interrupted."""
+        threads = []
+        try:
+            logger.info("Starting multi-door system with %d doors and %d workers...",
+                        len(self.lanes), self.worker_count)
+            self.audit_writer.start()
+            if not self.verification_socket:
+                logger.info("FaceNet warm-up took %.2fs", warm_up())
+            for lane in self.lanes.values():
+                if lane.capture_sink:
+                    lane.capture_sink.start()
+                lane.frame_grabber.start()
+                threads.append(Thread(target=self.rfid_listener, args=(lane,), name=f"rfid-{lane.door_id}"))
+            for i in range(self.worker_count):
+                threads.append(Thread(target=self.verification_worker, name=f"verifier-{i}"))
+            for thread in threads:
+                thread.start()
+
+            last_report = time.monotonic()
+            while True:
+                time.sleep(1.0)
+                if stats_interval and time.monotonic() - last_report >= stats_interval:
+                    last_report = time.monotonic()
+                    for door_id, summary in self.stats().items():
+                        logger.info("[%s] %s", door_id, summary)
+
+        except KeyboardInterrupt:
+            logger.info("Shutting down multi-door system...")
+            self.is_running = False
+            for lane in self.lanes.values():
+                lane.rfid_logger.stop()
+            for thread in threads:
+                thread.join()
+
+        finally:
+            self.cleanup()
+
+    def cleanup(self):
+        """Releases every door's camera, reader and capture writer."""
+        logger.info("Cleaning up resources...")
+        for lane in self.lanes.values():
+            lane.close()
+        self.audit_writer.close()
+        for stage, summary in self.latency_stats().items():
+            logger.info("Latency %s: %s", stage, summary)
+        logger.info("Card cache: %s", self.access_cache.stats())
+        logger.info("Card directory: %s", self.card_directory.stats())
+        cv2.destroyAllWindows()
+        logger.info("Cleanup completed")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    config_path = sys.argv[1] if len(sys.argv) > 1 else "doors.json"
+    system = MultiDoorAccessSystem.from_config(config_path)
+    system.run()
@@ -0,0 +1,158 @@
+import cv2
+import numpy as np
+from reasoning.face_detector import get_face_detector
+
+# Failures that make a frame useless for FaceNet; the others only lower its rank
+HARD_FAILURES = {"no_face", "face_too_small"}
+
+
+class QualityGate:
+    """
+    Cheap checks that decide which frames of a swipe burst are worth a
+    FaceNet pass.
+
+    Each frame is scored on exposure (mean brightness and clipped pixels on
+    a downscaled copy), face presence, size and centering (Haar detection),
+    and blur (Laplacian variance of the face region resized to a fixed
+    width, so the threshold does not depend on how close the person stands).
+
+    select() walks the burst nearest-to-swipe first and stops at the first
+    frame that passes every check. If none passes, the best frames that at
+    least contain a usable face are still returned, so a slightly soft or
+    dim frame is tried rather than rejected outright. Frame-to-frame motion
+    of the face region is reported as a basic liveness signal; with
+    `require_motion` a static face (a photo held to the camera) is refused.
+    """
+
+    def __init__(self, detector=None, min_sharpness=40.0, min_brightness=40.0, max_brightness=215.0,
+                 max_clipped=0.3, min_face_fraction=0.12, max_center_offset=0.3,
+                 max_candidates=2, require_motion=False, min_motion=0.01, liveness_frames=3,
+                 sharpness_width=160, exposure_width=160):
+        self.detector = detector or get_face_detector()
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.max_clipped = max_clipped
+        self.min_face_fraction = min_face_fraction
+        self.max_center_offset = max_center_offset
+        self.max_candidates = max_candidates
+        self.require_motion = require_motion
+        self.min_motion = min_motion
+        self.liveness_frames = liveness_frames
+        self.sharpness_width = sharpness_width
+        self.exposure_width = exposure_width
+
+    @staticmethod
+    def _resize_to_width(image, width):
+        if width and image.shape[1] > width:
+            scale = width / image.shape[1]
+            return cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return image
+
+    def assess(self, frame):
+        """
+        Score one BGR frame.
+
+        Returns:
+            dict: passed, reasons (failed checks), score (higher is better),
+            face (padded crop or None), box and the raw measurements
+        """
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        reasons = []
+
+        small = self._resize_to_width(gray, self.exposure_width)
+        brightness = float(small.mean())
+        clipped = float(np.mean((small < 10) | (small > 245)))
+        if brightness < self.min_brightness:
+            reasons.append("too_dark")
+        elif brightness > self.max_brightness:
+            reasons.append("too_bright")
+        if clipped > self.max_clipped:
+            reasons.append("clipped")
+
+        result = {"brightness": brightness, "clipped": clipped, "box": None, "face": None,
+                  "face_fraction": 0.0, "center_offset": None, "sharpness": 0.0}
+
+        box = self.detector.select(self.detector.detect(gray), gray.shape)
+        if box is None:
+            reasons.append("no_face")
+            result.update(passed=False, reasons=reasons, score=0.0)
+            return result
+
+        x, y, w, h = box
+        height, width = gray.shape[:2]
+        face_fraction = w / width
+        center_offset = max(abs(x + w / 2 - width / 2) / width, abs(y + h / 2 - height / 2) / height)
+        if face_fraction < self.min_face_fraction:
+            reasons.append("face_too_small")
+        if center_offset > self.max_center_offset:
+            reasons.append("off_center")
+
+        face_gray = self._resize_to_width(gray[y:y + h, x:x + w], self.sharpness_width)
+        face_sharpness = float(cv2.Laplacian(face_gray, cv2.CV_64F).var())
+        if face_sharpness < self.min_sharpness:
+            reasons.append("blurry")
+
+        score = (min(face_sharpness / self.min_sharpness, 3.0)
+                 + min(face_fraction / self.min_face_fraction, 2.0)
+                 - 2.0 * center_offset)
+        result.update(
+            passed=not reasons, reasons=reasons, score=score, box=box,
+            face=self.detector.crop_box(frame, box), face_fraction=face_fraction,
+            center_offset=center_offset, sharpness=face_sharpness,
+        )
+        return result
+
+    @staticmethod
+    def motion(assessments, size=64):
+        """
+        Mean absolute frame-to-frame change of the face region (0..1), or None
+        with fewer than two faces.
+        """
+        faces = [
+            cv2.resize(cv2.cvtColor(a["face"], cv2.COLOR_BGR2GRAY) if a["face"].ndim == 3 else a["face"],
+                       (size, size), interpolation=cv2.INTER_AREA).astype(np.float32)
+            for a in assessments if a["face"] is not None and a["face"].size
+        ]
+        if len(faces) < 2:
+            return None
+        return float(np.mean([np.abs(a - b).mean() for a, b in zip(faces, faces[1:])]) / 255.0)
+
+    def select(self, frames):
+        """
+        Pick the frames to embed from a burst ordered nearest-to-swipe first.
+
+        Returns:
+            dict: candidates (face crops to embed, best first), assessments,
+            motion, live (None when motion was not measured) and reason
+            (why nothing usable was found, else None)
+        """
+        assessments = []
+        faces_seen = 0
+        for frame in frames:
+            if frame is None:
+                continue
+            assessment = self.assess(frame)
+            assessments.append(assessment)
+            if assessment["face"] is not None:
+                faces_seen += 1
+            enough_for_liveness = not self.require_motion or faces_seen >= self.liveness_frames
+            if assessment["passed"] and enough_for_liveness:
+                break
+
+        motion = self.motion(assessments)
+        live = None if motion is None else motion >= self.min_motion
+        passed = sorted((a for a in assessments if a["passed"]), key=lambda a: a["score"], reverse=True)
+        usable = passed or sorted(
+            (a for a in assessments if not HARD_FAILURES.intersection(a["reasons"])),
+            key=lambda a: a["score"], reverse=True,
+        )
+        candidates = [a["face"] for a in usable[:self.max_candidates]]
+
+        reason = None
+        if not candidates:
+            reason = "no_face" if faces_seen == 0 else "low_quality"
+        elif self.require_motion and not live:
+            candidates, reason = [], "no_motion"
+        return {"candidates": candidates, "assessments": assessments, "motion": motion,
+                "live": live, "reason": reason}
@@ -0,0 +1,312 @@
+import os
+import time
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Columns added to face_embeddings so changed source images can be detected
+FINGERPRINT_COLUMNS = {
+    "content_hash": "TEXT",
+    "file_mtime_ns": "INTEGER",
+    "file_size": "INTEGER",
+}
+
+CHANGE_JOURNAL_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS face_embedding_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        face_embedding_id TEXT NOT NULL,
+        op TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS face_embeddings_journal_insert
+    AFTER INSERT ON face_embeddings BEGIN
+        INSERT INTO face_embedding_changes (face_embedding_id, op) VALUES (NEW.face_embedding_id, 'upsert');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS face_embeddings_journal_update
+    AFTER UPDATE OF image_path, user_id, face_embedding_id ON face_embeddings BEGIN
+        INSERT INTO face_embedding_changes (face_embedding_id, op) VALUES (OLD.face_embedding_id, 'delete');
+        INSERT INTO face_embedding_changes (face_embedding_id, op) VALUES (NEW.face_embedding_id, 'upsert');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS face_embeddings_journal_delete
+    AFTER DELETE ON face_embeddings BEGIN
+        INSERT INTO face_embedding_changes (face_embedding_id, op) VALUES (OLD.face_embedding_id, 'delete');
+    END
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS reconcile_state (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    """,
+]
+
+
+def file_fingerprint(path, chunk_size=1 << 20):
+    """
+    Return (sha256 hex digest, mtime in ns, size in bytes) of a file, or
+    None if it cannot be read.
+    """
+    try:
+        stat = os.stat(path)
+        digest = hashlib.sha256()
+        with open(path, "rb") as image_file:
+            for chunk in iter(lambda: image_file.read(chunk_size), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest(), stat.st_mtime_ns, stat.st_size
+
+
+def ensure_reconciliation_schema(cursor):
+    """Add the fingerprint columns and the change journal to an existing database."""
+    cursor.execute("PRAGMA table_info(face_embeddings)")
+    existing = {row[1] for row in cursor.fetchall()}
+    for column, column_type in FINGERPRINT_COLUMNS.items():
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE face_embeddings ADD COLUMN {column} {column_type}")
+    for statement in CHANGE_JOURNAL_SCHEMA:
+        cursor.execute(statement)
+
+
+def log_progress(stage, done, total):
+    logger.info("%s: %d/%d", stage, done, total)
+
+
+class Reconciler:
+    """
+    Keeps the Chroma store in step with the face_embeddings table.
+
+    SQLite triggers journal every insert, update and delete on
+    face_embeddings; an incremental run only looks at journal entries past
+    the watermark kept in reconcile_state, so it costs nothing when nothing
+    changed. A full run diffs the two id sets in both directions (rows
+    without a vector, vectors without a row) and fingerprints the source
+    images: a file whose size or mtime changed is hashed, and re-embedded
+    only if its content hash changed.
+
+    Chroma is only ever asked for ids; vectors are re-embedded in batches of
+    `batch_size` images, each batch written and committed before the next,
+    with `progress(stage, done, total)` called after each one.
+    """
+
+    def __init__(self, manager, batch_size=256, delete_orphans=True, progress=log_progress):
+        self.manager = manager
+        self.conn = manager.conn
+        self.cursor = manager.conn.cursor()
+        self.batch_size = batch_size
+        self.delete_orphans = delete_orphans
+        self.progress = progress or (lambda stage, done, total: None)
+        ensure_reconciliation_schema(self.cursor)
+        self.conn.commit()
+
+    @property
+    def collection(self):
+        return self.manager.chroma_db._collection
+
+    def _watermark(self):
+        self.cursor.execute("SELECT value FROM reconcile_state WHERE name = 'journal_seq'")
+        row = self.cursor.fetchone()
+        return row[0] if row else None
+
+    def _set_watermark(self, seq):
+        self.cursor.execute("""
+            INSERT INTO reconcile_state (name, value) VALUES ('journal_seq', ?)
+            ON CONFLICT (name) DO UPDATE SET value = excluded.value
+        """, (seq,))
+        # Entries at or below the watermark are never read again
+        self.cursor.execute("DELETE FROM face_embedding_changes WHERE seq <= ?", (seq,))
+        self.conn.commit()
+
+    def run(self, full=False, check_files=None):
+        """
+        Reconcile SQLite and Chroma.
+
+        Args:
+            full (bool): Diff every id instead of only journaled changes. The
+                first run is always full.
+            check_files (bool): Fingerprint source images to catch changed
+                files; defaults to `full`
+
+        Returns:
+            dict: Counts of what was found and fixed
+        """
+        start = time.perf_counter()
+        self.cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM face_embedding_changes")
+        journal_seq = self.cursor.fetchone()[0]
+        watermark = self._watermark()
+        full = full or watermark is None
+        journal_seq = max(journal_seq, watermark or 0)
+        check_files = full if check_files is None else check_files
+
+        if full:
+            sqlite_ids = self._sqlite_ids()
+            chroma_ids = self._chroma_ids()
+            missing = sorted(sqlite_ids - chroma_ids)
+            orphans = sorted(chroma_ids - sqlite_ids)
+        else:
+            upserted, deleted = self._journal_changes(watermark, journal_seq)
+            present = self._existing_in_sqlite(upserted)
+            missing = sorted(present - self._existing_in_chroma(present))
+            gone = set(deleted) - self._existing_in_sqlite(deleted)
+            orphans = sorted(self._existing_in_chroma(gone))
+
+        changed = self._changed_files() if check_files else []
+        missing_ids = set(missing)
+        changed = [embedding_id for embedding_id in changed if embedding_id not in missing_ids]
+
+        report = {
+            "mode": "full" if full else "incremental",
+            "missing_in_chroma": len(missing),
+            "orphans_in_chroma": len(orphans),
+            "changed_images": len(changed),
+        }
+        report["embedded"], report["failed"] = self._reembed(missing + changed)
+        report["orphans_deleted"] = self._delete_from_chroma(orphans) if self.delete_orphans else 0
+        self._set_watermark(journal_seq)
+        report["seconds"] = time.perf_counter() - start
+        logger.info("Reconciliation (%s): %s", report["mode"], report)
+        return report
+
+    def _sqlite_ids(self):
+        self.cursor.execute("SELECT face_embedding_id FROM face_embeddings")
+        return {row[0] for row in self.cursor.fetchall()}
+
+    def _chroma_ids(self, page_size=5000):
+        ids = set()
+        offset = 0
+        while True:
+            page = self.collection.get(include=[], limit=page_size, offset=offset)["ids"]
+            if not page:
+                return ids
+            ids.update(page)
+            offset += len(page)
+
+    def _journal_changes(self, after_seq, up_to_seq):
+        self.cursor.execute("""
+            SELECT face_embedding_id, op FROM face_embedding_changes
+            WHERE seq > ? AND seq <= ? ORDER BY seq
+        """, (after_seq, up_to_seq))
+        upserted, deleted = set(), set()
+        for embedding_id, op in self.cursor.fetchall():
+            (upserted if op == "upsert" else deleted).add(embedding_id)
+        return upserted, deleted
+
+    def _existing_in_sqlite(self, ids, chunk_size=500):
+        ids = list(ids)
+        found = set()
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            self.cursor.execute(
+                f"SELECT face_embedding_id FROM face_embeddings "
+                f"WHERE face_embedding_id IN ({','.join('?' * len(chunk))})", chunk
+            )
+            found.update(row[0] for row in self.cursor.fetchall())
+        return found
+
+    def _existing_in_chroma(self, ids, chunk_size=1000):
+        ids = list(ids)
+        found = set()
+        for start in range(0, len(ids), chunk_size):
+            found.update(self.collection.get(ids=ids[start:start + chunk_size], include=[])["ids"])
+        return found
+
+    def _changed_files(self):
+        """
+        Ids whose source image content changed since it was last embedded.
+        Rows without a stored fingerprint get one as a baseline.
+        """
+        self.cursor.execute("""
+            SELECT face_embedding_id, image_path, content_hash, file_mtime_ns, file_size
+            FROM face_embeddings
+        """)
+        rows = self.cursor.fetchall()
+        changed, baselines = [], []
+        for done, (embedding_id, image_path, content_hash, mtime_ns, size) in enumerate(rows, 1):
+            try:
+                stat = os.stat(image_path)
+            except OSError:
+                continue
+            if content_hash is not None and (stat.st_mtime_ns, stat.st_size) == (mtime_ns, size):
+                continue
+            fingerprint = file_fingerprint(image_path)
+            if fingerprint is None:
+                continue
+            if content_hash is None or fingerprint[0] == content_hash:
+                # Same bytes (or first sighting): just record the fingerprint
+                baselines.append(fingerprint + (embedding_id,))
+            else:
+                changed.append(embedding_id)
+            if done % 1000 == 0:
+                self.progress("fingerprint", done, len(rows))
+
+        if baselines:
+            self.cursor.executemany("""
+                UPDATE face_embeddings SET content_hash = ?, file_mtime_ns = ?, file_size = ?
+                WHERE face_embedding_id = ?
+            """, baselines)
+            self.conn.commit()
+        return changed
+
+    def _reembed(self, ids):
+        """Embed the images behind `ids` in batches and write them to Chroma."""
+        if not ids:
+            return 0, 0
+        embedded = failed = 0
+        for start in range(0, len(ids), self.batch_size):
+            chunk = ids[start:start + self.batch_size]
+            self.cursor.execute(f"""
+                SELECT f.face_embedding_id, f.image_path, f.user_id, u.name, u.card_uid
+                FROM face_embeddings f
+                JOIN users u ON f.user_id = u.id
+                WHERE f.face_embedding_id IN ({','.join('?' * len(chunk))})
+            """, chunk)
+            rows = self.cursor.fetchall()
+            embeddings = self.manager.extract_embeddings([row[1] for row in rows])
+
+            written, fingerprints, by_user = [], [], {}
+            for (embedding_id, image_path, user_id, name, card_uid), embedding in zip(rows, embeddings):
+                if embedding is None:
+                    logger.warning("Could not embed %s for %s", image_path, embedding_id)
+                    failed += 1
+                    continue
+                written.append((embedding_id, embedding, image_path, {
+                    "name": name,
+                    "card_uid": card_uid,
+                    "added_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+                }))
+                fingerprint = file_fingerprint(image_path)
+                if fingerprint is not None:
+                    fingerprints.append(fingerprint + (embedding_id,))
+                user = by_user.setdefault(user_id, (name, card_uid, [], []))
+                user[2].append(embedding_id)
+                user[3].append(embedding)
+
+            if written:
+                self.manager.store_face_vectors(*zip(*written))
+                self.cursor.executemany("""
+                    UPDATE face_embeddings SET content_hash = ?, file_mtime_ns = ?, file_size = ?
+                    WHERE face_embedding_id = ?
+                """, fingerprints)
+                self.conn.commit()
+                for user_id, (name, card_uid, embedding_ids, vectors) in by_user.items():
+                    self.manager._notify_enrollment(user_id, name, card_uid, embedding_ids, vectors)
+            embedded += len(written)
+            self.progress("embed", min(start + len(chunk), len(ids)), len(ids))
+        return embedded, failed
+
+    def _delete_from_chroma(self, ids, chunk_size=1000):
+        for start in range(0, len(ids), chunk_size):
+            self.collection.delete(ids=ids[start:start + chunk_size])
+            self.progress("delete_orphans", min(start + chunk_size, len(ids)), len(ids))
+        # The identification index would otherwise keep returning deleted templates
+        if ids and self.manager.ann_index is not None:
+            self.manager.ann_index.remove(ids)
+            self.manager.save_ann_index()
+        return len(ids)
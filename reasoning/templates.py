@@ -0,0 +1,390 @@
+import time
+import logging
+import threading
+import numpy as np
+from reasoning.gallery_index import GalleryIndex, DEFAULT_MATCH_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEDOIDS = 3
+DEFAULT_CENTROID_WEIGHT = 0.5
+
+TEMPLATE_SCHEMA = [
+    # vector_sum is the sum of the user's normalized embeddings, so the
+    # centroid can be updated exactly when images are added
+    """
+    CREATE TABLE IF NOT EXISTS user_templates (
+        user_id INTEGER PRIMARY KEY,
+        dim INTEGER NOT NULL,
+        template_count INTEGER NOT NULL,
+        vector_sum BLOB NOT NULL,
+        centroid BLOB NOT NULL,
+        medoids BLOB NOT NULL,
+        medoid_count INTEGER NOT NULL,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS template_settings (
+        name TEXT PRIMARY KEY,
+        value REAL NOT NULL
+    )
+    """,
+]
+
+
+def select_medoids(vectors, k=DEFAULT_MEDOIDS, iterations=5):
+    """
+    Pick up to k rows of an L2-normalized matrix that best represent it
+    (a few rounds of k-medoids on cosine similarity, seeded farthest-first).
+
+    Returns:
+        np.ndarray: Row indices of the medoids
+    """
+    n = len(vectors)
+    if n <= k:
+        return np.arange(n)
+
+    similarity = vectors @ vectors.T
+    medoids = [int(similarity.sum(axis=1).argmax())]
+    while len(medoids) < k:
+        medoids.append(int(similarity[:, medoids].max(axis=1).argmin()))
+    medoids = np.asarray(medoids)
+
+    for _ in range(iterations):
+        assignment = similarity[:, medoids].argmax(axis=1)
+        updated = medoids.copy()
+        for cluster in range(k):
+            members = np.flatnonzero(assignment == cluster)
+            if len(members):
+                within = similarity[np.ix_(members, members)].sum(axis=1)
+                updated[cluster] = members[within.argmax()]
+        if np.array_equal(updated, medoids):
+            break
+        medoids = updated
+    return medoids
+
+
+def build_user_template(embeddings, medoids=DEFAULT_MEDOIDS):
+    """
+    Aggregate a user's embeddings.
+
+    Returns:
+        tuple: (vector_sum, normalized centroid, (m, dim) medoid matrix, count)
+    """
+    vectors = GalleryIndex.normalize(embeddings)
+    vector_sum = vectors.sum(axis=0)
+    centroid = GalleryIndex.normalize(vector_sum)[0]
+    medoid_rows = vectors[select_medoids(vectors, medoids)] if medoids else vectors[:0]
+    return vector_sum, centroid, medoid_rows, len(vectors)
+
+
+def merge_user_template(vector_sum, medoid_rows, count, new_embeddings, medoids=DEFAULT_MEDOIDS):
+    """
+    Fold new embeddings into an existing template without the old vectors:
+    the centroid stays exact, medoids are re-picked from the old medoids plus
+    the new embeddings.
+    """
+    vectors = GalleryIndex.normalize(new_embeddings)
+    vector_sum = vector_sum + vectors.sum(axis=0)
+    centroid = GalleryIndex.normalize(vector_sum)[0]
+    candidates = np.vstack([medoid_rows, vectors]) if len(medoid_rows) else vectors
+    medoid_rows = candidates[select_medoids(candidates, medoids)] if medoids else candidates[:0]
+    return vector_sum, centroid, medoid_rows, count + len(vectors)
+
+
+def fuse_scores(centroid_score, medoid_scores, centroid_weight=DEFAULT_CENTROID_WEIGHT):
+    """
+    Combine the centroid similarity with the best medoid similarity. The
+    centroid damps single outlier photos; the medoids keep users whose
+    photos form distinct clusters (glasses, lighting) from being averaged out.
+    """
+    if medoid_scores is None or len(medoid_scores) == 0:
+        return float(centroid_score)
+    return float(centroid_weight * centroid_score + (1 - centroid_weight) * np.max(medoid_scores))
+
+
+def calibrate_threshold(genuine_scores, impostor_scores, target_far=0.001):
+    """
+    Lowest threshold whose false accept rate on the impostor scores is at
+    most `target_far`, with the FAR and FRR it gives.
+    """
+    genuine = np.sort(np.asarray(genuine_scores, dtype=np.float64))
+    impostor = np.sort(np.asarray(impostor_scores, dtype=np.float64))
+    if len(impostor) == 0:
+        raise ValueError("Need impostor scores to calibrate a threshold")
+    allowed = int(np.floor(target_far * len(impostor)))
+    # Scores strictly above the (allowed+1)-th highest impostor are accepted
+    threshold = float(np.nextafter(impostor[len(impostor) - allowed - 1], np.inf))
+    far = float(np.mean(impostor >= threshold))
+    frr = float(np.mean(genuine < threshold)) if len(genuine) else None
+    return {"threshold": threshold, "far": far, "frr": frr, "target_far": target_far}
+
+
+class TemplateStore:
+    """
+    Per-user templates persisted in the user_templates table.
+
+    Registered as an enrollment listener, it keeps each user's template up
+    to date as images are added. With `fetch_vectors(ids)` (vectors for
+    face_embedding_ids, e.g. from Chroma) it rebuilds from every image the
+    user has; without it the new embeddings are merged in.
+
+    The number of medoids per template is the "medoids" template setting
+    (DEFAULT_MEDOIDS when unset), so templates are built the way the
+    stored threshold was calibrated; sync() rebuilds templates that were
+    built with a different count.
+    """
+
+    def __init__(self, conn, fetch_vectors=None, medoids=None):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.fetch_vectors = fetch_vectors
+        self.initialize_schema()
+        self.medoids = int(self.get_setting("medoids", DEFAULT_MEDOIDS)) if medoids is None else medoids
+
+    def initialize_schema(self):
+        for statement in TEMPLATE_SCHEMA:
+            self.cursor.execute(statement)
+        self.conn.commit()
+
+    def save(self, user_id, vector_sum, centroid, medoid_rows, count):
+        self.cursor.execute("""
+            INSERT INTO user_templates
+            (user_id, dim, template_count, vector_sum, centroid, medoids, medoid_count, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (user_id) DO UPDATE SET
+                dim = excluded.dim, template_count = excluded.template_count,
+                vector_sum = excluded.vector_sum, centroid = excluded.centroid,
+                medoids = excluded.medoids, medoid_count = excluded.medoid_count,
+                updated_at = excluded.updated_at
+        """, (user_id, len(centroid), count,
+              np.asarray(vector_sum, dtype=np.float32).tobytes(),
+              np.asarray(centroid, dtype=np.float32).tobytes(),
+              np.asarray(medoid_rows, dtype=np.float32).tobytes(), len(medoid_rows)))
+        self.conn.commit()
+
+    def get(self, user_id):
+        """Return (vector_sum, centroid, medoids, count) for a user, or None."""
+        self.cursor.execute("""
+            SELECT dim, template_count, vector_sum, centroid, medoids, medoid_count
+            FROM user_templates WHERE user_id = ?
+        """, (user_id,))
+        row = self.cursor.fetchone()
+        return self._decode(*row) if row else None
+
+    @staticmethod
+    def _decode(dim, count, vector_sum, centroid, medoids, medoid_count):
+        return (
+            np.frombuffer(vector_sum, dtype=np.float32),
+            np.frombuffer(centroid, dtype=np.float32),
+            np.frombuffer(medoids, dtype=np.float32).reshape(medoid_count, dim),
+            count,
+        )
+
+    def rebuild_user(self, user_id, embeddings):
+        """Recompute a user's template from all of their embeddings."""
+        if len(embeddings) == 0:
+            return
+        self.save(user_id, *build_user_template(embeddings, self.medoids))
+
+    def _user_embedding_ids(self, user_id):
+        self.cursor.execute("SELECT face_embedding_id FROM face_embeddings WHERE user_id = ?", (user_id,))
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def on_enrollment(self, user_id, name, card_uid, embedding_ids, embeddings):
+        """Enrollment listener (see EnhancedDatabaseManager.add_enrollment_listener)."""
+        if self.fetch_vectors is not None:
+            vectors = self.fetch_vectors(self._user_embedding_ids(user_id))
+            if len(vectors):
+                self.rebuild_user(user_id, vectors)
+                return
+        existing = self.get(user_id)
+        if existing is None:
+            self.rebuild_user(user_id, embeddings)
+        else:
+            vector_sum, _, medoid_rows, count = existing
+            self.save(user_id, *merge_user_template(vector_sum, medoid_rows, count, embeddings, self.medoids))
+
+    def stale_users(self):
+        """
+        Users whose stored template count differs from their enrolled
+        images, or whose template holds a different number of medoids.
+        """
+        self.cursor.execute("""
+            SELECT f.user_id FROM face_embeddings f
+            LEFT JOIN user_templates t ON t.user_id = f.user_id
+            GROUP BY f.user_id
+            HAVING COUNT(*) != COALESCE(MAX(t.template_count), -1)
+                OR MIN(COUNT(*), ?) != MAX(t.medoid_count)
+        """, (self.medoids,))
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def sync(self):
+        """Rebuild every missing or stale template; returns the number rebuilt."""
+        if self.fetch_vectors is None:
+            return 0
+        stale = self.stale_users()
+        for user_id in stale:
+            self.rebuild_user(user_id, self.fetch_vectors(self._user_embedding_ids(user_id)))
+        if stale:
+            logger.info("Rebuilt templates for %d users", len(stale))
+        return len(stale)
+
+    def load_all(self):
+        """Yield (user_id, name, (vector_sum, centroid, medoids, count)) for every template."""
+        self.cursor.execute("""
+            SELECT t.user_id, u.name, t.dim, t.template_count, t.vector_sum, t.centroid,
+                   t.medoids, t.medoid_count
+            FROM user_templates t JOIN users u ON u.id = t.user_id
+        """)
+        for user_id, name, *row in self.cursor.fetchall():
+            yield user_id, name, self._decode(*row)
+
+    def get_setting(self, name, default=None):
+        self.cursor.execute("SELECT value FROM template_settings WHERE name = ?", (name,))
+        row = self.cursor.fetchone()
+        return row[0] if row else default
+
+    def set_setting(self, name, value):
+        self.cursor.execute("""
+            INSERT INTO template_settings (name, value) VALUES (?, ?)
+            ON CONFLICT (name) DO UPDATE SET value = excluded.value
+        """, (name, float(value)))
+        self.conn.commit()
+
+
+def chroma_vector_fetcher(chroma_db, chunk_size=1000):
+    """fetch_vectors(ids) reading the records' vectors from a Chroma store."""
+    def fetch_vectors(ids):
+        vectors = []
+        for start in range(0, len(ids), chunk_size):
+            result = chroma_db.get(ids=ids[start:start + chunk_size], include=["embeddings"])
+            vectors.extend(embedding for embedding in result["embeddings"] if embedding is not None)
+        return np.asarray(vectors, dtype=np.float32)
+    return fetch_vectors
+
+
+class TemplateIndex:
+    """
+    In-memory per-user templates with the same verify/identify interface as
+    GalleryIndex.
+
+    A claimed identity costs 1 + medoids dot products however many images
+    the user enrolled, and the fused score (see fuse_scores) is compared
+    with a threshold calibrated for it, stored as the "fused_threshold"
+    template setting.
+    """
+
+    def __init__(self, dim=512, centroid_weight=DEFAULT_CENTROID_WEIGHT,
+                 threshold=DEFAULT_MATCH_THRESHOLD, medoids=DEFAULT_MEDOIDS):
+        self.dim = dim
+        self.centroid_weight = centroid_weight
+        self.threshold = threshold
+        self.medoids = medoids
+        self.user_names = {}
+        self._lock = threading.RLock()
+        self._templates = {}
+        self._centroid_users = []
+        self._centroids = np.empty((0, dim), dtype=np.float32)
+
+    def __len__(self):
+        return len(self._templates)
+
+    @property
+    def size(self):
+        return len(self._templates)
+
+    def add_user(self, user_id, centroid, medoid_rows, name=None, count=None, vector_sum=None):
+        with self._lock:
+            if name is not None:
+                self.user_names[user_id] = name
+            self._templates[user_id] = (
+                np.asarray(centroid, dtype=np.float32),
+                np.asarray(medoid_rows, dtype=np.float32).reshape(-1, self.dim),
+                count,
+                vector_sum,
+            )
+            self._rebuild_centroid_matrix()
+
+    def _rebuild_centroid_matrix(self):
+        self._centroid_users = list(self._templates)
+        self._centroids = (np.vstack([self._templates[u][0] for u in self._centroid_users])
+                           if self._centroid_users else np.empty((0, self.dim), dtype=np.float32))
+
+    def on_enrollment(self, user_id, name, card_uid, embedding_ids, embeddings):
+        """Enrollment listener that merges new images into the user's template."""
+        with self._lock:
+            existing = self._templates.get(user_id)
+            if existing is None or existing[3] is None:
+                vector_sum, centroid, medoid_rows, count = build_user_template(embeddings, self.medoids)
+            else:
+                _, old_medoids, old_count, old_sum = existing
+                vector_sum, centroid, medoid_rows, count = merge_user_template(
+                    old_sum, old_medoids, old_count, embeddings, self.medoids)
+            self.add_user(user_id, centroid, medoid_rows, name=name, count=count, vector_sum=vector_sum)
+
+    def template_count(self, user_id):
+        with self._lock:
+            template = self._templates.get(user_id)
+            return 0 if template is None else template[2] or 1
+
+    def verify(self, user_id, embedding, threshold=None):
+        """
+        1:1 check of a probe against the claimed user's template.
+
+        Returns:
+            tuple: (is_match, fused score or None if the user has no template)
+        """
+        threshold = self.threshold if threshold is None else threshold
+        probe = GalleryIndex.normalize(embedding)[0]
+        with self._lock:
+            template = self._templates.get(user_id)
+        if template is None:
+            return False, None
+        centroid, medoid_rows = template[0], template[1]
+        score = fuse_scores(float(centroid @ probe), medoid_rows @ probe, self.centroid_weight)
+        return score >= threshold, score
+
+    def identify(self, embedding, top_k=1, threshold=None):
+        """
+        1:N search over user centroids.
+
+        Returns:
+            list: (user_id, "centroid", score) tuples, best first
+        """
+        probe = GalleryIndex.normalize(embedding)[0]
+        with self._lock:
+            if not self._centroid_users:
+                return []
+            scores = self._centroids @ probe
+            top_k = min(top_k, len(scores))
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            top = top[np.argsort(-scores[top])]
+            results = [(self._centroid_users[row], "centroid", float(scores[row])) for row in top]
+        if threshold is not None:
+            results = [result for result in results if result[2] >= threshold]
+        return results
+
+    @classmethod
+    def load(cls, conn, chroma_db, dim=512, **options):
+        """
+        Load stored templates, first rebuilding any that are missing or out
+        of date from the vectors in Chroma.
+        """
+        start = time.perf_counter()
+        store = TemplateStore(conn, fetch_vectors=chroma_vector_fetcher(chroma_db))
+        store.sync()
+        options.setdefault("threshold", store.get_setting("fused_threshold", DEFAULT_MATCH_THRESHOLD))
+        options.setdefault("centroid_weight", store.get_setting("centroid_weight", DEFAULT_CENTROID_WEIGHT))
+        options.setdefault("medoids", store.medoids)
+        index = cls(dim=dim, **options)
+        for user_id, name, (vector_sum, centroid, medoid_rows, count) in store.load_all():
+            with index._lock:
+                index.user_names[user_id] = name
+                index._templates[user_id] = (centroid, medoid_rows, count, vector_sum)
+        index._rebuild_centroid_matrix()
+        logger.info("Loaded templates for %d users in %.2fs (threshold %.3f)",
+                    len(index), time.perf_counter() - start, index.threshold)
+        return index
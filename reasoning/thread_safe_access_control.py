@@ -4,182 +4,330 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.append(project_root)
 from reasoning.RFID_script import RFIDLogger
 from reasoning.access_control import AccessControl
+from reasoning.face_recognition_model import warm_up
+from reasoning.frame_grabber import FrameGrabber
+from reasoning.capture_sink import CaptureSink
+from reasoning.audit_writer import AuditWriter
+from reasoning.access_cache import AccessCache
+from reasoning.card_identity import CardDirectory
+from reasoning.quality_gate import QualityGate
+from reasoning.verification_client import VerificationClient, RemoteAccessControl
+from reasoning.tracing import RequestTrace, get_registry
 import cv2
 import time
-from threading import Thread, Lock
+import signal
+from threading import Thread, Lock, Event, local
 from queue import Queue
 import os
 import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+def open_camera(camera_index):
+    """Opens a camera and checks that it delivers frames, raising RuntimeError if not."""
+    # Initialize camera with proper error handling
+    logger.info("Initializing camera...")
+    camera = cv2.VideoCapture(int(camera_index))  # Ensure camera_index is an integer
+    
+    # Check if camera opened successfully
+    if not camera.isOpened():
+        logger.error("Error: Could not open camera")
+        logger.info("Please check if:")
+        logger.info("- A webcam is connected to your computer")
+        logger.info("- The webcam isn't being used by another application")
+        logger.info("- You have permission to access the camera")
+        raise RuntimeError("Failed to initialize camera")
+        
+    # Test camera by capturing one frame
+    ret, frame = camera.read()
+    if not ret:
+        logger.error("Error: Could not read frame from camera")
+        camera.release()
+        raise RuntimeError("Failed to capture test frame")
+    return camera
+
 
 class AccessControlSystem:
-    def __init__(self, camera_index=0, db_path="../access_control.db"):
+    def __init__(self, camera_index=0, db_path="../access_control.db", chroma_dir="chroma_db_test",
+                 frame_buffer_size=8, frame_window=0.3, archive_captures=True,
+                 capture_dir="captures", max_archived_captures=1000, log_rfid_events=False,
+                 camera=None, rfid_logger=None, debounce_window=1.5, match_mode="all",
+                 use_quality_gate=True, burst_size=5, verification_socket=None,
+                 snapshot_dir=None, ann_index_dir=None, quality_gate_options=None):
+        """
+        `camera` and `rfid_logger` replace the camera at `camera_index` and the
+        reader on /dev/ttyACM0, e.g. with simulated hardware for benchmarks.
+
+        With `use_quality_gate`, up to `burst_size` frames around each swipe
+        are handed to the processor, which embeds only the best one or two
+        (see QualityGate); otherwise the sharpest frame is used.
+        `quality_gate_options` are QualityGate keyword arguments, e.g.
+        {"require_motion": True} to refuse a static face.
+
+        With `verification_socket`, decisions are made by the verification
+        service listening there (reasoning/verification_server.py) and this
+        process never loads the model or the gallery.
+
+        With `snapshot_dir`, the gallery is memory-mapped from the current
+        snapshot published there by enrollment when it is up to date. With
+        `ann_index_dir`, face mismatches are also identified against the
+        whole gallery through the identification index kept there.
+        """
         self.db_path = db_path
-        self.rfid_logger = RFIDLogger()
+        self.chroma_dir = chroma_dir
+        self.frame_window = frame_window
+        self.match_mode = match_mode
+        self.burst_size = burst_size
+        self.verification_socket = verification_socket
+        self.snapshot_dir = snapshot_dir
+        self.ann_index_dir = ann_index_dir
+        self.quality_gate = QualityGate(**(quality_gate_options or {})) if use_quality_gate else None
+        self.log_rfid_events = log_rfid_events
+        self.audit_writer = AuditWriter(db_path)
+        self.access_cache = AccessCache(debounce_window=debounce_window)
+        self.card_directory = CardDirectory()
+        self.rfid_logger = rfid_logger if rfid_logger is not None else RFIDLogger()
+        if self.rfid_logger.audit_writer is None:
+            self.rfid_logger.audit_writer = self.audit_writer
         
-        # Initialize camera with proper error handling
-        print("Initializing camera...")
-        self.camera = cv2.VideoCapture(int(camera_index))  # Ensure camera_index is an integer
-        
-        # Check if camera opened successfully
-        if not self.camera.isOpened():
-            print("Error: Could not open camera")
-            print("Please check if:")
-            print("- A webcam is connected to your computer")
-            print("- The webcam isn't being used by another application")
-            print("- You have permission to access the camera")
-            raise RuntimeError("Failed to initialize camera")
-            
-        # Test camera by capturing one frame
-        ret, frame = self.camera.read()
-        if not ret:
-            print("Error: Could not read frame from camera")
-            self.camera.release()
-            raise RuntimeError("Failed to capture test frame")
-            
-        print("Camera initialized successfully!")
+        self.camera = camera if camera is not None else open_camera(camera_index)
+        logger.info("Camera initialized successfully!")
+        self.frame_grabber = FrameGrabber(self.camera, buffer_size=frame_buffer_size)
         
         self.event_queue = Queue()
-        os.makedirs("captures", exist_ok=True)
+        self.capture_sink = CaptureSink(capture_dir, max_files=max_archived_captures) if archive_captures else None
         self.is_running = True
         self.db_lock = Lock()
+        # Bumped by request_reload(); every processor thread compares it with
+        # the generation it last reloaded at, so one request reaches them all
+        self.reload_generation = 0
+        self._reload_lock = Lock()
+        self._processor_state = local()
+        self.ready = Event()
+        self.started_at = None
+        self.threads = []
 
     def get_db_connection(self):
         """Creates a new database connection for the calling thread."""
         conn = sqlite3.connect(self.db_path)
         return conn
 
-    def capture_photo(self):
+    def capture_photo(self, swipe_time=None):
         """
         Captures a photo when an RFID card is detected.
-        Includes error handling and retry logic.
+        Picks the sharpest buffered frame around the swipe time from the
+        frame grabber, so the card path never waits on the camera.
+
+        Returns:
+            tuple: (frame, photo_path); photo_path is None when archiving is
+            disabled or the archive queue is full, frame is None on failure
         """
-        # Try up to 3 times to capture a photo
-        for attempt in range(3):
-            if not self.camera.isOpened():
-                print("Error: Camera is not open")
-                return None
-                
-            ret, frame = self.camera.read()
-            if ret:
-                timestamp = time.strftime("%Y%m%d-%H%M%S")
-                photo_path = f"captures/face_{timestamp}.jpg"
-                
-                try:
-                    cv2.imwrite(photo_path, frame)
-                    print(f"Photo captured successfully: {photo_path}")
-                    return photo_path
-                except Exception as e:
-                    print(f"Error saving photo: {e}")
-                    return None
-                    
-            print(f"Failed to capture photo, attempt {attempt + 1}/3")
-            time.sleep(0.5)  # Wait before retry
-            
-        print("Failed to capture photo after 3 attempts")
-        return None
+        if swipe_time is None:
+            swipe_time = time.monotonic()
+
+        captured = self.frame_grabber.best_frame(swipe_time, window=self.frame_window)
+        if captured is None:
+            logger.warning("Failed to capture photo: no frames buffered yet")
+            return None, None
+
+        _, frame = captured
+        photo_path = self.capture_sink.submit(frame) if self.capture_sink else None
+        return frame, photo_path
+
+    def capture_burst(self, swipe_time):
+        """
+        Collects the buffered frames around a swipe, nearest first, without
+        scoring them; the quality gate runs on the processor thread.
+
+        Returns:
+            tuple: (frames, photo_path); the nearest frame is the one archived
+        """
+        frames = self.frame_grabber.burst(swipe_time, window=self.frame_window, max_frames=self.burst_size)
+        if not frames:
+            logger.warning("Failed to capture photo: no frames buffered yet")
+            return [], None
+        photo_path = self.capture_sink.submit(frames[0]) if self.capture_sink else None
+        return frames, photo_path
+
+    def on_card_event(self, rfid_data, swipe_time):
+        """RFID subscriber: grabs the frame for a swipe and queues the request."""
+        trace = rfid_data.pop('trace', None) or RequestTrace()
+        rfid_data['is_recognized'] = True  # Set recognition status correctly
+        with trace.stage("frame_capture"):
+            if self.quality_gate is not None:
+                frames, photo_path = self.capture_burst(swipe_time)
+                frame = frames[0] if frames else None
+            else:
+                frame, photo_path = self.capture_photo(swipe_time)
+                frames = None
+        
+        access_request = {
+            'rfid_data': rfid_data,
+            'frame': frame,
+            'frames': frames,
+            'photo_path': photo_path,
+            'trace': trace,
+            'queued_ns': time.perf_counter_ns()
+        }
+        
+        self.event_queue.put(access_request)
 
     def rfid_listener(self):
-        """Continuously listens for RFID card scans."""
+        """Listens for RFID card scans until the system stops."""
         if not self.rfid_logger.connect():
-            print("Failed to connect to RFID reader")
+            logger.error("Failed to connect to RFID reader")
             return
 
-        while self.is_running:
-            try:
-                if self.rfid_logger.ser.in_waiting > 0:
-                    data = self.rfid_logger.ser.readline().decode("utf-8").strip()
-                    if data:
-                        rfid_data = self.rfid_logger.parse_rfid_data(data)
-                        if rfid_data:
-                            rfid_data['is_recognized'] = True  # Set recognition status correctly
-                            photo_path = self.capture_photo()
-                            
-                            access_request = {
-                                'rfid_data': rfid_data,
-                                'photo_path': photo_path
-                            }
-                            
-                            self.event_queue.put(access_request)
-                            
-                time.sleep(0.1)
-            except Exception as e:
-                print(f"Error in RFID listener: {e}")
+        self.rfid_logger.subscribe(self.on_card_event)
+        if self.log_rfid_events:
+            self.rfid_logger.subscribe(self.rfid_logger.log_event)
+        self.rfid_logger.listen()
 
-    def process_access_request(self, rfid_data, photo_path):
-        """Processes a single access request with its own database connection."""
-        print("entered process_access_request")
-        # Create a new database connection for this thread
+    def create_access_control(self):
+        """
+        Builds the long-lived verification engine for the calling thread.
+        The SQLite connection is bound to the thread that creates it, so each
+        processor thread owns exactly one engine for its whole lifetime.
+        """
+        if self.verification_socket:
+            return RemoteAccessControl(VerificationClient(self.verification_socket))
         conn = self.get_db_connection()
-        try:
-            print("treatment...")
-            # Create an AccessControl instance with the new connection
-            access_control = AccessControl(conn, db_path="../access_control.db", chroma_dir="chroma_db_test")
+        return AccessControl(conn, db_path=self.db_path, chroma_dir=self.chroma_dir,
+                             audit_writer=self.audit_writer, access_cache=self.access_cache,
+                             match_mode=self.match_mode, quality_gate=self.quality_gate,
+                             snapshot_dir=self.snapshot_dir, card_directory=self.card_directory,
+                             ann_index_dir=self.ann_index_dir)
 
-            # Process the request
-            print("process request...")
-            response = access_control.process_access_request(rfid_data, photo_path)
-            
-            return response
-            
-        finally:
-            # Always close the connection
-            conn.close()
+    def request_reload(self):
+        """
+        Asks every processor thread to reload its Chroma and SQLite state
+        before handling the next request, e.g. after users were enrolled.
+        """
+        with self._reload_lock:
+            self.reload_generation += 1
+
+    def watch_enrollments(self, manager):
+        """
+        Follow users enrolled through an EnhancedDatabaseManager in this
+        process: their cached card lookups are dropped at once and the
+        processor reloads its stores before the next request.
+        """
+        manager.add_enrollment_listener(self.access_cache.on_enrollment)
+        manager.add_enrollment_listener(self.card_directory.on_enrollment)
+        manager.add_enrollment_listener(lambda *enrollment: self.request_reload())
+
+    def process_access_request(self, access_control, rfid_data, frame, trace=None, frames=None):
+        """Processes a single access request on the thread's warm engine."""
+        generation = self.reload_generation
+        seen = getattr(self._processor_state, "reload_generation", 0)
+        if seen != generation:
+            self._processor_state.reload_generation = generation
+            access_control.reload()
+
+        return access_control.process_access_request(rfid_data, face_frame=frame, trace=trace,
+                                                     face_frames=frames)
+
+    def latency_stats(self):
+        """Per-stage latency percentiles for every request handled so far."""
+        return get_registry().summary()
 
     def access_processor(self):
         """Processes access requests from the queue with thread-safe database operations."""
+        self._processor_state.reload_generation = self.reload_generation
+        access_control = self.create_access_control()
+        if not self.verification_socket:
+            warm_up()
+        self.ready.set()
+        if self.started_at is not None:
+            logger.info("Ready to verify in %.2fs", time.perf_counter() - self.started_at)
+        try:
+            self._process_queue(access_control)
+        finally:
+            access_control.close()
+
+    def _process_queue(self, access_control):
+        """Drains the event queue until the system stops."""
         while self.is_running:
             try:
                 access_request = self.event_queue.get(timeout=1.0)
                 
                 # Extract the data
                 rfid_data = access_request['rfid_data']
-                photo_path = access_request['photo_path']
-                print(f"photo path: {photo_path}")
+                frame = access_request['frame']
+                trace = access_request['trace']
+                trace.add("queue_wait", access_request['queued_ns'], time.perf_counter_ns())
                 
                 # Log the detection
-                print(f"\nCard detected - UID: {rfid_data['uid']}")
-                print(f"Recognition status: {'Recognized' if rfid_data['is_recognized'] else 'Unknown'}")
+                logger.info("Card detected - UID: %s", rfid_data['uid'])
+                logger.debug("Photo path: %s", access_request['photo_path'])
                 
                 # # Use the lock when processing database operations
                 # with self.db_lock:
                 response = self.process_access_request(
+                    access_control,
                     rfid_data,
-                    photo_path
+                    frame,
+                    trace,
+                    access_request.get('frames')
                 )
+                durations = trace.finish()
                 
                 # Display the result
                 if response['status'] == 'granted':
-                    print(f"✅ Access granted: {response['message']}")
+                    logger.info("✅ Access granted: %s (%.0f ms)", response['message'], durations['total'])
                 else:
-                    print(f"❌ Access denied: {response['message']}")
-                    
-                print("-" * 50)
+                    logger.info("❌ Access denied: %s (%.0f ms)", response['message'], durations['total'])
                 
             except Exception as e:
                 if 'timeout' not in str(e).lower():
-                    print(f"Error in access processor: {e}")
+                    logger.error("Error in access processor: %s", e)
+
+    def start(self):
+        """Starts the writer, capture, RFID and processor threads."""
+        logger.info("Starting Thread-Safe Access Control System...")
+        self.started_at = time.perf_counter()
+        self.ready.clear()
+        self.is_running = True
+        self.audit_writer.start()
+        if self.capture_sink:
+            self.capture_sink.start()
+        self.frame_grabber.start()
+        if not self.frame_grabber.wait_for_frame(timeout=2.0):
+            logger.warning("No frames received from camera yet")
+
+        self.threads = [
+            Thread(target=self.rfid_listener, name="rfid-listener"),
+            Thread(target=self.access_processor, name="access-processor"),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """Stops the RFID and processor threads and waits for them."""
+        logger.info("Shutting down system...")
+        self.is_running = False
+        self.rfid_logger.stop()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
 
     def run(self):
         """Starts the system with thread-safe database handling."""
         try:
-            print("Starting Thread-Safe Access Control System...")
-            print("Waiting for cards to be scanned...")
-            
-            rfid_thread = Thread(target=self.rfid_listener)
-            processor_thread = Thread(target=self.access_processor)
+            # Enrollment runs in a separate process; `kill -HUP` tells the
+            # processor to pick up the new users and embeddings.
+            if hasattr(signal, "SIGHUP"):
+                signal.signal(signal.SIGHUP, lambda signum, frame: self.request_reload())
             
-            rfid_thread.start()
-            processor_thread.start()
+            self.start()
+            logger.info("Waiting for cards to be scanned...")
             
             while True:
                 time.sleep(0.1)
                 
         except KeyboardInterrupt:
-            print("\nShutting down system...")
-            self.is_running = False
-            
-            rfid_thread.join()
-            processor_thread.join()
+            self.stop()
             
         finally:
             self.cleanup()
@@ -188,24 +336,45 @@ class AccessControlSystem:
         """
         Cleans up system resources with proper error handling.
         """
-        print("Cleaning up resources...")
+        logger.info("Cleaning up resources...")
         
+        # Stop the capture thread before releasing the camera it reads from
+        if hasattr(self, 'frame_grabber'):
+            logger.info("Stopping frame grabber...")
+            self.frame_grabber.stop()
+
+        # Flush archived captures
+        if getattr(self, 'capture_sink', None):
+            logger.info("Flushing capture archive...")
+            self.capture_sink.stop()
+
+        # Drain pending access logs
+        if hasattr(self, 'audit_writer'):
+            logger.info("Flushing access logs...")
+            self.audit_writer.close()
+
         # Release camera
         if hasattr(self, 'camera') and self.camera is not None:
-            print("Releasing camera...")
+            logger.info("Releasing camera...")
             self.camera.release()
             
         # Close RFID reader
         if self.rfid_logger.ser:
-            print("Closing RFID reader...")
+            logger.info("Closing RFID reader...")
             self.rfid_logger.ser.close()
             
+        for stage, summary in self.latency_stats().items():
+            logger.info("Latency %s: %s", stage, summary)
+        logger.info("Card cache: %s", self.access_cache.stats())
+        logger.info("Card directory: %s", self.card_directory.stats())
+
         # Close any remaining windows
-        print("Closing OpenCV windows...")
+        logger.info("Closing OpenCV windows...")
         cv2.destroyAllWindows()
         
-        print("Cleanup completed")
+        logger.info("Cleanup completed")
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     # system = AccessControlSystem()
     # system.run()
 
@@ -0,0 +1,169 @@
+import math
+import time
+import logging
+from contextlib import contextmanager
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram.
+
+    Buckets grow by 2**(1/8) (about 9% per bucket) from 1 microsecond up, so
+    recording is O(1) with a fixed memory footprint and percentiles are
+    accurate to within one bucket.
+    """
+
+    BUCKETS_PER_DOUBLING = 8
+    MIN_NS = 1000
+
+    def __init__(self, max_seconds=600):
+        self._base = 2 ** (1 / self.BUCKETS_PER_DOUBLING)
+        self._counts = [0] * (self._bucket(int(max_seconds * 1e9)) + 1)
+        self._lock = Lock()
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def _bucket(self, value_ns):
+        if value_ns <= self.MIN_NS:
+            return 0
+        return int(math.log(value_ns / self.MIN_NS, self._base)) + 1
+
+    def record_ns(self, value_ns):
+        bucket = min(self._bucket(value_ns), len(self._counts) - 1)
+        with self._lock:
+            self._counts[bucket] += 1
+            self.count += 1
+            self.total_ns += value_ns
+            self.max_ns = max(self.max_ns, value_ns)
+
+    def record(self, seconds):
+        self.record_ns(int(seconds * 1e9))
+
+    def percentile_ns(self, p):
+        """Approximate p-th percentile (0-100) in nanoseconds."""
+        with self._lock:
+            if self.count == 0:
+                return 0
+            target = max(1, math.ceil(p / 100 * self.count))
+            seen = 0
+            for bucket, bucket_count in enumerate(self._counts):
+                seen += bucket_count
+                if seen >= target:
+                    break
+            max_ns = self.max_ns
+        if bucket == 0:
+            return min(self.MIN_NS, max_ns)
+        # Upper edge of the bucket, never above the largest value seen
+        return min(self.MIN_NS * self._base ** bucket, max_ns)
+
+    def summary(self):
+        """Count plus mean, p50, p95, p99 and max in milliseconds."""
+        if self.count == 0:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ns / self.count / 1e6,
+            "p50_ms": self.percentile_ns(50) / 1e6,
+            "p95_ms": self.percentile_ns(95) / 1e6,
+            "p99_ms": self.percentile_ns(99) / 1e6,
+            "max_ms": self.max_ns / 1e6,
+        }
+
+
+class TraceRegistry:
+    """Process-wide histograms keyed by stage name."""
+
+    def __init__(self):
+        self.enabled = True
+        self._histograms = {}
+        self._lock = Lock()
+
+    def histogram(self, stage):
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(stage, LatencyHistogram())
+        return histogram
+
+    def record_ns(self, stage, value_ns):
+        if self.enabled:
+            self.histogram(stage).record_ns(value_ns)
+
+    def summary(self):
+        """Return {stage: histogram summary} for every stage seen so far."""
+        with self._lock:
+            stages = dict(self._histograms)
+        return {stage: histogram.summary() for stage, histogram in stages.items()}
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+
+
+_registry = TraceRegistry()
+
+
+def get_registry():
+    """Return the process-wide TraceRegistry."""
+    return _registry
+
+
+class RequestTrace:
+    """
+    Stage timings for one access request.
+
+    Timestamps come from time.perf_counter_ns(), which is monotonic. Stages are
+    recorded in the order they ran; finish() adds the end-to-end total and
+    feeds every stage into the registry's histograms.
+    """
+
+    def __init__(self, registry=None, start_ns=None):
+        self.registry = registry if registry is not None else _registry
+        self.start_ns = start_ns if start_ns is not None else time.perf_counter_ns()
+        self.stages = []
+        self.finished = False
+        self.total_ms = None
+
+    def add(self, name, start_ns, end_ns):
+        """Record a stage that was timed by the caller."""
+        self.stages.append((name, start_ns, end_ns))
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as stage `name`."""
+        start_ns = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.stages.append((name, start_ns, time.perf_counter_ns()))
+
+    def durations_ms(self):
+        """Return {stage: milliseconds}, summing stages that ran more than once."""
+        durations = {}
+        for name, start_ns, end_ns in self.stages:
+            durations[name] = durations.get(name, 0) + (end_ns - start_ns) / 1e6
+        return durations
+
+    def finish(self):
+        """
+        Record the trace into the registry (once) and return the stage
+        durations in milliseconds, including the end-to-end "total".
+        """
+        if self.finished:
+            return dict(self.durations_ms(), total=self.total_ms)
+        self.finished = True
+        end_ns = time.perf_counter_ns()
+        for name, start_ns, stage_end_ns in self.stages:
+            self.registry.record_ns(name, stage_end_ns - start_ns)
+        self.registry.record_ns("total", end_ns - self.start_ns)
+
+        durations = self.durations_ms()
+        durations["total"] = (end_ns - self.start_ns) / 1e6
+        self.total_ms = durations["total"]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Request trace: %s", " ".join(f"{name}={ms:.1f}ms" for name, ms in durations.items()))
+        return durations
@@ -0,0 +1,276 @@
+"""
+Client side of the verification service (see reasoning/verification_server.py).
+
+Only needs numpy and the standard library, so door agents and admin tools
+talk to the service without importing torch, FaceNet or Chroma.
+
+Wire format, in both directions: an 8-byte header holding the length of a
+JSON message and the length of a binary payload (network byte order),
+then the JSON message, then the payload. The payload carries the raw
+bytes of the numpy arrays (camera frames) listed in the message's
+"arrays" field, back to back.
+"""
+import os
+import json
+import time
+import socket
+import struct
+import logging
+from contextlib import nullcontext
+from itertools import count
+from threading import Lock
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = os.environ.get("VERIFICATION_SOCKET", "/tmp/face_verification.sock")
+
+HEADER = struct.Struct("!II")
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+
+class VerificationError(RuntimeError):
+    """The service answered a request with an error."""
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def send_message(sock, message, arrays=()):
+    """Send a JSON message followed by the raw bytes of `arrays`."""
+    arrays = [np.ascontiguousarray(array) for array in arrays]
+    message = dict(message, arrays=[{"shape": list(array.shape), "dtype": array.dtype.str}
+                                    for array in arrays])
+    body = json.dumps(message, default=_json_default).encode("utf-8")
+    sock.sendall(HEADER.pack(len(body), sum(array.nbytes for array in arrays)) + body)
+    for array in arrays:
+        sock.sendall(memoryview(array).cast("B"))
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        chunk = sock.recv_into(view[received:])
+        if chunk == 0:
+            raise ConnectionError("connection closed mid-message")
+        received += chunk
+    return buffer
+
+
+def recv_message(sock):
+    """
+    Read one message.
+
+    Returns:
+        tuple: (message dict, list of numpy arrays), or None when the peer
+        closed the connection between messages
+    """
+    try:
+        header = _recv_exact(sock, HEADER.size)
+    except ConnectionError:
+        return None
+    body_size, payload_size = HEADER.unpack(header)
+    if body_size + payload_size > MAX_MESSAGE_BYTES:
+        raise ValueError(f"message of {body_size + payload_size} bytes exceeds {MAX_MESSAGE_BYTES}")
+    message = json.loads(_recv_exact(sock, body_size))
+    payload = _recv_exact(sock, payload_size) if payload_size else bytearray()
+
+    arrays, offset = [], 0
+    for spec in message.pop("arrays", ()):
+        dtype = np.dtype(spec["dtype"])
+        size = int(np.prod(spec["shape"])) if spec["shape"] else 1
+        arrays.append(np.frombuffer(payload, dtype=dtype, count=size, offset=offset).reshape(spec["shape"]))
+        offset += size * dtype.itemsize
+    return message, arrays
+
+
+class VerificationClient:
+    """
+    Connection to a running VerificationServer.
+
+    One request is in flight per client at a time; give each worker thread
+    its own client to verify in parallel (the server batches across them).
+    The socket is opened on first use and reopened after a failure.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, timeout=30.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._sock = None
+        self._lock = Lock()
+        self._ids = count(1)
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def call(self, op, arrays=(), **params):
+        """
+        Send one request and wait for its reply.
+
+        Raises:
+            ConnectionError: The service is not reachable or dropped the connection
+            VerificationError: The service reported an error
+        """
+        with self._lock:
+            try:
+                if self._sock is None:
+                    self._sock = self._connect()
+                send_message(self._sock, dict(params, op=op, id=next(self._ids)), arrays)
+                reply = recv_message(self._sock)
+            except OSError as e:
+                self._close_socket()
+                raise ConnectionError(f"verification service at {self.socket_path}: {e}") from e
+            if reply is None:
+                self._close_socket()
+                raise ConnectionError(f"verification service at {self.socket_path} closed the connection")
+        message, _ = reply
+        if "error" in message:
+            raise VerificationError(message["error"])
+        return message
+
+    def verify(self, card_uid, frames=(), is_recognized=True, raw_data=None, door_id=None):
+        """
+        Decide a card swipe. `frames` are BGR frames, nearest to the swipe first;
+        `door_id` scopes the debouncing of repeated swipes to the door.
+
+        Returns:
+            dict: {"response": the AccessControl response, "stages": server-side ms per stage}
+        """
+        rfid_data = {"uid": card_uid, "is_recognized": is_recognized, "raw_data": raw_data,
+                     "door_id": door_id}
+        return self.call("verify", arrays=[frame for frame in frames if frame is not None],
+                         rfid_data=rfid_data)
+
+    def enroll(self, name, card_uid, images):
+        """Enroll a list of image paths or a folder, as read by the server."""
+        if isinstance(images, str):
+            images = os.path.abspath(images)
+        else:
+            images = [os.path.abspath(path) for path in images]
+        return self.call("enroll", name=name, card_uid=card_uid, images=images)
+
+    def list_users(self):
+        """Return (name, card_uid, image_count) rows."""
+        return [tuple(row) for row in self.call("list_users")["users"]]
+
+    def reconcile(self, full=False):
+        return self.call("reconcile", full=full)["report"]
+
+    def reload(self):
+        return self.call("reload")
+
+    def stats(self):
+        return self.call("stats")
+
+    def _close_socket(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def close(self):
+        with self._lock:
+            self._close_socket()
+
+
+class RemoteAccessControl:
+    """
+    Stand-in for AccessControl that forwards each decision to the
+    verification service, so a door process never loads the model or the
+    gallery. When the service is unreachable the swipe is denied.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def process_access_request(self, rfid_data, face_path=None, face_frame=None, trace=None,
+                               face_frames=None):
+        if not face_frames and face_frame is not None:
+            face_frames = [face_frame]
+        if not face_frames and face_path:
+            import cv2
+
+            frame = cv2.imread(face_path)
+            face_frames = [frame] if frame is not None else []
+
+        start = time.perf_counter()
+        try:
+            with trace.stage("verify_rpc") if trace is not None else nullcontext():
+                reply = self.client.verify(rfid_data["uid"], face_frames or (),
+                                           is_recognized=rfid_data.get("is_recognized", True),
+                                           raw_data=rfid_data.get("raw_data"),
+                                           door_id=rfid_data.get("door_id"))
+        except (ConnectionError, VerificationError) as e:
+            logger.error("Verification service error: %s", e)
+            return {"status": "denied", "message": "Verification service unavailable"}
+        logger.debug("Verified remotely in %.1f ms (server stages: %s)",
+                     (time.perf_counter() - start) * 1000, reply.get("stages"))
+        return reply["response"]
+
+    def reload(self):
+        """Ask the service to reload its stores, e.g. after an out-of-band enrollment."""
+        try:
+            self.client.reload()
+        except (ConnectionError, VerificationError) as e:
+            logger.error("Could not reload verification service: %s", e)
+
+    def close(self):
+        self.client.close()
+
+
+class RemoteDatabaseManager:
+    """
+    The admin actions of EnhancedDatabaseManager (add_user, list_users and
+    reconciliation), run by the verification service that owns the stores.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def add_user(self, name, card_uid, face_image_input):
+        try:
+            reply = self.client.enroll(name, card_uid, face_image_input)
+        except (ConnectionError, VerificationError) as e:
+            print(f"Error adding user/images: {e}")
+            return False
+        print(f"Server enrolled {reply['enrolled']} new face images for {name}")
+        return reply["ok"]
+
+    def reconcile_chromadb_with_sqlite(self, full=False):
+        try:
+            report = self.client.reconcile(full=full)
+        except (ConnectionError, VerificationError) as e:
+            print(f"Error during reconciliation: {e}")
+            return None
+        if report:
+            print(f"Reconciliation completed ({report['mode']}): embedded {report['embedded']}, "
+                  f"removed {report['orphans_deleted']} orphaned entries, {report['failed']} failed.")
+        return report
+
+    def list_users(self):
+        from reasoning.database import print_users
+
+        try:
+            print_users(self.client.list_users())
+        except (ConnectionError, VerificationError) as e:
+            print(f"Error listing users: {e}")
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,339 @@
+"""
+Long-running verification service.
+
+One process owns the FaceNet model, the gallery index, the SQLite database
+and the Chroma directory. Door agents (main.py --verification-socket, or a
+"verification_socket" entry in a multi-door config) and the admin menu
+(database.py --server) connect to it over a local Unix socket instead of
+each loading their own copy. See reasoning/verification_client.py for the
+wire format and the client.
+
+Operations: verify, enroll, list_users, reconcile, reload and stats.
+
+Usage:
+    python reasoning/verification_server.py --db access_control.db --chroma-dir chroma_db_test
+"""
+import sys
+import os
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(project_root)
+import time
+import signal
+import sqlite3
+import logging
+import argparse
+import socketserver
+from collections import Counter
+from itertools import count
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, local
+from reasoning.access_control import AccessControl
+from reasoning.access_cache import AccessCache
+from reasoning.card_identity import CardDirectory
+from reasoning.audit_writer import AuditWriter
+from reasoning.embedding_batcher import EmbeddingBatcher
+from reasoning.face_recognition_model import model_load_stats, warm_up
+from reasoning.quality_gate import QualityGate
+from reasoning.tracing import RequestTrace, get_registry
+from reasoning.verification_client import DEFAULT_SOCKET_PATH, recv_message, send_message
+
+logger = logging.getLogger(__name__)
+
+
+class _ConnectionHandler(socketserver.BaseRequestHandler):
+    """Serves one client connection, one request at a time, until it closes."""
+
+    def handle(self):
+        service = self.server.service
+        while True:
+            try:
+                request = recv_message(self.request)
+            except (OSError, ValueError) as e:
+                logger.warning("Dropping client connection: %s", e)
+                return
+            if request is None:
+                return
+            message, arrays = request
+            try:
+                send_message(self.request, service.dispatch(message, arrays))
+            except OSError as e:
+                logger.warning("Could not reply to client: %s", e)
+                return
+
+    def finish(self):
+        self.server.service.release_thread_state()
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class VerificationServer:
+    """
+    Serves access decisions and enrollment for every local client.
+
+    Each connection is handled on its own thread with a thread-local
+    AccessControl (SQLite connections are per thread) sharing one gallery,
+    Chroma handle, card cache, quality gate and audit writer. Face crops
+    from all connections go through a single EmbeddingBatcher, so
+    concurrent swipes at different doors are embedded in one FaceNet pass.
+
+    Enrollment, listing and reconciliation run one at a time on a
+    dedicated thread that owns the EnhancedDatabaseManager; new users are
+    added to the live gallery as they are enrolled, without a reload.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, db_path="access_control.db",
+                 chroma_dir="chroma_db_test", match_mode="all", use_quality_gate=True,
+                 debounce_window=1.5, max_batch_size=16, batch_wait=0.005, snapshot_dir=None,
+                 ann_index_dir=None, quality_gate_options=None):
+        self.socket_path = socket_path
+        self.db_path = db_path
+        self.chroma_dir = chroma_dir
+        self.match_mode = match_mode
+        self.snapshot_dir = snapshot_dir
+        self.ann_index_dir = ann_index_dir
+        self.quality_gate = QualityGate(**(quality_gate_options or {})) if use_quality_gate else None
+        self.audit_writer = AuditWriter(db_path)
+        self.access_cache = AccessCache(debounce_window=debounce_window)
+        self.card_directory = CardDirectory()
+        self.batcher = EmbeddingBatcher(max_batch_size=max_batch_size, max_wait=batch_wait)
+        self.requests = Counter()
+        self.decisions = Counter()
+        self.started_at = None
+        self._counter_lock = Lock()
+        self._local = local()
+        self._connection_ids = count(1)
+        self._server = None
+
+        # Load the shared stores once; connection threads reuse them
+        conn = sqlite3.connect(db_path)
+        loader = AccessControl(conn, db_path=db_path, chroma_dir=chroma_dir, match_mode=match_mode,
+                               snapshot_dir=snapshot_dir, ann_index_dir=ann_index_dir)
+        self.chroma_db = loader.chroma_db
+        self.gallery = loader.gallery
+        self.ann_index = loader.ann_index
+        self.generation = 0
+        loader.close()
+        self._reload_lock = Lock()
+
+        self._admin = ThreadPoolExecutor(max_workers=1, thread_name_prefix="enrollment")
+        self._manager = None
+        self._enrolled = 0
+
+        self.operations = {
+            "verify": self.verify,
+            "enroll": self.enroll,
+            "list_users": self.list_users,
+            "reconcile": self.reconcile,
+            "reload": self.reload,
+            "stats": self.stats,
+        }
+
+    # Verification
+
+    def _access_control(self):
+        """The calling thread's AccessControl, pointed at the current shared stores."""
+        state = self._local
+        if getattr(state, "access_control", None) is None:
+            state.access_control = AccessControl(
+                sqlite3.connect(self.db_path), db_path=self.db_path, chroma_dir=self.chroma_dir,
+                initialize_schema=False, gallery=self.gallery, chroma_db=self.chroma_db,
+                audit_writer=self.audit_writer, access_cache=self.access_cache,
+                match_mode=self.match_mode, quality_gate=self.quality_gate, embedder=self.batcher.embed,
+                card_directory=self.card_directory, ann_index=self.ann_index,
+                identify_on_mismatch=bool(self.ann_index_dir),
+            )
+            state.generation = self.generation
+            # Stands in for the door of clients that do not name one
+            state.door_id = f"connection-{next(self._connection_ids)}"
+        if state.generation != self.generation:
+            with self._reload_lock:
+                state.access_control.chroma_db, state.access_control.gallery = self.chroma_db, self.gallery
+                state.access_control.ann_index = self.ann_index
+                state.generation = self.generation
+        return state.access_control
+
+    def release_thread_state(self):
+        access_control = getattr(self._local, "access_control", None)
+        if access_control is not None:
+            access_control.close()
+            self._local.access_control = None
+
+    def verify(self, message, frames):
+        trace = RequestTrace()
+        access_control = self._access_control()
+        rfid_data = dict(message["rfid_data"])
+        if rfid_data.get("door_id") is None:
+            # A decision debounced for one connection is never replayed to another
+            rfid_data["door_id"] = self._local.door_id
+        response = access_control.process_access_request(rfid_data, face_frames=frames or None, trace=trace)
+        stages = trace.finish()
+        with self._counter_lock:
+            self.decisions[response["status"]] += 1
+        return {"response": response, "stages": stages}
+
+    def reload(self, message=None, arrays=None):
+        """Re-open Chroma and rebuild the gallery, e.g. after an out-of-band bulk enrollment."""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            loader = AccessControl(conn, db_path=self.db_path, chroma_dir=self.chroma_dir,
+                                   initialize_schema=False, match_mode=self.match_mode,
+                                   snapshot_dir=self.snapshot_dir, ann_index_dir=self.ann_index_dir)
+            with self._reload_lock:
+                self.chroma_db, self.gallery = loader.chroma_db, loader.gallery
+                self.ann_index = loader.ann_index
+                self.generation += 1
+        finally:
+            conn.close()
+        self.access_cache.clear()
+        self.card_directory.invalidate()
+        logger.info("Reloaded %d face templates", len(self.gallery))
+        return {"templates": len(self.gallery), "generation": self.generation}
+
+    # Administration, serialized on the enrollment thread
+
+    def _run_admin(self, function, *args):
+        return self._admin.submit(function, *args).result()
+
+    def _get_manager(self):
+        if self._manager is None:
+            from reasoning.database import EnhancedDatabaseManager
+
+            self._manager = EnhancedDatabaseManager(sqlite_db_path=self.db_path, chroma_dir=self.chroma_dir,
+                                                    chroma_db=self.chroma_db, snapshot_dir=self.snapshot_dir,
+                                                    ann_index_dir=self.ann_index_dir, ann_index=self.ann_index)
+            self._manager.add_enrollment_listener(self._on_enrollment)
+        return self._manager
+
+    def _on_enrollment(self, user_id, name, card_uid, embedding_ids, embeddings):
+        self.gallery.on_enrollment(user_id, name, card_uid, embedding_ids, embeddings)
+        self.access_cache.on_enrollment(user_id, name, card_uid, embedding_ids, embeddings)
+        self.card_directory.on_enrollment(user_id, name, card_uid, embedding_ids, embeddings)
+        self._enrolled += len(embedding_ids)
+
+    def _enroll(self, name, card_uid, images):
+        self._enrolled = 0
+        ok = self._get_manager().add_user(name, card_uid, images)
+        return {"ok": ok, "enrolled": self._enrolled}
+
+    def enroll(self, message, arrays):
+        return self._run_admin(self._enroll, message["name"], message["card_uid"], message["images"])
+
+    def list_users(self, message, arrays):
+        return {"users": self._run_admin(lambda: self._get_manager().get_users())}
+
+    def reconcile(self, message, arrays):
+        full = bool(message.get("full"))
+        return {"report": self._run_admin(lambda: self._get_manager().reconcile_chromadb_with_sqlite(full=full))}
+
+    def stats(self, message=None, arrays=None):
+        with self._counter_lock:
+            requests, decisions = dict(self.requests), dict(self.decisions)
+        return {
+            "uptime_seconds": time.monotonic() - self.started_at if self.started_at else None,
+            "requests": requests,
+            "decisions": decisions,
+            "match_mode": self.match_mode,
+            "templates": len(self.gallery),
+            "embedding_batches": self.batcher.stats(),
+            "card_cache": self.access_cache.stats(),
+            "card_directory": self.card_directory.stats(),
+            "model": dict(model_load_stats),
+            "latency": get_registry().summary(),
+        }
+
+    def dispatch(self, message, arrays):
+        """Run one request and build its reply; errors are returned, never raised."""
+        op = message.get("op")
+        operation = self.operations.get(op)
+        with self._counter_lock:
+            self.requests[op if operation else "unknown"] += 1
+        if operation is None:
+            return {"id": message.get("id"), "error": f"unknown operation {op!r}"}
+        try:
+            return dict(operation(message, arrays), id=message.get("id"))
+        except Exception as e:
+            logger.error("Error handling %s request: %s", op, e)
+            with self._counter_lock:
+                self.requests["errors"] += 1
+            return {"id": message.get("id"), "error": str(e)}
+
+    # Lifecycle
+
+    def start(self):
+        """Load the model, start the writer and batcher, and bind the socket."""
+        self.started_at = time.monotonic()
+        logger.info("FaceNet warm-up took %.2fs", warm_up())
+        self.audit_writer.start()
+        self.batcher.start()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)  # left behind by a previous run
+        self._server = _UnixServer(self.socket_path, _ConnectionHandler)
+        self._server.service = self
+        os.chmod(self.socket_path, 0o660)
+        logger.info("Verification service listening on %s", self.socket_path)
+
+    def serve_forever(self):
+        if self._server is None:
+            self.start()
+        self._server.serve_forever()
+
+    def shutdown(self):
+        """Stop accepting requests, then flush the batcher, the audit log and the stores."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+        self.batcher.stop()
+        self.audit_writer.close()
+        if self._manager is not None:
+            self._run_admin(self._manager.close)
+        self._admin.shutdown()
+        logger.info("Embedding batches: %s", self.batcher.stats())
+        logger.info("Card cache: %s", self.access_cache.stats())
+        logger.info("Card directory: %s", self.card_directory.stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Face + RFID verification service")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, help="Unix socket to listen on")
+    parser.add_argument("--db", default="access_control.db", help="Access control database")
+    parser.add_argument("--chroma-dir", default="chroma_db_test")
+    parser.add_argument("--match-mode", choices=sorted(AccessControl.MATCH_MODES), default="all")
+    parser.add_argument("--no-quality-gate", action="store_true")
+    parser.add_argument("--require-motion", action="store_true",
+                        help="Refuse faces that do not move across the capture burst (a held-up photo)")
+    parser.add_argument("--ann-index-dir", help="Identify mismatched faces with the index kept here")
+    parser.add_argument("--snapshot-dir", help="Map the gallery from snapshots here and publish new ones on enrollment")
+    parser.add_argument("--max-batch-size", type=int, default=16, help="Faces per FaceNet call")
+    parser.add_argument("--batch-wait-ms", type=float, default=5.0,
+                        help="How long the first face of a batch waits for others")
+    parser.add_argument("--model-cache", help="TorchScript FaceNet cache file (created on first run)")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(message)s")
+
+    if args.model_cache:
+        from reasoning.face_recognition_model import set_model_cache
+        set_model_cache(args.model_cache)
+
+    server = VerificationServer(socket_path=args.socket, db_path=args.db, chroma_dir=args.chroma_dir,
+                                match_mode=args.match_mode, use_quality_gate=not args.no_quality_gate,
+                                max_batch_size=args.max_batch_size, batch_wait=args.batch_wait_ms / 1000,
+                                snapshot_dir=args.snapshot_dir, ann_index_dir=args.ann_index_dir,
+                                quality_gate_options={"require_motion": args.require_motion})
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda signum, frame: server.reload())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down verification service...")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
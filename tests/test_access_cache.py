@@ -0,0 +1,90 @@
+from reasoning.access_cache import AccessCache
+from reasoning.card_identity import lookup_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_cache(**options):
+    clock = FakeClock()
+    return AccessCache(clock=clock, **options), clock
+
+
+def test_user_rows_are_cached_until_the_ttl():
+    cache, clock = make_cache(ttl=30.0)
+    loads = []
+
+    def loader(card):
+        loads.append(card)
+        return (1, "alice", "emb-1")
+
+    assert cache.get_user("F1 11 8A 3F", loader) == (1, "alice", "emb-1")
+    assert cache.get_user("F1 11 8A 3F", loader) == (1, "alice", "emb-1")
+    assert len(loads) == 1
+    clock.now = 30.0
+    cache.get_user("F1 11 8A 3F", loader)
+    assert len(loads) == 2
+    assert cache.stats()["hits"] == 1
+
+
+def test_unregistered_cards_use_the_negative_ttl():
+    cache, clock = make_cache(negative_ttl=5.0)
+    loads = []
+
+    def loader(card):
+        loads.append(card)
+        return None
+
+    assert cache.get_user("AA BB CC DD", loader) is None
+    assert cache.get_user("AA BB CC DD", loader) is None
+    assert len(loads) == 1
+    clock.now = 5.0
+    cache.get_user("AA BB CC DD", loader)
+    assert len(loads) == 2
+
+
+def test_decisions_are_debounced_within_the_window():
+    cache, clock = make_cache(debounce_window=1.5)
+    granted = {"status": "granted", "user_id": 1}
+    cache.remember_decision(42, granted, "front")
+    clock.now = 1.0
+    assert cache.recent_decision(42, "front") == granted
+    clock.now = 1.5
+    assert cache.recent_decision(42, "front") is None
+
+
+def test_a_grant_at_one_door_is_not_replayed_at_another():
+    cache, _ = make_cache()
+    cache.remember_decision(42, {"status": "granted", "user_id": 1}, "front")
+    assert cache.recent_decision(42, "back") is None
+
+
+def test_debouncing_can_be_disabled():
+    cache, _ = make_cache(debounce_window=0)
+    cache.remember_decision(42, {"status": "granted"}, "front")
+    assert cache.recent_decision(42, "front") is None
+
+
+def test_invalidate_drops_the_row_and_the_decisions_at_every_door():
+    cache, _ = make_cache()
+    uid = "F1 11 8A 3F"
+    key = lookup_key(uid)
+    cache.get_user(key, lambda card: (1, "alice", "emb-1"))
+    cache.remember_decision(key, {"status": "granted"}, "front")
+    cache.remember_decision(key, {"status": "granted"}, "back")
+    cache.invalidate("f1118a3f")
+    assert cache.recent_decision(key, "front") is None
+    assert cache.recent_decision(key, "back") is None
+    assert cache.stats()["cached_cards"] == 0
+
+
+def test_entries_are_lru_bounded():
+    cache, _ = make_cache(max_entries=2)
+    for card in (1, 2, 3):
+        cache.get_user(card, lambda c: (c, "user", None))
+    assert cache.stats()["cached_cards"] == 2
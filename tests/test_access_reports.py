@@ -0,0 +1,79 @@
+import sqlite3
+from datetime import datetime, timezone
+
+import pytest
+
+from reasoning.access_reports import AccessReports
+
+
+@pytest.fixture
+def reports(tmp_path):
+    reports = AccessReports(str(tmp_path / "access_control.db"),
+                            archive_dir=str(tmp_path / "archive"), batch_size=2)
+    yield reports
+    reports.close()
+
+
+def log(reports, *rows):
+    reports.conn.executemany("INSERT INTO access_logs (user_id, action, timestamp) VALUES (?, ?, ?)",
+                             rows)
+    reports.conn.commit()
+
+
+def test_rollups_fold_in_only_new_rows(reports):
+    log(reports,
+        (1, "access_granted", "2024-12-01 08:05:00"),
+        (1, "access_granted", "2024-12-01 08:55:00"),
+        (None, "access_denied: unknown_card", "2024-12-01 09:10:00"))
+    assert reports.refresh_rollups() == 3
+    assert reports.refresh_rollups() == 0
+
+    log(reports, (2, "access_denied: face_mismatch", "2024-12-01 09:20:00"))
+    assert reports.refresh_rollups() == 1
+    assert reports.hourly_counts() == [("2024-12-01 08:00:00", 2, 0), ("2024-12-01 09:00:00", 0, 2)]
+    assert reports.hourly_counts(user_id=1) == [("2024-12-01 08:00:00", 2, 0)]
+
+
+def test_denials_by_reason(reports):
+    log(reports,
+        (None, "access_denied: unknown_card", "2024-12-01 08:00:00"),
+        (None, "access_denied: unknown_card", "2024-12-02 08:00:00"),
+        (2, "access_denied: face_mismatch", "2024-12-02 09:00:00"),
+        (2, "access_granted", "2024-12-02 10:00:00"))
+    assert reports.denials_by_reason() == {"unknown_card": 2, "face_mismatch": 1}
+    assert reports.denials_by_reason(since="2024-12-02 00:00:00") == {"unknown_card": 1,
+                                                                     "face_mismatch": 1}
+    assert reports.denials_by_reason(user_id=2) == {"face_mismatch": 1}
+
+
+def test_user_history_is_newest_first_and_accepts_datetimes(reports):
+    log(reports,
+        (1, "access_granted", "2024-12-01 08:00:00"),
+        (1, "access_denied: face_mismatch", "2024-12-02 08:00:00"),
+        (2, "access_granted", "2024-12-03 08:00:00"))
+    assert reports.user_history(1) == [("2024-12-02 08:00:00", "access_denied: face_mismatch"),
+                                       ("2024-12-01 08:00:00", "access_granted")]
+    since = datetime(2024, 12, 2, tzinfo=timezone.utc)
+    assert reports.user_history(1, since=since) == [("2024-12-02 08:00:00",
+                                                     "access_denied: face_mismatch")]
+
+
+def test_archive_moves_old_rows_by_month_and_keeps_their_counts(reports):
+    log(reports,
+        (1, "access_granted", "2024-10-30 08:00:00"),
+        (1, "access_granted", "2024-11-01 08:00:00"),
+        (1, "access_granted", "2024-11-02 08:00:00"),
+        (1, "access_granted", "2024-11-03 08:00:00"),
+        (1, "access_granted", "2024-12-20 08:00:00"))
+    now = datetime(2024, 12, 31, tzinfo=timezone.utc)
+    assert reports.archive(retention_days=30, now=now) == {"2024-10": 1, "2024-11": 3}
+
+    remaining = reports.conn.execute("SELECT timestamp FROM access_logs").fetchall()
+    assert remaining == [("2024-12-20 08:00:00",)]
+    archived = sqlite3.connect(reports.archive_path("2024-11"))
+    try:
+        assert archived.execute("SELECT COUNT(*) FROM access_logs").fetchone()[0] == 3
+    finally:
+        archived.close()
+    assert sum(granted for _, granted, _ in reports.hourly_counts()) == 5
+    assert reports.archive(retention_days=30, now=now) == {}
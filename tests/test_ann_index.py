@@ -0,0 +1,81 @@
+import json
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from reasoning.ann_index import META_FILE, create_ann_index, load_ann_index
+
+
+def vectors(count, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, 8)).astype(np.float32)
+
+
+@pytest.fixture
+def index():
+    index = create_ann_index("ivf", dim=8, min_train_size=50)
+    index.add([row % 20 for row in range(200)], [f"e{row}" for row in range(200)], vectors(200))
+    index.build()
+    return index
+
+
+def read_meta(directory):
+    with open(os.path.join(directory, META_FILE)) as meta_file:
+        return json.load(meta_file)
+
+
+def test_saved_index_identifies_like_the_original(index, tmp_path):
+    index.save(str(tmp_path))
+    loaded = load_ann_index(str(tmp_path))
+    probe = vectors(200)[5]
+    assert len(loaded) == len(index)
+    assert loaded.identify(probe)[0][:2] == (5, "e5")
+
+
+def test_each_save_writes_a_new_generation_that_meta_names(index, tmp_path):
+    directory = str(tmp_path)
+    index.save(directory)
+    first = read_meta(directory)
+
+    index.add([99], ["new"], vectors(1, seed=1))
+    index.remove(["e1"])
+    index.save(directory)
+    second = read_meta(directory)
+
+    assert second["generation"] == first["generation"] + 1
+    # Changed arrays get new files; the previous generation's stay readable
+    assert second["files"]["user_ids"] != first["files"]["user_ids"]
+    assert second["files"]["deleted"] != first["files"]["deleted"]
+    for file_name in list(first["files"].values()) + list(second["files"].values()):
+        assert os.path.exists(os.path.join(directory, file_name))
+    assert len(load_ann_index(directory)) == len(index)
+
+
+def test_files_older_than_the_previous_generation_are_pruned(index, tmp_path):
+    directory = str(tmp_path)
+    index.save(directory)
+    first = read_meta(directory)
+    for seed in (1, 2):
+        index.add([99], [f"new{seed}"], vectors(1, seed=seed))
+        index.save(directory)
+    assert not os.path.exists(os.path.join(directory, first["files"]["deleted"]))
+    # Arrays that never changed are still shared with the first generation
+    assert os.path.exists(os.path.join(directory, first["files"]["base"]))
+
+
+def test_index_saved_without_generations_still_loads_and_saves(index, tmp_path):
+    directory = str(tmp_path)
+    index.save(directory)
+    meta = read_meta(directory)
+    for name, file_name in meta.pop("files").items():
+        os.replace(os.path.join(directory, file_name), os.path.join(directory, name + ".npy"))
+    del meta["generation"]
+    with open(os.path.join(directory, META_FILE), "w") as meta_file:
+        json.dump(meta, meta_file)
+
+    legacy = load_ann_index(directory)
+    assert len(legacy) == len(index)
+    legacy.remove(["e2"])
+    legacy.save(directory)
+    assert len(load_ann_index(directory)) == len(index) - 1
@@ -0,0 +1,83 @@
+import sqlite3
+
+import pytest
+
+from reasoning.audit_writer import AuditWriter, access_event, line_event
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "access_control.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE access_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            action TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def access_rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT user_id, action FROM access_logs ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def test_access_event_is_stamped_like_current_timestamp():
+    kind, (user_id, action, timestamp) = access_event(7, "granted")
+    assert (kind, user_id, action) == ("access", 7, "granted")
+    conn = sqlite3.connect(":memory:")
+    assert conn.execute("SELECT datetime(?)", (timestamp,)).fetchone()[0] == timestamp
+
+
+def test_write_batch_commits_rows_and_groups_lines_by_file(db_path, tmp_path):
+    writer = AuditWriter(db_path)
+    first, second = str(tmp_path / "first.log"), str(tmp_path / "second.log")
+    conn = writer.open_connection()
+    try:
+        writer.write_batch(conn, [access_event(1, "granted"), line_event(first, "a"),
+                                  line_event(second, "b"), access_event(None, "denied"),
+                                  line_event(first, "c")])
+    finally:
+        conn.close()
+
+    assert access_rows(db_path) == [(1, "granted"), (None, "denied")]
+    assert writer.written == 2
+    assert open(first).read() == "a\nc\n"
+    assert open(second).read() == "b\n"
+
+
+def test_failed_commit_is_logged_and_rolled_back(tmp_path):
+    writer = AuditWriter(str(tmp_path / "empty.db"))
+    conn = writer.open_connection()
+    try:
+        writer.write_batch(conn, [access_event(1, "granted")])
+    finally:
+        conn.close()
+    assert writer.written == 0
+
+
+def test_close_drains_everything_queued(db_path, tmp_path):
+    unregistered = str(tmp_path / "unregistered_cards.log")
+    writer = AuditWriter(db_path, batch_size=4, flush_interval=0.05, unregistered_log=unregistered)
+    writer.start()
+    for user_id in range(10):
+        writer.log_access(user_id, "granted")
+    writer.log_unregistered_card("04A1B2C3")
+    writer.close()
+
+    assert access_rows(db_path) == [(user_id, "granted") for user_id in range(10)]
+    assert open(unregistered).read() == "04A1B2C3\n"
+
+
+def test_close_without_start_is_a_no_op(db_path):
+    writer = AuditWriter(db_path)
+    writer.close()
+    assert access_rows(db_path) == []
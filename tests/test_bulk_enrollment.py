@@ -0,0 +1,90 @@
+import json
+import sqlite3
+
+import pytest
+
+from reasoning.bulk_enrollment import BulkEnrollmentJob, load_manifest
+
+
+class FakeManager:
+    def __init__(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.cursor = self.conn.cursor()
+        self.conn.executescript("""
+            CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, card_uid TEXT UNIQUE,
+                                face_embedding_id TEXT);
+            CREATE TABLE face_embeddings (user_id INTEGER, face_embedding_id TEXT, image_path TEXT,
+                                          content_hash TEXT, file_mtime_ns INTEGER, file_size INTEGER);
+        """)
+
+
+class InlinePool:
+    """Decodes in the calling thread; every image decodes to its path."""
+
+    def map(self, function, paths):
+        return iter([(path, None) for path in paths])
+
+
+class RecordingJob(BulkEnrollmentJob):
+    """Writes hashes instead of embedding, so no model is needed."""
+
+    def _write_chunk(self, user_id, name, card_uid, chunk, decoded, stats):
+        self.manager.cursor.executemany(
+            "INSERT INTO face_embeddings (user_id, image_path, content_hash) VALUES (?, ?, ?)",
+            [(user_id, image_path, fingerprint[0]) for image_path, fingerprint in chunk])
+        self.manager.conn.commit()
+        self.chunks = getattr(self, "chunks", []) + [[image_path for image_path, _ in chunk]]
+        return len(chunk)
+
+
+@pytest.fixture
+def root(tmp_path):
+    folder = tmp_path / "data" / "anas"
+    folder.mkdir(parents=True)
+    (folder / "1.jpg").write_bytes(b"first")
+    (folder / "2.PNG").write_bytes(b"second")
+    (folder / "3.jpg").write_bytes(b"first")
+    (folder / "notes.txt").write_text("not an image")
+    return tmp_path / "data"
+
+
+def test_load_manifest_formats(tmp_path):
+    as_dict = tmp_path / "manifest.json"
+    as_dict.write_text(json.dumps({"anas": "F1 11 8A 3F"}))
+    as_list = tmp_path / "list.json"
+    as_list.write_text(json.dumps([{"name": "anas", "card_uid": "F1 11 8A 3F"}]))
+    as_csv = tmp_path / "manifest.CSV"
+    as_csv.write_text("name,card_uid\nanas, F1 11 8A 3F\n\nbad\n")
+    for path in (as_dict, as_list, as_csv):
+        assert load_manifest(str(path)) == {"anas": "F1 11 8A 3F"}
+
+
+def test_list_images_keeps_image_files_only(root):
+    job = RecordingJob(FakeManager(), str(root), {})
+    assert [path.rsplit("/", 1)[1] for path in job.list_images("anas")] == ["1.jpg", "2.PNG", "3.jpg"]
+    assert job.list_images("missing") == []
+
+
+def test_duplicates_are_skipped_and_a_rerun_resumes_from_the_checkpoint(root, tmp_path):
+    manager = FakeManager()
+    checkpoint = str(tmp_path / "enroll.ckpt.json")
+    job = RecordingJob(manager, str(root), {"anas": "f1118a3f"}, checkpoint_path=checkpoint,
+                       chunk_size=1)
+    stats = job._enroll_user(InlinePool(), "anas", "f1118a3f", job.list_images("anas"))
+    assert (stats["enrolled"], stats["duplicates"], stats["processed"]) == (2, 1, 2)
+    assert len(job.chunks) == 2
+    assert manager.conn.execute("SELECT name, card_uid FROM users").fetchall() == [("anas", "F1 11 8A 3F")]
+
+    rerun = RecordingJob(manager, str(root), {"anas": "F1 11 8A 3F"}, checkpoint_path=checkpoint)
+    stats = rerun._enroll_user(InlinePool(), "anas", "F1 11 8A 3F", rerun.list_images("anas"))
+    assert (stats["skipped_checkpoint"], stats["enrolled"]) == (3, 0)
+
+
+def test_images_enrolled_without_a_checkpoint_are_caught_by_their_hash(root):
+    manager = FakeManager()
+    job = RecordingJob(manager, str(root), {})
+    job._enroll_user(InlinePool(), "anas", "F1 11 8A 3F", job.list_images("anas"))
+
+    rerun = RecordingJob(manager, str(root), {})
+    stats = rerun._enroll_user(InlinePool(), "anas", "F1 11 8A 3F", rerun.list_images("anas"))
+    assert (stats["duplicates"], stats["enrolled"]) == (3, 0)
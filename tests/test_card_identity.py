@@ -0,0 +1,187 @@
+import sqlite3
+
+import pytest
+
+from reasoning.card_identity import (
+    CardDirectory, card_key, canonicalize_card_uids, ensure_card_identity_schema, format_uid,
+    lookup_key, normalize_uid, parse_card_line, users_version,
+)
+
+
+@pytest.mark.parametrize("spelling", ["F1 11 8A 3F", "f1118a3f", "F1:11:8A:3F", "f1-11-8a-3f", " F1 11 8a 3F "])
+def test_every_spelling_of_a_uid_has_the_same_key(spelling):
+    assert card_key(spelling) == card_key("F1 11 8A 3F")
+    assert normalize_uid(spelling) == "F1 11 8A 3F"
+
+
+def test_uids_that_differ_only_in_leading_zero_bytes_do_not_collide():
+    assert card_key("00 11 22 33") != card_key("11 22 33")
+    assert format_uid(card_key("00 11 22 33")) == "00 11 22 33"
+
+
+def test_bytes_printed_without_leading_zeros_are_padded():
+    assert normalize_uid("4 A 0 FF") == "04 0A 00 FF"
+
+
+def test_format_uid_round_trips_seven_byte_uids():
+    assert format_uid(card_key("04a2249a2b5e80")) == "04 A2 24 9A 2B 5E 80"
+
+
+def test_int_keys_pass_through():
+    key = card_key("F1 11 8A 3F")
+    assert card_key(key) == key
+
+
+@pytest.mark.parametrize("uid", ["", "   ", "SYN 1", "xyz"])
+def test_non_hex_uids_are_rejected(uid):
+    with pytest.raises(ValueError):
+        card_key(uid)
+
+
+def test_non_hex_uids_keep_their_spelling_for_lookups():
+    assert normalize_uid(" SYN 1 ") == "SYN 1"
+    assert lookup_key(" SYN 1 ") == "SYN 1"
+    assert lookup_key("f1118a3f") == card_key("F1 11 8A 3F")
+
+
+def test_parse_card_line():
+    parsed = parse_card_line(b"Card UID:  f1 11 8a 3f | Card recognized")
+    assert parsed["uid"] == "F1 11 8A 3F"
+    assert parsed["card_key"] == card_key("F1 11 8A 3F")
+    assert parsed["is_recognized"] is True
+    assert parsed["raw_data"] == "Card UID:  f1 11 8a 3f | Card recognized"
+
+
+def test_parse_card_line_accepts_str_and_unrecognized_cards():
+    parsed = parse_card_line("Card UID: 0A 0B 0C 0D | Card not recognized\r")
+    assert parsed["uid"] == "0A 0B 0C 0D"
+    assert parsed["is_recognized"] is False
+
+
+@pytest.mark.parametrize("line", [b"", b"Scan PICC to see UID...", b"Card UID: | Card recognized",
+                                  b"Card UID: zz zz | Card recognized"])
+def test_lines_without_a_card_uid_are_ignored(line):
+    assert parse_card_line(line) is None
+
+
+def test_uid_marker_in_the_middle_of_a_merged_line():
+    parsed = parse_card_line(b"Access granted!Card UID:  C3 4D 2A 11 | Card recognized")
+    assert parsed["uid"] == "C3 4D 2A 11"
+
+
+def users_table(*card_uids):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("""
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            card_uid TEXT UNIQUE NOT NULL,
+            face_embedding_id TEXT
+        )
+    """)
+    conn.executemany("INSERT INTO users (name, card_uid) VALUES (?, ?)",
+                     [(f"user-{i}", uid) for i, uid in enumerate(card_uids, 1)])
+    conn.commit()
+    return conn
+
+
+def stored_uids(conn):
+    return [row[0] for row in conn.execute("SELECT card_uid FROM users ORDER BY id")]
+
+
+def test_schema_canonicalizes_stored_uids_once():
+    conn = users_table("f1118a3f", "0a:0b:0c:0d", "SYN 1")
+    ensure_card_identity_schema(conn.cursor())
+    assert stored_uids(conn) == ["F1 11 8A 3F", "0A 0B 0C 0D", "SYN 1"]
+
+    conn.execute("UPDATE users SET card_uid = 'aabbccdd' WHERE id = 3")
+    ensure_card_identity_schema(conn.cursor())
+    assert stored_uids(conn)[2] == "aabbccdd"
+
+
+def test_canonicalizing_leaves_a_uid_whose_canonical_form_is_taken():
+    conn = users_table("f1118a3f", "F1 11 8A 3F")
+    assert canonicalize_card_uids(conn.cursor()) == 0
+    assert stored_uids(conn) == ["f1118a3f", "F1 11 8A 3F"]
+
+
+def test_users_version_counts_every_change():
+    conn = users_table("F1 11 8A 3F")
+    assert users_version(conn) is None
+    ensure_card_identity_schema(conn.cursor())
+    before = users_version(conn)
+    conn.execute("INSERT INTO users (name, card_uid) VALUES ('new', '01 02 03 04')")
+    conn.execute("UPDATE users SET name = 'renamed' WHERE id = 1")
+    conn.execute("DELETE FROM users WHERE id = 1")
+    assert users_version(conn) == before + 3
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_directory_finds_cards_however_they_were_stored():
+    conn = users_table("f1118a3f")
+    directory = CardDirectory()
+    assert directory.lookup(conn, "F1 11 8A 3F") == (1, "user-1", None)
+    assert directory.lookup(conn, card_key("f1:11:8a:3f")) == (1, "user-1", None)
+    assert directory.lookup(conn, "01 02 03 04") is None
+    assert directory.stats()["hits"] == 2
+
+
+def test_directory_reloads_when_users_change():
+    conn = users_table("F1 11 8A 3F")
+    ensure_card_identity_schema(conn.cursor())
+    clock = FakeClock()
+    directory = CardDirectory(check_interval=1.0, clock=clock)
+    assert directory.lookup(conn, "F1 11 8A 3F") is not None
+
+    conn.execute("DELETE FROM users")
+    # The counter is read at most once per check_interval
+    assert directory.lookup(conn, "F1 11 8A 3F") is not None
+    clock.now = 1.0
+    assert directory.lookup(conn, "F1 11 8A 3F") is None
+    assert directory.stats()["loads"] == 2
+
+
+def test_directory_without_the_counter_reloads_after_max_age():
+    conn = users_table("F1 11 8A 3F")
+    clock = FakeClock()
+    directory = CardDirectory(max_age=30.0, clock=clock)
+    directory.lookup(conn, "F1 11 8A 3F")
+    conn.execute("DELETE FROM users")
+    clock.now = 29.0
+    assert directory.lookup(conn, "F1 11 8A 3F") is not None
+    clock.now = 30.0
+    assert directory.lookup(conn, "F1 11 8A 3F") is None
+
+
+def test_directory_falls_back_to_sql_for_unknown_and_non_hex_cards():
+    conn = users_table("F1 11 8A 3F")
+    directory = CardDirectory()
+    asked = []
+
+    def fallback(uid):
+        asked.append(uid)
+        return (7, "late", None) if uid == "01 02 03 04" else None
+
+    assert directory.lookup(conn, "01020304", fallback) == (7, "late", None)
+    assert directory.lookup(conn, "01 02 03 04", fallback) == (7, "late", None)
+    assert directory.lookup(conn, " SYN 1 ", fallback) is None
+    assert asked == ["01 02 03 04", "SYN 1"]
+
+
+def test_enrollment_and_invalidate():
+    conn = users_table("F1 11 8A 3F")
+    directory = CardDirectory()
+    directory.lookup(conn, "F1 11 8A 3F")
+    directory.on_enrollment(9, "new", "0a0b0c0d", ["emb-9"], [])
+    assert directory.lookup(conn, "0A 0B 0C 0D") == (9, "new", "emb-9")
+
+    directory.invalidate()
+    assert directory.lookup(conn, "0A 0B 0C 0D") is None
+    assert directory.stats()["loads"] == 2
@@ -0,0 +1,63 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from reasoning.gallery_index import GalleryIndex
+
+
+def unit(*values):
+    vector = np.zeros(4, dtype=np.float32)
+    vector[:len(values)] = values
+    return vector
+
+
+@pytest.fixture
+def gallery():
+    gallery = GalleryIndex(dim=4, initial_capacity=2)
+    gallery.add(1, ["a1", "a2"], [unit(1), unit(0, 1)], name="alice")
+    gallery.add(2, ["b1"], [unit(0, 0, 1)], name="bob")
+    return gallery
+
+
+def test_verify_matches_only_the_claimed_users_templates(gallery):
+    assert gallery.verify(1, unit(1))[0]
+    is_match, score = gallery.verify(2, unit(1))
+    assert not is_match and score == pytest.approx(0.0)
+    assert gallery.verify(3, unit(1)) == (False, None)
+
+
+def test_readding_an_id_replaces_its_vector(gallery):
+    gallery.add(1, ["a1"], [unit(0, 0, 0, 1)])
+    assert len(gallery) == 3
+    assert gallery.template_count(1) == 2
+    assert not gallery.verify(1, unit(1))[0]
+
+
+def test_readding_an_id_under_another_user_moves_it(gallery):
+    gallery.add(2, ["a1"], [unit(1)])
+    assert len(gallery) == 3
+    assert gallery.template_count(1) == 1
+    assert gallery.template_count(2) == 2
+    # The moved template no longer verifies the old owner's card
+    assert not gallery.verify(1, unit(1))[0]
+    assert gallery.verify(2, unit(1))[0]
+    assert gallery.identify(unit(1))[0][:2] == (2, "a1")
+
+
+def test_moving_a_users_last_template_leaves_them_without_any(gallery):
+    gallery.add(1, ["b1"], [unit(0, 0, 1)])
+    assert gallery.template_count(2) == 0
+    assert gallery.verify(2, unit(0, 0, 1)) == (False, None)
+
+
+def test_identify_returns_the_best_matches_first(gallery):
+    results = gallery.identify(unit(1, 0.5), top_k=2)
+    assert [result[1] for result in results] == ["a1", "a2"]
+    assert gallery.identify(unit(1), threshold=2.0) == []
+
+
+def test_add_grows_past_the_initial_capacity():
+    gallery = GalleryIndex(dim=4, initial_capacity=1)
+    gallery.add(1, [f"e{i}" for i in range(5)], [unit(1, i) for i in range(5)])
+    assert len(gallery) == 5
+    assert gallery.template_count(1) == 5
@@ -0,0 +1,115 @@
+import os
+import sqlite3
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from reasoning.gallery_index import GalleryIndex  # noqa: E402
+from reasoning.gallery_snapshot import (  # noqa: E402
+    SnapshotError,
+    current_snapshot_path,
+    database_watermark,
+    load_snapshot,
+    write_snapshot,
+)
+
+
+def unit(*values):
+    vector = np.zeros(4, dtype=np.float32)
+    vector[:len(values)] = values
+    return vector
+
+
+@pytest.fixture
+def gallery():
+    gallery = GalleryIndex(dim=4)
+    gallery.add(2, ["b1"], [unit(0, 0, 1)], name="bob")
+    gallery.add(1, ["a1", "a2"], [unit(1), unit(0, 1)], name="alice")
+    return gallery
+
+
+def test_snapshot_round_trip_groups_rows_by_user(gallery, tmp_path):
+    path = gallery.to_snapshot(str(tmp_path), watermark={"rows": 3})
+    snapshot = load_snapshot(str(tmp_path), verify=True)
+
+    assert snapshot.path == path
+    assert (snapshot.version, len(snapshot), snapshot.dim) == (1, 3, 4)
+    assert snapshot.user_names == {1: "alice", 2: "bob"}
+    assert snapshot.watermark == {"rows": 3}
+    assert snapshot.user_ids.tolist() == [1, 1, 2]
+    assert snapshot.embedding_ids.tolist() == [b"a1", b"a2", b"b1"]
+    assert snapshot.users.tolist() == [[1, 0, 2], [2, 2, 1]]
+    np.testing.assert_array_equal(snapshot.vectors[2], unit(0, 0, 1))
+    assert not snapshot.vectors.flags.writeable
+
+
+def test_index_opened_from_a_snapshot_matches_the_original(gallery, tmp_path):
+    gallery.to_snapshot(str(tmp_path))
+    index = GalleryIndex.from_snapshot(str(tmp_path))
+
+    assert index.verify(1, unit(0, 1))[0]
+    assert not index.verify(2, unit(0, 1))[0]
+    assert index.identify(unit(0, 0, 1)) == [(2, "b1", pytest.approx(1.0))]
+
+    index.add(1, ["a1"], [unit(0, 0, 0, 1)])
+    index.add(3, ["c1"], [unit(1)], name="carol")
+    assert index.verify(1, unit(0, 0, 0, 1))[0]
+    assert index.verify(3, unit(1))[0]
+    assert len(index) == 4
+
+
+def test_an_empty_snapshot_opens_and_grows(tmp_path):
+    GalleryIndex(dim=4).to_snapshot(str(tmp_path))
+    index = GalleryIndex.from_snapshot(str(tmp_path))
+    assert len(index) == 0
+    assert index.identify(unit(1)) == []
+    index.add(1, ["a1"], [unit(1)])
+    assert index.verify(1, unit(1))[0]
+
+
+def test_new_versions_replace_current_and_old_ones_are_pruned(gallery, tmp_path):
+    paths = [gallery.to_snapshot(str(tmp_path), keep=2) for _ in range(3)]
+    assert current_snapshot_path(str(tmp_path)) == paths[-1]
+    assert load_snapshot(str(tmp_path)).version == 3
+    assert not os.path.exists(paths[0])
+    assert os.path.exists(paths[1])
+
+
+def test_corrupt_snapshots_are_rejected(gallery, tmp_path):
+    with pytest.raises(SnapshotError):
+        load_snapshot(str(tmp_path))
+
+    path = gallery.to_snapshot(str(tmp_path))
+    with open(path, "r+b") as snapshot_file:
+        snapshot_file.seek(-8, os.SEEK_END)
+        snapshot_file.write(b"\xff" * 8)
+    load_snapshot(path)
+    with pytest.raises(SnapshotError, match="body checksum"):
+        load_snapshot(path, verify=True)
+
+    with open(path, "r+b") as snapshot_file:
+        snapshot_file.seek(20)
+        snapshot_file.write(b"!")
+    with pytest.raises(SnapshotError, match="header checksum"):
+        load_snapshot(path)
+
+    with open(path, "r+b") as snapshot_file:
+        snapshot_file.truncate(100)
+    with pytest.raises(SnapshotError):
+        load_snapshot(path)
+
+
+def test_database_watermark_follows_face_embeddings():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE face_embeddings (id INTEGER PRIMARY KEY, face_embedding_id TEXT)")
+    assert database_watermark(conn) == {"rows": 0, "max_id": 0, "journal_seq": 0}
+    conn.execute("INSERT INTO face_embeddings (face_embedding_id) VALUES ('a1')")
+    assert database_watermark(conn) == {"rows": 1, "max_id": 1, "journal_seq": 0}
+
+
+def test_write_snapshot_accepts_plain_sequences(tmp_path):
+    write_snapshot(str(tmp_path), [[1, 0], [0, 1]], [5, 4], ["x", "longer-id"], {4: "d", 5: "e"})
+    snapshot = load_snapshot(str(tmp_path), verify=True)
+    assert snapshot.embedding_ids.tolist() == [b"longer-id", b"x"]
+    assert snapshot.users.tolist() == [[4, 0, 1], [5, 1, 1]]
@@ -0,0 +1,63 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from reasoning.migrate_chroma_metadata import directory_size, legacy_ids, rewrite  # noqa: E402
+
+
+class FakeCollection:
+    """The part of a Chroma collection the migration reads and rewrites."""
+
+    def __init__(self, records):
+        self.records = dict(records)
+
+    def get(self, ids=None, include=(), limit=None, offset=0):
+        ids = sorted(self.records) if ids is None else [i for i in ids if i in self.records]
+        ids = ids[offset:offset + limit] if limit is not None else ids
+        page = {"ids": ids}
+        for field in include:
+            page[field] = [self.records[record_id][field] for record_id in ids]
+        return page
+
+    def delete(self, ids):
+        for record_id in ids:
+            del self.records[record_id]
+
+    def add(self, ids, embeddings, metadatas, documents):
+        for record in zip(ids, embeddings, metadatas, documents):
+            self.records[record[0]] = dict(zip(("embeddings", "metadatas", "documents"), record[1:]))
+
+
+def record(embedding, metadata, document=None):
+    return {"embeddings": embedding, "metadatas": metadata, "documents": document}
+
+
+@pytest.fixture
+def collection():
+    return FakeCollection({
+        "legacy": record([0.5, 0.25], {"name": "anas", "embedding": "[0.5, 0.25]",
+                                       "image_path": "data/anas/1.jpg"}),
+        "string-only": record(None, {"name": "bob", "embedding": "[1.0, 0.0]"}, "data/bob/1.jpg"),
+        "broken": record([], {"name": "eve", "image_path": "data/eve/1.jpg"}),
+        "compact": record([0.0, 1.0], {"name": "ada", "card_uid": "F1 11 8A 3F"}, "data/ada/1.jpg"),
+    })
+
+
+def test_legacy_ids_pages_through_the_collection(collection):
+    assert legacy_ids(collection, page_size=1) == ["broken", "legacy", "string-only"]
+
+
+def test_rewrite_drops_the_legacy_fields(collection):
+    assert rewrite(collection, legacy_ids(collection), batch_size=2) == 2
+
+    assert collection.records["legacy"] == record([0.5, 0.25], {"name": "anas"}, "data/anas/1.jpg")
+    assert collection.records["string-only"] == record([1.0, 0.0], {"name": "bob"}, "data/bob/1.jpg")
+    assert collection.records["broken"]["metadatas"]["image_path"] == "data/eve/1.jpg"
+    assert legacy_ids(collection) == ["broken"]
+
+
+def test_directory_size(tmp_path):
+    (tmp_path / "nested").mkdir()
+    (tmp_path / "a.bin").write_bytes(b"x" * 10)
+    (tmp_path / "nested" / "b.bin").write_bytes(b"x" * 5)
+    assert directory_size(str(tmp_path)) == 15
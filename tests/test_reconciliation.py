@@ -0,0 +1,144 @@
+import hashlib
+import os
+import sqlite3
+
+import pytest
+
+from reasoning.reconciliation import Reconciler, ensure_reconciliation_schema, file_fingerprint
+
+
+class FakeCollection:
+    """The part of a Chroma collection the reconciler reads and deletes through."""
+
+    def __init__(self):
+        self.vectors = {}
+
+    def get(self, ids=None, include=(), limit=None, offset=0):
+        if ids is not None:
+            return {"ids": [embedding_id for embedding_id in ids if embedding_id in self.vectors]}
+        ordered = sorted(self.vectors)
+        return {"ids": ordered[offset:offset + limit]}
+
+    def delete(self, ids):
+        for embedding_id in ids:
+            self.vectors.pop(embedding_id, None)
+
+
+class FakeManager:
+    """Stands in for EnhancedDatabaseManager: embeds each image as its file size."""
+
+    ann_index = None
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.chroma_db = type("Chroma", (), {})()
+        self.chroma_db._collection = FakeCollection()
+        self.embedded_paths = []
+        self.enrolled = []
+
+    def extract_embeddings(self, paths):
+        self.embedded_paths.extend(paths)
+        return [[float(os.path.getsize(path))] if os.path.exists(path) else None for path in paths]
+
+    def store_face_vectors(self, ids, embeddings, paths, metadatas):
+        self.chroma_db._collection.vectors.update(zip(ids, embeddings))
+
+    def _notify_enrollment(self, user_id, name, card_uid, embedding_ids, embeddings):
+        self.enrolled.append((user_id, list(embedding_ids)))
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, card_uid TEXT);
+        CREATE TABLE face_embeddings (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            image_path TEXT,
+            face_embedding_id TEXT UNIQUE
+        );
+        INSERT INTO users VALUES (1, 'Ada', '04A1B2C3');
+    """)
+    yield conn
+    conn.close()
+
+
+def add_image(conn, tmp_path, embedding_id, content=b"face"):
+    path = tmp_path / f"{embedding_id}.jpg"
+    path.write_bytes(content)
+    conn.execute("INSERT INTO face_embeddings (user_id, image_path, face_embedding_id) VALUES (1, ?, ?)",
+                 (str(path), embedding_id))
+    conn.commit()
+    return path
+
+
+def journal(conn):
+    return conn.execute("SELECT face_embedding_id, op FROM face_embedding_changes ORDER BY seq").fetchall()
+
+
+def test_file_fingerprint(tmp_path):
+    path = tmp_path / "face.jpg"
+    path.write_bytes(b"abc" * 1000)
+    digest, mtime_ns, size = file_fingerprint(str(path), chunk_size=7)
+    assert digest == hashlib.sha256(b"abc" * 1000).hexdigest()
+    assert (mtime_ns, size) == (os.stat(path).st_mtime_ns, 3000)
+    assert file_fingerprint(str(tmp_path / "missing.jpg")) is None
+
+
+def test_schema_is_added_once_and_journals_every_change(conn):
+    cursor = conn.cursor()
+    ensure_reconciliation_schema(cursor)
+    ensure_reconciliation_schema(cursor)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(face_embeddings)")}
+    assert {"content_hash", "file_mtime_ns", "file_size"} <= columns
+
+    conn.execute("INSERT INTO face_embeddings (user_id, image_path, face_embedding_id) VALUES (1, 'a.jpg', 'a')")
+    conn.execute("UPDATE face_embeddings SET content_hash = 'x' WHERE face_embedding_id = 'a'")
+    conn.execute("UPDATE face_embeddings SET face_embedding_id = 'b' WHERE face_embedding_id = 'a'")
+    conn.execute("DELETE FROM face_embeddings WHERE face_embedding_id = 'b'")
+    assert journal(conn) == [("a", "upsert"), ("a", "delete"), ("b", "upsert"), ("b", "delete")]
+
+
+def test_first_run_is_full_and_later_runs_only_read_the_journal(conn, tmp_path):
+    manager = FakeManager(conn)
+    reconciler = Reconciler(manager, progress=None)
+    add_image(conn, tmp_path, "a")
+    manager.chroma_db._collection.vectors["orphan"] = [0.0]
+
+    report = reconciler.run()
+    assert report["mode"] == "full"
+    assert (report["embedded"], report["orphans_deleted"]) == (1, 1)
+    assert set(manager.chroma_db._collection.vectors) == {"a"}
+    assert manager.enrolled == [(1, ["a"])]
+    assert journal(conn) == []
+
+    report = reconciler.run()
+    assert report["mode"] == "incremental"
+    assert (report["missing_in_chroma"], report["orphans_in_chroma"]) == (0, 0)
+
+    add_image(conn, tmp_path, "b")
+    conn.execute("DELETE FROM face_embeddings WHERE face_embedding_id = 'a'")
+    conn.commit()
+    report = reconciler.run()
+    assert (report["embedded"], report["orphans_deleted"]) == (1, 1)
+    assert set(manager.chroma_db._collection.vectors) == {"b"}
+
+
+def test_full_run_reembeds_only_images_whose_content_changed(conn, tmp_path):
+    manager = FakeManager(conn)
+    reconciler = Reconciler(manager, progress=None)
+    path = add_image(conn, tmp_path, "a")
+    add_image(conn, tmp_path, "b")
+    reconciler.run()
+    manager.embedded_paths.clear()
+
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert reconciler.run(full=True)["changed_images"] == 0
+
+    path.write_bytes(b"another face")
+    report = reconciler.run(full=True)
+    assert (report["changed_images"], report["embedded"]) == (1, 1)
+    assert manager.embedded_paths == [str(path)]
+    assert manager.chroma_db._collection.vectors["a"] == [float(len(b"another face"))]
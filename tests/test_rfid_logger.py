@@ -0,0 +1,112 @@
+import pytest
+
+pytest.importorskip("serial")
+
+from queue import Queue
+from threading import Thread
+
+from benchmarks.simulated_hardware import MemorySerial
+from reasoning.RFID_script import RFIDLogger
+
+LINE = b"Card UID:  F1 11 8A 3F | Card recognized\r\n"
+
+
+class FakePortLogger(RFIDLogger):
+    """RFIDLogger on an in-memory port; connect() never touches hardware."""
+
+    def __init__(self, tmp_path):
+        super().__init__(port="fake", log_file=str(tmp_path / "rfid_log.txt"), read_timeout=0.05)
+        self.port_link = MemorySerial(timeout=self.read_timeout)
+
+    def connect(self):
+        self.ser = self.port_link
+        return True
+
+
+@pytest.fixture
+def rfid_logger(tmp_path):
+    return FakePortLogger(tmp_path)
+
+
+def subscribe(rfid_logger):
+    swipes = Queue()
+    rfid_logger.subscribe(lambda parsed, event_time: swipes.put(parsed))
+    return swipes
+
+
+def run_listener(rfid_logger):
+    """Run listen() on a thread the logger does not own, as AccessControlSystem does."""
+    assert rfid_logger.connect()
+    thread = Thread(target=rfid_logger.listen, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_listen_reads_again_after_stop(rfid_logger):
+    swipes = subscribe(rfid_logger)
+    thread = run_listener(rfid_logger)
+    rfid_logger.stop()
+    thread.join(timeout=2)
+    assert not thread.is_alive()
+
+    thread = run_listener(rfid_logger)
+    try:
+        rfid_logger.port_link.feed(LINE)
+        assert swipes.get(timeout=2)["uid"] == "F1 11 8A 3F"
+    finally:
+        rfid_logger.stop()
+        thread.join(timeout=2)
+
+
+def test_start_reads_again_after_stop(rfid_logger):
+    swipes = subscribe(rfid_logger)
+    assert rfid_logger.start()
+    rfid_logger.stop()
+    assert rfid_logger.start()
+    try:
+        rfid_logger.port_link.feed(LINE)
+        assert swipes.get(timeout=2)["uid"] == "F1 11 8A 3F"
+    finally:
+        rfid_logger.stop()
+
+
+def test_stop_before_listen_is_kept(rfid_logger):
+    rfid_logger.stop()
+    thread = run_listener(rfid_logger)
+    thread.join(timeout=2)
+    assert not thread.is_alive()
+
+
+def fed_swipes(rfid_logger, *chunks):
+    swipes = []
+    rfid_logger.subscribe(lambda parsed, event_time: swipes.append(parsed))
+    for chunk in chunks:
+        rfid_logger.feed(chunk)
+    return swipes
+
+
+def test_feed_publishes_a_line_split_across_chunks(rfid_logger):
+    swipes = fed_swipes(rfid_logger, LINE[:7], LINE[7:20])
+    assert swipes == []
+    rfid_logger.feed(LINE[20:])
+    assert [swipe["uid"] for swipe in swipes] == ["F1 11 8A 3F"]
+    assert swipes[0]["raw_data"] == "Card UID:  F1 11 8A 3F | Card recognized"
+
+
+def test_feed_publishes_every_line_in_a_chunk(rfid_logger):
+    other = b"Card UID:  04 A2 19 C3 | Card not recognized\n"
+    swipes = fed_swipes(rfid_logger, LINE + other + LINE[:10])
+    assert [(swipe["uid"], swipe["is_recognized"]) for swipe in swipes] == [
+        ("F1 11 8A 3F", True), ("04 A2 19 C3", False)]
+    assert bytes(rfid_logger._buffer) == LINE[:10]
+
+
+def test_feed_ignores_lines_without_a_card(rfid_logger):
+    swipes = fed_swipes(rfid_logger, b"\r\n", b"Scan PICC to see UID...\r\n", b"Card UID: zz\r\n", LINE)
+    assert [swipe["uid"] for swipe in swipes] == ["F1 11 8A 3F"]
+
+
+def test_feed_attaches_the_read_and_parse_trace(rfid_logger):
+    swipes = fed_swipes(rfid_logger, LINE[:10], LINE[10:])
+    stages = [name for name, _, _ in swipes[0]["trace"].stages]
+    assert stages == ["serial_read", "parse"]
@@ -0,0 +1,22 @@
+import pytest
+
+pytest.importorskip("serial")
+
+from queue import Queue
+
+from benchmarks.simulated_hardware import MemoryRFIDLogger
+
+
+def test_injected_swipe_reaches_subscribers(tmp_path):
+    rfid_logger = MemoryRFIDLogger(log_file=str(tmp_path / "rfid_log.txt"), read_timeout=0.05)
+    swipes = Queue()
+    rfid_logger.subscribe(lambda parsed, event_time: swipes.put(parsed))
+    assert rfid_logger.start()
+    try:
+        rfid_logger.inject_line("Card UID:  F1 11 8A 3F | Card recognized")
+        parsed = swipes.get(timeout=2)
+    finally:
+        rfid_logger.stop()
+
+    assert parsed["uid"] == "F1 11 8A 3F"
+    assert parsed["is_recognized"] is True
@@ -0,0 +1,142 @@
+import sqlite3
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from reasoning.templates import (  # noqa: E402
+    TemplateIndex,
+    TemplateStore,
+    build_user_template,
+    calibrate_threshold,
+    fuse_scores,
+    merge_user_template,
+    select_medoids,
+)
+
+
+def unit(*values, dim=4):
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[:len(values)] = values
+    return vector / np.linalg.norm(vector)
+
+
+def two_clusters():
+    """Three photos near each of two axes, as with and without glasses."""
+    return np.stack([unit(1, 0.1), unit(1, -0.1), unit(1), unit(0.1, 1), unit(-0.1, 1), unit(0, 1)])
+
+
+def test_select_medoids_picks_one_row_per_cluster():
+    vectors = two_clusters()
+    medoids = select_medoids(vectors, k=2)
+    assert sorted(medoids.tolist()) == [2, 5]
+    assert select_medoids(vectors[:2], k=3).tolist() == [0, 1]
+
+
+def test_build_and_merge_keep_an_exact_centroid():
+    vectors = two_clusters()
+    vector_sum, centroid, medoid_rows, count = build_user_template(vectors[:3], medoids=2)
+    vector_sum, centroid, medoid_rows, count = merge_user_template(vector_sum, medoid_rows, count,
+                                                                   vectors[3:], medoids=2)
+    full_sum, full_centroid, _, _ = build_user_template(vectors, medoids=2)
+    assert count == 6
+    np.testing.assert_allclose(vector_sum, full_sum, rtol=1e-6)
+    np.testing.assert_allclose(centroid, full_centroid, rtol=1e-6)
+    assert medoid_rows.shape == (2, 4)
+    assert build_user_template(vectors, medoids=0)[2].shape == (0, 4)
+
+
+def test_fuse_scores():
+    assert fuse_scores(0.4, None) == pytest.approx(0.4)
+    assert fuse_scores(0.4, np.array([0.2, 0.8])) == pytest.approx(0.6)
+    assert fuse_scores(0.4, [0.8], centroid_weight=1.0) == pytest.approx(0.4)
+
+
+def test_calibrate_threshold_meets_the_target_far():
+    impostor = np.linspace(0.0, 0.5, 1000)
+    genuine = np.array([0.3, 0.6, 0.7, 0.8])
+    result = calibrate_threshold(genuine, impostor, target_far=0.01)
+    assert result["far"] <= 0.01
+    assert np.sum(impostor >= result["threshold"]) == 10
+    assert result["frr"] == pytest.approx(0.25)
+    assert calibrate_threshold([], impostor)["frr"] is None
+    with pytest.raises(ValueError):
+        calibrate_threshold(genuine, [])
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE face_embeddings (user_id INTEGER, face_embedding_id TEXT);
+        INSERT INTO users VALUES (1, 'alice');
+    """)
+    yield conn
+    conn.close()
+
+
+def enroll(conn, user_id, count):
+    conn.executemany("INSERT INTO face_embeddings VALUES (?, ?)",
+                     [(user_id, f"{user_id}-{n}") for n in range(count)])
+
+
+def fetch_clusters(ids):
+    return two_clusters()[:len(ids)]
+
+
+def test_store_reads_the_medoid_count_from_its_setting(conn):
+    assert TemplateStore(conn).medoids == 3
+    TemplateStore(conn).set_setting("medoids", 2)
+    assert TemplateStore(conn).medoids == 2
+    assert TemplateStore(conn, medoids=1).medoids == 1
+
+
+def test_sync_rebuilds_missing_and_mismatched_templates(conn):
+    store = TemplateStore(conn, fetch_vectors=fetch_clusters, medoids=2)
+    enroll(conn, 1, 6)
+    assert store.stale_users() == [1]
+    assert store.sync() == 1
+    assert store.stale_users() == []
+    vector_sum, centroid, medoid_rows, count = store.get(1)
+    assert (count, medoid_rows.shape) == (6, (2, 4))
+
+    store.set_setting("medoids", 3)
+    recalibrated = TemplateStore(conn, fetch_vectors=fetch_clusters)
+    assert recalibrated.stale_users() == [1]
+    assert recalibrated.sync() == 1
+    assert recalibrated.get(1)[2].shape == (3, 4)
+
+    enroll(conn, 1, 1)
+    assert recalibrated.stale_users() == [1]
+
+
+def test_users_with_fewer_photos_than_medoids_are_not_stale(conn):
+    store = TemplateStore(conn, fetch_vectors=fetch_clusters, medoids=3)
+    enroll(conn, 1, 2)
+    store.sync()
+    assert store.get(1)[2].shape == (2, 4)
+    assert store.stale_users() == []
+
+
+def test_enrollment_merges_into_the_stored_template(conn):
+    store = TemplateStore(conn, medoids=2)
+    vectors = two_clusters()
+    store.on_enrollment(1, "alice", "04A1B2C3", ["1-0", "1-1", "1-2"], vectors[:3])
+    store.on_enrollment(1, "alice", "04A1B2C3", ["1-3", "1-4", "1-5"], vectors[3:])
+    np.testing.assert_allclose(store.get(1)[1], build_user_template(vectors)[1], rtol=1e-6)
+    assert store.get(1)[3] == 6
+
+
+def test_index_verifies_the_fused_score_and_identifies_by_centroid(conn):
+    store = TemplateStore(conn, medoids=2)
+    store.on_enrollment(1, "alice", "04A1B2C3", [], two_clusters())
+    store.set_setting("fused_threshold", 0.8)
+    chroma = type("Chroma", (), {"get": lambda self, ids, include: {"embeddings": []}})()
+
+    index = TemplateIndex.load(conn, chroma, dim=4)
+    assert (len(index), index.threshold, index.medoids) == (1, 0.8, 3)
+    is_match, score = index.verify(1, unit(0, 1))
+    assert is_match and score > fuse_scores(index._templates[1][0] @ unit(0, 1), None)
+    assert index.verify(2, unit(1)) == (False, None)
+    assert index.identify(unit(1, 1)) == [(1, "centroid", pytest.approx(1.0, abs=1e-3))]
@@ -0,0 +1,76 @@
+import pytest
+
+from reasoning.tracing import LatencyHistogram, RequestTrace, TraceRegistry
+
+
+def test_empty_histogram():
+    histogram = LatencyHistogram()
+    assert histogram.percentile_ns(50) == 0
+    assert histogram.summary() == {"count": 0}
+
+
+def test_percentiles_are_within_one_bucket():
+    histogram = LatencyHistogram()
+    for ms in range(1, 101):
+        histogram.record(ms / 1000)
+    bucket_ratio = 2 ** (1 / LatencyHistogram.BUCKETS_PER_DOUBLING)
+    for p, expected_ms in ((50, 50), (95, 95), (99, 99)):
+        value_ms = histogram.percentile_ns(p) / 1e6
+        assert expected_ms <= value_ms <= expected_ms * bucket_ratio
+
+
+def test_percentiles_never_exceed_the_largest_value():
+    histogram = LatencyHistogram()
+    histogram.record_ns(1_234_567)
+    assert histogram.percentile_ns(100) == 1_234_567
+    summary = histogram.summary()
+    assert summary["count"] == 1
+    assert summary["max_ms"] == pytest.approx(1.234567)
+    assert summary["mean_ms"] == pytest.approx(1.234567)
+
+
+def test_sub_microsecond_values_land_in_the_first_bucket():
+    histogram = LatencyHistogram()
+    histogram.record_ns(10)
+    assert histogram.percentile_ns(50) == 10
+
+
+def test_values_past_max_seconds_are_clamped_into_the_last_bucket():
+    histogram = LatencyHistogram(max_seconds=1)
+    histogram.record(5.0)
+    assert histogram.count == 1
+    assert histogram.max_ns == 5_000_000_000
+
+
+def test_trace_records_each_stage_once_into_the_registry():
+    registry = TraceRegistry()
+    trace = RequestTrace(registry=registry, start_ns=0)
+    trace.add("serial_read", 0, 2_000_000)
+    trace.add("embed", 2_000_000, 5_000_000)
+    trace.add("embed", 5_000_000, 6_000_000)
+
+    durations = trace.finish()
+    assert durations["serial_read"] == pytest.approx(2.0)
+    assert durations["embed"] == pytest.approx(4.0)
+    assert "total" in durations
+    assert trace.finish() == durations
+
+    summary = registry.summary()
+    assert summary["embed"]["count"] == 2
+    assert summary["total"]["count"] == 1
+
+
+def test_stage_context_manager_times_the_block():
+    registry = TraceRegistry()
+    trace = RequestTrace(registry=registry)
+    with pytest.raises(RuntimeError):
+        with trace.stage("failing"):
+            raise RuntimeError("boom")
+    assert [name for name, _, _ in trace.stages] == ["failing"]
+
+
+def test_disabled_registry_records_nothing():
+    registry = TraceRegistry()
+    registry.enabled = False
+    RequestTrace(registry=registry).finish()
+    assert registry.summary() == {}
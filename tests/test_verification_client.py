@@ -0,0 +1,160 @@
+import json
+import os
+import socket
+import tempfile
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from reasoning.verification_client import (  # noqa: E402
+    HEADER,
+    MAX_MESSAGE_BYTES,
+    RemoteAccessControl,
+    VerificationClient,
+    VerificationError,
+    recv_message,
+    send_message,
+)
+
+
+@pytest.fixture
+def pair():
+    left, right = socket.socketpair()
+    yield left, right
+    left.close()
+    right.close()
+
+
+def test_message_round_trip_with_arrays(pair):
+    left, right = pair
+    frame = np.arange(2 * 3 * 3, dtype=np.uint8).reshape(2, 3, 3)
+    embedding = np.linspace(0, 1, 4, dtype=np.float32)
+    send_message(left, {"op": "verify", "score": np.float32(0.5)}, [frame, embedding])
+
+    message, arrays = recv_message(right)
+    assert message == {"op": "verify", "score": 0.5}
+    assert len(arrays) == 2
+    np.testing.assert_array_equal(arrays[0], frame)
+    assert arrays[0].dtype == np.uint8
+    np.testing.assert_array_equal(arrays[1], embedding)
+
+
+def test_header_counts_the_json_and_payload_bytes(pair):
+    left, right = pair
+    array = np.zeros(5, dtype=np.int16)
+    send_message(left, {"op": "stats"}, [array])
+
+    body_size, payload_size = HEADER.unpack(right.recv(HEADER.size))
+    body = json.loads(right.recv(body_size))
+    assert body == {"op": "stats", "arrays": [{"shape": [5], "dtype": "<i2"}]}
+    assert payload_size == array.nbytes
+
+
+def test_non_contiguous_arrays_are_sent_in_order(pair):
+    left, right = pair
+    array = np.arange(12, dtype=np.int32).reshape(3, 4)[:, ::2]
+    send_message(left, {}, [array])
+    _, (received,) = recv_message(right)
+    np.testing.assert_array_equal(received, array)
+
+
+def test_close_between_messages_returns_none(pair):
+    left, right = pair
+    send_message(left, {"op": "reload"})
+    left.close()
+    assert recv_message(right) == ({"op": "reload"}, [])
+    assert recv_message(right) is None
+
+
+def test_close_mid_message_raises(pair):
+    left, right = pair
+    left.sendall(HEADER.pack(100, 0) + b"{")
+    left.close()
+    with pytest.raises(ConnectionError):
+        recv_message(right)
+
+
+def test_oversized_messages_are_refused(pair):
+    left, right = pair
+    left.sendall(HEADER.pack(MAX_MESSAGE_BYTES, 1))
+    with pytest.raises(ValueError):
+        recv_message(right)
+
+
+class FakeServer:
+    """Answers each request on a Unix socket with reply(message, arrays)."""
+
+    def __init__(self, reply):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "verification.sock")
+        self.reply = reply
+        self.requests = []
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        self._sock.listen(1)
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        conn, _ = self._sock.accept()
+        with conn:
+            while True:
+                request = recv_message(conn)
+                if request is None:
+                    return
+                self.requests.append(request)
+                send_message(conn, self.reply(*request))
+
+    def close(self):
+        self._sock.close()
+        os.unlink(self.path)
+        os.rmdir(self.directory)
+
+
+@pytest.fixture
+def server():
+    servers = []
+
+    def start(reply):
+        servers.append(FakeServer(reply))
+        return servers[-1]
+
+    yield start
+    for fake in servers:
+        fake.close()
+
+
+def test_verify_sends_the_swipe_and_frames(server):
+    fake = server(lambda message, arrays: {"id": message["id"],
+                                           "response": {"status": "granted"}, "stages": {}})
+    client = VerificationClient(fake.path, timeout=5)
+    frame = np.zeros((4, 4, 3), dtype=np.uint8)
+    try:
+        reply = client.verify("04A1B2C3", [frame, None], raw_data="raw", door_id="front")
+    finally:
+        client.close()
+
+    assert reply["response"] == {"status": "granted"}
+    (message, arrays), = fake.requests
+    assert message["op"] == "verify"
+    assert message["rfid_data"] == {"uid": "04A1B2C3", "is_recognized": True,
+                                    "raw_data": "raw", "door_id": "front"}
+    assert len(arrays) == 1 and arrays[0].shape == (4, 4, 3)
+
+
+def test_service_errors_raise_verification_error(server):
+    fake = server(lambda message, arrays: {"id": message["id"], "error": "unknown op"})
+    client = VerificationClient(fake.path, timeout=5)
+    try:
+        with pytest.raises(VerificationError, match="unknown op"):
+            client.call("nope")
+    finally:
+        client.close()
+
+
+def test_unreachable_service_denies_the_swipe(tmp_path):
+    client = VerificationClient(str(tmp_path / "missing.sock"), timeout=1)
+    response = RemoteAccessControl(client).process_access_request({"uid": "04A1B2C3"})
+    assert response["status"] == "denied"